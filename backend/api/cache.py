@@ -0,0 +1,141 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.http import Http404
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+from api import projections
+from api.renderers import JSONFragment
+from api.serializers import CustomUserSerializer
+from core.models import ModelVersion
+
+
+class RecipeCache:
+    """Кэш сериализованных рецептов без признаков конкретного зрителя.
+
+    Ключ содержит версии рецепта, тегов и ингредиентов, поэтому любое их
+    изменение делает старую запись недостижимой. is_favorited,
+    is_in_shopping_cart и author.is_subscribed накладываются при ответе.
+    """
+    hits_key = 'recipe-cache:hits'
+    misses_key = 'recipe-cache:misses'
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get_keys(self, recipe_ids):
+        keys = [ModelVersion.TAGS, ModelVersion.INGREDIENTS]
+        keys.extend(ModelVersion.recipe_key(pk) for pk in recipe_ids)
+        versions = ModelVersion.objects.get_versions(keys)
+
+        def version(key):
+            return versions.get(key, (0, None))[0]
+
+        common = f'{version(ModelVersion.TAGS)}:'
+        common += f'{version(ModelVersion.INGREDIENTS)}'
+        return {
+            pk: f'recipe:{pk}:{version(ModelVersion.recipe_key(pk))}:{common}'
+            for pk in recipe_ids
+        }
+
+    def serialize(self, recipe_ids):
+        """Представления рецептов; теги и ингредиенты — готовым JSON."""
+        recipes = projections.recipes(recipe_ids)
+        for data in recipes.values():
+            data['tags'] = JSONFragment.encode(data['tags'])
+            data['ingredients'] = JSONFragment.encode(data['ingredients'])
+        return recipes
+
+    def count(self, key, delta):
+        if delta:
+            self.cache.add(key, 0, timeout=None)
+            self.cache.incr(key, delta)
+
+    def get_many(self, recipes, context):
+        """Возвращает представления recipes в том же порядке.
+
+        recipes должны быть аннотированы favorited и in_shopping_cart.
+        Рецепты, удалённые после выборки recipes, пропускаются.
+        """
+        keys = self.get_keys([recipe.id for recipe in recipes])
+        cached = self.cache.get_many(keys.values())
+        found = {pk: cached[key] for pk, key in keys.items() if key in cached}
+        missing = [pk for pk in keys if pk not in found]
+        if missing:
+            fresh = self.serialize(missing)
+            self.cache.set_many({keys[pk]: fresh[pk] for pk in fresh})
+            found.update(fresh)
+        self.count(self.hits_key, len(keys) - len(missing))
+        self.count(self.misses_key, len(missing))
+        subscriptions = CustomUserSerializer(
+            context=context
+        ).get_subscriptions()
+        request = context['request']
+        return [
+            self.overlay(found[recipe.id], recipe, subscriptions, request)
+            for recipe in recipes if recipe.id in found
+        ]
+
+    @staticmethod
+    def overlay(data, recipe, subscriptions, request):
+        data = dict(data)
+        result = {
+            'id': data.pop('id'),
+            'is_favorited': recipe.favorited,
+            'is_in_shopping_cart': recipe.in_shopping_cart,
+        }
+        result.update(data)
+        result['author'] = dict(
+            data['author'],
+            is_subscribed=data['author']['id'] in subscriptions
+        )
+        if request is not None:
+            for field in ('image', 'thumbnail'):
+                if result[field]:
+                    result[field] = request.build_absolute_uri(result[field])
+        return result
+
+    def stats(self):
+        values = self.cache.get_many((self.hits_key, self.misses_key))
+        hits = values.get(self.hits_key, 0)
+        misses = values.get(self.misses_key, 0)
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / (hits + misses) if hits + misses else None,
+        }
+
+
+recipe_cache = RecipeCache(settings.RECIPE_CACHE_ALIAS)
+
+
+class RecipeCacheMixin:
+    """list и retrieve рецептов через recipe_cache."""
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        context = self.get_serializer_context()
+        if page is None:
+            return Response(recipe_cache.get_many(list(queryset), context))
+        return self.get_paginated_response(
+            recipe_cache.get_many(page, context)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        data = recipe_cache.get_many(
+            [instance], self.get_serializer_context()
+        )
+        if not data:
+            raise Http404
+        return Response(data[0])
+
+    @action(detail=False, permission_classes=(IsAdminUser,))
+    def cache_stats(self, request):
+        return Response(recipe_cache.stats())
@@ -0,0 +1,106 @@
+import binascii
+import uuid
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
+from rest_framework import serializers
+
+BASE64_CHUNK = 64 * 1024
+WHITESPACE = dict.fromkeys(map(ord, ' \t\r\n'))
+FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+# Заголовок data:image/<тип>;base64, ищется только в начале строки.
+MAX_HEADER_LENGTH = 64
+
+
+class Base64ImageField(serializers.ImageField):
+    """Картинка в виде data-URI, декодируемая по частям.
+
+    Base64 читается кусками во временный файл, который до
+    FILE_UPLOAD_MAX_MEMORY_SIZE держится в памяти, а дальше уходит на
+    диск. Размер файла и число пикселей ограничены настройками
+    IMAGE_UPLOAD_MAX_SIZE и IMAGE_UPLOAD_MAX_PIXELS; пиксели проверяются
+    по заголовку, до декодирования картинки. Pillow получает сам файл,
+    а не копию его содержимого.
+    """
+    default_error_messages = {
+        'invalid': 'Загрузите картинку в формате base64.',
+        'invalid_image': (
+            'Загрузите корректную картинку JPEG, PNG, GIF или WEBP.'
+        ),
+        'max_size': 'Картинка больше {max_size} байт.',
+        'max_pixels': 'В картинке больше {max_pixels} пикселей.',
+    }
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str):
+            self.fail('invalid')
+        start = self.payload_start(data)
+        max_size = settings.IMAGE_UPLOAD_MAX_SIZE
+        if (len(data) - start) // 4 * 3 > max_size + 2:
+            self.fail('max_size', max_size=max_size)
+        file = SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        )
+        try:
+            size = self.decode(data, start, file)
+            if size > max_size:
+                self.fail('max_size', max_size=max_size)
+            image_format = self.check_image(file)
+        except Exception:
+            file.close()
+            raise
+        return UploadedFile(
+            file=file,
+            name=f'{uuid.uuid4()}.{FORMATS[image_format]}',
+            content_type=Image.MIME[image_format],
+            size=size,
+        )
+
+    def payload_start(self, data):
+        """Начало base64 в data: после заголовка data:image/...;base64,
+        или 0, если data — base64 без заголовка."""
+        if not data.startswith('data:'):
+            return 0
+        end = data.find(',', 0, MAX_HEADER_LENGTH)
+        header = data[len('data:'):end]
+        if (end == -1 or not header.startswith('image/')
+                or not header.endswith(';base64')):
+            self.fail('invalid')
+        return end + 1
+
+    def decode(self, data, start, file):
+        """Пишет декодированный base64 из data[start:] в file."""
+        rest = ''
+        for position in range(start, len(data), BASE64_CHUNK):
+            chunk = rest + data[
+                position:position + BASE64_CHUNK
+            ].translate(WHITESPACE)
+            end = len(chunk) - len(chunk) % 4
+            try:
+                file.write(binascii.a2b_base64(chunk[:end]))
+            except binascii.Error:
+                self.fail('invalid')
+            rest = chunk[end:]
+        if rest:
+            self.fail('invalid')
+        return file.tell()
+
+    def check_image(self, file):
+        """Проверяет размеры и целостность картинки, возвращает формат."""
+        max_pixels = settings.IMAGE_UPLOAD_MAX_PIXELS
+        try:
+            file.seek(0)
+            image = Image.open(file)
+            if image.width * image.height > max_pixels:
+                self.fail('max_pixels', max_pixels=max_pixels)
+            if image.format not in FORMATS:
+                self.fail('invalid_image')
+            image.verify()
+        except Image.DecompressionBombError:
+            self.fail('max_pixels', max_pixels=max_pixels)
+        except (OSError, SyntaxError, ValueError):
+            self.fail('invalid_image')
+        file.seek(0)
+        return image.format
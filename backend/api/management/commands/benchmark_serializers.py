@@ -0,0 +1,207 @@
+import json
+import random
+from statistics import median
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Prefetch
+from django.test.utils import override_settings
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api import projections
+from api.serializers import RecipeCacheSerializer, SubscriptionSerializer
+from api.utils import limit_recipes_per_author
+from core.models import (Ingredient, IngredientsInRecipe, Recipe, Tag,
+                         TagsInRecipe)
+from users.models import Follow, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает сериализаторы DRF и чтение через values() на '
+        'сгенерированных данных; падает, если ответы различаются'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--authors', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--recipes-limit', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), override_settings(ALLOWED_HOSTS=['*']):
+            subscriber, recipe_ids = self.generate(options)
+            request = self.make_request(subscriber, options)
+            cases = (
+                ('recipes', self.recipes_drf, self.recipes_fast,
+                 recipe_ids[:options['page_size']],
+                 projections.RECIPE_FIELDS),
+                ('subscriptions', self.subscriptions_drf,
+                 self.subscriptions_fast, request,
+                 projections.SUBSCRIPTION_FIELDS),
+            )
+            failed = []
+            for name, old, new, argument, fields in cases:
+                old_data = old(argument, options)
+                new_data = new(argument, options)
+                if (
+                    json.dumps(old_data) != json.dumps(new_data)
+                    or any(tuple(item) != fields for item in old_data)
+                ):
+                    failed.append(name)
+                old_time = self.measure(old, argument, options)
+                new_time = self.measure(new, argument, options)
+                self.stdout.write(
+                    f'{name}: DRF {old_time:.2f} мс, values() '
+                    f'{new_time:.2f} мс, x{old_time / new_time:.1f}'
+                )
+            transaction.set_rollback(True)
+        if failed:
+            raise CommandError(f'Ответы различаются: {", ".join(failed)}')
+
+    @staticmethod
+    def measure(function, argument, options):
+        timings = []
+        for _ in range(options['repeat']):
+            start = perf_counter()
+            function(argument, options)
+            timings.append((perf_counter() - start) * 1000)
+        return median(timings)
+
+    @staticmethod
+    def generate(options):
+        """Создаёт авторов, рецепты и подписчика; всё откатится."""
+        rng = random.Random(options['seed'])
+        prefix = f'benchmark-{rng.getrandbits(32):x}'
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+        if not ingredients:
+            Ingredient.objects.bulk_create(
+                Ingredient(name=f'{prefix}-{i}', measurement_unit='г')
+                for i in range(200)
+            )
+            ingredients = list(
+                Ingredient.objects.values_list('id', flat=True)
+            )
+        Tag.objects.bulk_create(
+            Tag(slug=f'{prefix}-{i}', name=f'Тег {i % 4}', color='#FF0000')
+            for i in range(8)
+        )
+        tags = list(Tag.objects.filter(
+            slug__startswith=prefix
+        ).values_list('id', flat=True))
+        User.objects.bulk_create(
+            User(
+                username=f'{prefix}-{i}',
+                email=f'{prefix}-{i}@example.com',
+                first_name=f'Имя {i}',
+                last_name=f'Фамилия {i}',
+            ) for i in range(options['authors'] + 1)
+        )
+        subscriber, *authors = User.objects.filter(
+            username__startswith=prefix
+        ).order_by('id')
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=rng.choice(authors),
+                name=f'{prefix} рецепт {i}',
+                text='Описание рецепта. ' * rng.randint(1, 20),
+                cooking_time=rng.randint(1, 120),
+                image=f'recipes/{prefix}-{i}.jpg' if i % 3 else '',
+            ) for i in range(options['recipes'])
+        )
+        recipe_ids = list(Recipe.objects.filter(
+            name__startswith=prefix
+        ).values_list('id', flat=True))
+        TagsInRecipe.objects.bulk_create(
+            TagsInRecipe(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in rng.sample(tags, rng.randint(1, 3))
+        )
+        IngredientsInRecipe.objects.bulk_create(
+            IngredientsInRecipe(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=rng.randint(1, 500),
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in rng.sample(
+                ingredients, min(len(ingredients), rng.randint(3, 15))
+            )
+        )
+        Follow.objects.bulk_create(
+            Follow(user=subscriber, following=author) for author in authors
+        )
+        return subscriber, recipe_ids
+
+    @staticmethod
+    def make_request(user, options):
+        request = APIRequestFactory().get(
+            '/api/users/subscriptions/',
+            {'recipes_limit': options['recipes_limit']}
+        )
+        force_authenticate(request, user)
+        return Request(request)
+
+    @staticmethod
+    def recipes_drf(recipe_ids, options):
+        recipes = Recipe.objects.filter(
+            id__in=recipe_ids
+        ).select_related('author').prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.all()),
+            Prefetch(
+                'ingredients_in_recipe',
+                queryset=IngredientsInRecipe.objects.select_related(
+                    'ingredient'
+                )
+            ),
+        )
+        return RecipeCacheSerializer(
+            recipes, many=True, context={'request': None}
+        ).data
+
+    @staticmethod
+    def recipes_fast(recipe_ids, options):
+        recipes = projections.recipes(recipe_ids)
+        return [
+            recipes[recipe_id] for recipe_id in Recipe.objects.filter(
+                id__in=recipe_ids
+            ).values_list('id', flat=True)
+        ]
+
+    @staticmethod
+    def subscriptions_queryset(request, options):
+        return request.user.is_subscribed.annotate(
+            recipes_count=Count('following__recipes')
+        ).order_by('id')[:options['page_size']]
+
+    @staticmethod
+    def limited_recipes(request, options):
+        return limit_recipes_per_author(
+            Recipe.objects.filter(author__is_followed__user=request.user),
+            options['recipes_limit']
+        )
+
+    def subscriptions_drf(self, request, options):
+        follows = self.subscriptions_queryset(
+            request, options
+        ).select_related('following').prefetch_related(Prefetch(
+            'following__recipes',
+            queryset=self.limited_recipes(request, options),
+            to_attr='limited_recipes'
+        ))
+        return SubscriptionSerializer(
+            follows, many=True, context={'request': request}
+        ).data
+
+    def subscriptions_fast(self, request, options):
+        follows = self.subscriptions_queryset(request, options).values(
+            'recipes_count',
+            *(f'following__{field}' for field in projections.AUTHOR_FIELDS)
+        )
+        return projections.subscriptions(
+            follows, self.limited_recipes(request, options), request
+        )
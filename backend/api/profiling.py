@@ -0,0 +1,149 @@
+"""Учёт SQL-запросов: middleware с Server-Timing и проверка числа запросов.
+
+Middleware включается настройкой SQL_PROFILING. Она считает запросы и время
+в БД, отдаёт заголовок Server-Timing с фазами db/serialize/render и пишет
+предупреждение, если один и тот же (с точностью до параметров) запрос
+повторился в рамках запроса больше SQL_PROFILING_REPEAT_THRESHOLD раз —
+типичный признак N+1.
+"""
+import logging
+import re
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+NORMALIZE = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+)
+
+
+def normalize(sql):
+    """Запрос без литералов и с одинаковым видом для IN любой длины."""
+    for pattern, replacement in NORMALIZE:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+class QueryLog:
+    """execute_wrapper, считающий запросы, время и повторы."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += perf_counter() - start
+            self.count += 1
+            self.statements[normalize(sql)] += 1
+
+    @contextmanager
+    def capture(self):
+        """Подключает учёт ко всем соединениям текущего потока."""
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    def repeated(self, threshold):
+        return [
+            (sql, count) for sql, count in self.statements.most_common()
+            if count > threshold
+        ]
+
+    def describe(self):
+        return '\n'.join(
+            f'{count} x {sql}'
+            for sql, count in self.statements.most_common()
+        )
+
+
+@contextmanager
+def assert_max_queries(limit):
+    """Падает, если в блоке выполнено больше limit запросов к БД.
+
+        with assert_max_queries(8):
+            client.get('/api/recipes/')
+    """
+    log = QueryLog()
+    with log.capture():
+        yield log
+    if log.count > limit:
+        raise AssertionError(
+            f'Выполнено {log.count} запросов к БД, допустимо не больше '
+            f'{limit}:\n{log.describe()}'
+        )
+
+
+def view_name(request, view_func):
+    view = getattr(view_func, 'cls', view_func)
+    name = f'{view.__module__}.{view.__qualname__}'
+    if request.resolver_match and request.resolver_match.url_name:
+        name += f' ({request.resolver_match.url_name})'
+    return name
+
+
+class SQLProfilingMiddleware:
+    """Server-Timing и поиск N+1 по запросам к БД.
+
+    serialize — время view без БД (в DRF сюда входит сериализация),
+    render — рендеринг Response без БД.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold = settings.SQL_PROFILING_REPEAT_THRESHOLD
+
+    def __call__(self, request):
+        log = request.sql_profile = QueryLog()
+        request.sql_profile_marks = {}
+        request.sql_profile_view = request.path
+        start = perf_counter()
+        with log.capture():
+            response = self.get_response(request)
+        end = perf_counter()
+        marks = request.sql_profile_marks
+        view_start, view_db = marks.get('view', (start, 0.0))
+        render_start, render_db = marks.get('render', (end, log.duration))
+        phases = (
+            ('db', log.duration, f'{log.count} sql'),
+            ('serialize', render_start - view_start - render_db + view_db,
+             None),
+            ('render', end - render_start - log.duration + render_db, None),
+            ('total', end - start, None),
+        )
+        response['Server-Timing'] = ', '.join(
+            f'{name};dur={duration * 1000:.2f}'
+            + (f';desc="{description}"' if description else '')
+            for name, duration, description in phases
+        )
+        for sql, count in log.repeated(self.threshold):
+            logger.warning(
+                'Запрос выполнен %d раз за один запрос к %s: %s',
+                count, request.sql_profile_view, sql
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.sql_profile_view = view_name(request, view_func)
+        request.sql_profile_marks['view'] = (
+            perf_counter(), request.sql_profile.duration
+        )
+
+    def process_template_response(self, request, response):
+        request.sql_profile_marks['render'] = (
+            perf_counter(), request.sql_profile.duration
+        )
+        return response
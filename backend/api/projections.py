@@ -0,0 +1,114 @@
+"""Чтение горячих списков словарями из values() в обход сериализаторов.
+
+Поля и их порядок объявлены здесь же и совпадают с выводом
+RecipeCacheSerializer и SubscriptionSerializer; совпадение проверяет
+команда benchmark_serializers.
+"""
+from collections import defaultdict
+
+from django.core.files.storage import default_storage
+
+from core.models import IngredientsInRecipe, Recipe, TagsInRecipe
+
+AUTHOR_FIELDS = ('email', 'id', 'username', 'first_name', 'last_name')
+TAG_FIELDS = ('id', 'slug', 'color', 'name')
+INGREDIENT_FIELDS = ('id', 'name', 'measurement_unit', 'amount')
+RECIPE_FIELDS = (
+    'id', 'tags', 'ingredients', 'author', 'thumbnail', 'image', 'name',
+    'cooking_time', 'text',
+)
+SUBSCRIPTION_FIELDS = AUTHOR_FIELDS + (
+    'is_subscribed', 'recipes', 'recipes_count',
+)
+
+
+def file_url(name, request=None):
+    """Ссылка на файл так же, как её строит ImageField из DRF."""
+    if not name:
+        return None
+    url = default_storage.url(name)
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def recipes(recipe_ids):
+    """{id: рецепт} в виде RecipeCacheSerializer, тремя запросами."""
+    tags = defaultdict(list)
+    for row in TagsInRecipe.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('tag__name', 'tag__id').values_list(
+        'recipe_id', 'tag__id', 'tag__slug', 'tag__color', 'tag__name'
+    ):
+        tags[row[0]].append(dict(zip(TAG_FIELDS, row[1:])))
+    ingredients = defaultdict(list)
+    for row in IngredientsInRecipe.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list(
+        'recipe_id', 'ingredient__id', 'ingredient__name',
+        'ingredient__measurement_unit', 'amount'
+    ):
+        ingredients[row[0]].append(dict(zip(INGREDIENT_FIELDS, row[1:])))
+    result = {}
+    for row in Recipe.objects.filter(id__in=recipe_ids).values(
+        'id', 'thumbnail', 'image', 'name', 'cooking_time', 'text',
+        *(f'author__{field}' for field in AUTHOR_FIELDS)
+    ):
+        result[row['id']] = {
+            'id': row['id'],
+            'tags': tags[row['id']],
+            'ingredients': ingredients[row['id']],
+            'author': {
+                field: row[f'author__{field}'] for field in AUTHOR_FIELDS
+            },
+            'thumbnail': file_url(row['thumbnail'] or row['image']),
+            'image': file_url(row['image']),
+            'name': row['name'],
+            'cooking_time': row['cooking_time'],
+            'text': row['text'],
+        }
+    return result
+
+
+def minified_recipes(queryset, request=None):
+    """Рецепты queryset в виде RecipeMinifiedSerializer, с author_id."""
+    return [
+        {
+            'id': row['id'],
+            'name': row['name'],
+            'image': file_url(row['image'], request),
+            'thumbnail': file_url(row['thumbnail'] or row['image'], request),
+            'cooking_time': row['cooking_time'],
+            'author_id': row['author_id'],
+        } for row in queryset.values(
+            'id', 'name', 'image', 'thumbnail', 'cooking_time', 'author_id'
+        )
+    ]
+
+
+def subscriptions(follows, recipes_queryset, request):
+    """Подписки в виде SubscriptionSerializer.
+
+    follows — строки Follow из values() с полями following__* и
+    recipes_count, recipes_queryset — рецепты этих авторов, уже
+    ограниченные по recipes_limit.
+    """
+    by_author = defaultdict(list)
+    for recipe in minified_recipes(
+        recipes_queryset.filter(
+            author_id__in=[row['following__id'] for row in follows]
+        ),
+        request
+    ):
+        by_author[recipe.pop('author_id')].append(recipe)
+    return [
+        {
+            **{
+                field: row[f'following__{field}']
+                for field in AUTHOR_FIELDS
+            },
+            'is_subscribed': True,
+            'recipes': by_author[row['following__id']],
+            'recipes_count': row['recipes_count'],
+        } for row in follows
+    ]
@@ -0,0 +1,70 @@
+import json
+import re
+from secrets import token_hex
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+LINE_SEPARATORS = (
+    (b'\xe2\x80\xa8', b'\\u2028'),
+    (b'\xe2\x80\xa9', b'\\u2029'),
+)
+
+
+class JSONFragment(bytes):
+    """Готовый JSON, который FastJSONRenderer вставляет без перекодирования."""
+
+    @classmethod
+    def encode(cls, data):
+        return cls(FastJSONRenderer().render(data))
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson, если он установлен, иначе на json.
+
+    JSONFragment в данных попадают в ответ как есть: при кодировании на их
+    месте стоят строки-заглушки, которые затем заменяются байтами
+    фрагментов за один проход.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, JSONFragment):
+            return bytes(data)
+        marker = f'json-fragment-{token_hex(8)}:'
+        fragments = []
+        encoder = self.encoder_class()
+
+        def default(obj):
+            if isinstance(obj, JSONFragment):
+                fragments.append(obj)
+                return f'{marker}{len(fragments) - 1}'
+            return encoder.default(obj)
+
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if orjson is not None and indent is None:
+            ret = orjson.dumps(
+                data,
+                default=default,
+                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+            )
+        else:
+            ret = json.dumps(
+                data, default=default, indent=indent,
+                ensure_ascii=self.ensure_ascii, allow_nan=not self.strict,
+                separators=(',', ':') if self.compact else (', ', ': '),
+            ).encode()
+        for separator, escaped in LINE_SEPARATORS:
+            ret = ret.replace(separator, escaped)
+        if fragments:
+            ret = re.sub(
+                b'"' + re.escape(marker.encode()) + rb'(\d+)"',
+                lambda match: fragments[int(match[1])],
+                ret
+            )
+        return ret
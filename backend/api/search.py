@@ -0,0 +1,242 @@
+import heapq
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+from datetime import timedelta
+from itertools import chain
+from operator import sub, truediv
+from threading import Lock
+from time import monotonic
+
+from django.utils import timezone
+
+from api.renderers import JSONFragment
+from core.models import Ingredient, IngredientsInRecipe, ModelVersion, Tag
+
+
+class IngredientIndex:
+    """Отсортированный по названию индекс ингредиентов в памяти процесса.
+
+    Строится лениво при первом поиске и запоминает версию
+    ModelVersion.INGREDIENTS, по которой построен: если версия в БД другая
+    (ингредиенты изменили в другом процессе или загрузили пачкой), индекс
+    перестраивается. Сигналы этого процесса сбрасывают его сразу.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.data = None
+        self.version = None
+
+    @staticmethod
+    def current_version():
+        versions = ModelVersion.objects.get_versions(
+            [ModelVersion.INGREDIENTS]
+        )
+        return versions.get(ModelVersion.INGREDIENTS, (0, None))[0]
+
+    def load(self, version=None):
+        """version — уже прочитанная из БД версия каталога, если есть."""
+        if version is None:
+            version = self.current_version()
+        data = self.data
+        if data is None or self.version != version:
+            with self.lock:
+                if self.data is None or self.version != version:
+                    rows = sorted(
+                        Ingredient.objects.values(
+                            'id', 'measurement_unit', 'name'
+                        ),
+                        key=lambda row: (row['name'].casefold(), row['id'])
+                    )
+                    self.data = (
+                        [row['name'].casefold() for row in rows], rows,
+                        JSONFragment.encode(rows)
+                    )
+                    self.version = version
+                data = self.data
+        return data
+
+    def invalidate(self):
+        self.data = None
+
+    def all(self, version=None):
+        return self.load(version)[1]
+
+    def encoded(self, version=None):
+        """Весь каталог, уже закодированный в JSON."""
+        return self.load(version)[2]
+
+    def search(self, query, version=None):
+        names, rows, _ = self.load(version)
+        query = query.casefold()
+        if not query:
+            return rows
+        start = bisect_left(names, query)
+        end = start
+        while end < len(names) and names[end].startswith(query):
+            end += 1
+        found = rows[start:end]
+        found.extend(
+            row for name, row in zip(names, rows)
+            if query in name and not name.startswith(query)
+        )
+        return found
+
+
+ingredient_index = IngredientIndex()
+
+
+class TagSlugMap:
+    """Соответствие slug -> id тегов, закэшированное в памяти процесса.
+
+    Сбрасывается сигналами при изменении тегов и, на случай изменений из
+    других процессов, по истечении ttl секунд.
+    """
+    ttl = 60
+
+    def __init__(self):
+        self.lock = Lock()
+        self.data = None
+        self.loaded = 0
+
+    def load(self):
+        data = self.data
+        if data is None or monotonic() - self.loaded > self.ttl:
+            with self.lock:
+                self.data = dict(Tag.objects.values_list('slug', 'id'))
+                self.loaded = monotonic()
+                data = self.data
+        return data
+
+    def invalidate(self):
+        self.data = None
+
+    def ids(self, slugs):
+        data = self.load()
+        return [data[slug] for slug in slugs if slug in data]
+
+
+tag_slug_map = TagSlugMap()
+
+
+class RecipeIngredientIndex:
+    """Обратный индекс ингредиент -> отсортированный массив id рецептов.
+
+    Строится лениво из IngredientsInRecipe. Рецепты, изменённые в этом
+    процессе, сигналы помечают устаревшими; изменения из других
+    процессов раз в poll_interval секунд находятся по свежим версиям
+    рецептов в ModelVersion. Устаревшие рецепты перечитываются одним
+    запросом перед очередным поиском.
+    """
+    poll_interval = 5
+    # Запас на длительность транзакций и расхождение часов.
+    poll_overlap = timedelta(seconds=30)
+
+    def __init__(self):
+        self.lock = Lock()
+        self.postings = None
+        self.recipes = {}
+        self.versions = {}
+        self.stale = set()
+        self.since = None
+        self.polled = 0
+
+    def load(self):
+        self.since = timezone.now() - self.poll_overlap
+        self.polled = monotonic()
+        self.versions = self.recipe_versions(None)
+        self.postings = {}
+        self.recipes = {}
+        self.stale = set()
+        rows = IngredientsInRecipe.objects.order_by(
+            'recipe_id', 'ingredient_id'
+        ).values_list('recipe_id', 'ingredient_id')
+        for recipe_id, ingredient_id in rows.iterator():
+            self.recipes.setdefault(recipe_id, set()).add(ingredient_id)
+            self.postings.setdefault(ingredient_id, array('q')).append(
+                recipe_id
+            )
+        for recipe_id, ingredients in self.recipes.items():
+            self.recipes[recipe_id] = frozenset(ingredients)
+
+    @staticmethod
+    def recipe_versions(since):
+        versions = ModelVersion.objects.filter(key__startswith='recipe:')
+        if since is not None:
+            versions = versions.filter(updated__gte=since)
+        return {
+            int(key.split(':')[1]): version
+            for key, version in versions.values_list('key', 'version')
+        }
+
+    def poll(self):
+        """Помечает устаревшими рецепты, изменённые другими процессами."""
+        since = timezone.now() - self.poll_overlap
+        for recipe_id, version in self.recipe_versions(self.since).items():
+            if self.versions.get(recipe_id) != version:
+                self.versions[recipe_id] = version
+                self.stale.add(recipe_id)
+        self.since = since
+        self.polled = monotonic()
+
+    def refresh(self):
+        stale, self.stale = self.stale, set()
+        current = {recipe_id: set() for recipe_id in stale}
+        for recipe_id, ingredient_id in IngredientsInRecipe.objects.filter(
+            recipe_id__in=stale
+        ).values_list('recipe_id', 'ingredient_id'):
+            current[recipe_id].add(ingredient_id)
+        for recipe_id, ingredients in current.items():
+            old = self.recipes.pop(recipe_id, frozenset())
+            for ingredient_id in old - ingredients:
+                posting = self.postings[ingredient_id]
+                del posting[bisect_left(posting, recipe_id)]
+            for ingredient_id in ingredients - old:
+                insort(
+                    self.postings.setdefault(ingredient_id, array('q')),
+                    recipe_id
+                )
+            if ingredients:
+                self.recipes[recipe_id] = frozenset(ingredients)
+
+    def invalidate(self, recipe_id):
+        # Вызывается из on_commit любого потока, пока другой может
+        # загружать индекс или разбирать stale.
+        with self.lock:
+            self.stale.add(recipe_id)
+
+    def cookable(self, ingredient_ids, limit):
+        """Лучшие limit рецептов по доле имеющихся ингредиентов.
+
+        Возвращает список (id рецепта, доля покрытия, сколько не хватает)
+        по убыванию покрытия, затем по возрастанию нехватки.
+        """
+        with self.lock:
+            if self.postings is None:
+                self.load()
+            elif monotonic() - self.polled > self.poll_interval:
+                self.poll()
+            if self.stale:
+                self.refresh()
+            matched = Counter(chain.from_iterable(
+                self.postings.get(ingredient_id, ())
+                for ingredient_id in set(ingredient_ids)
+            ))
+            recipe_ids = list(matched)
+            sizes = list(map(len, map(self.recipes.__getitem__, recipe_ids)))
+        counts = list(matched.values())
+        best = heapq.nlargest(limit, zip(
+            map(truediv, counts, sizes), map(sub, counts, sizes), recipe_ids
+        ))
+        return [
+            (recipe_id, coverage, -surplus)
+            for coverage, surplus, recipe_id in best
+        ]
+
+
+recipe_ingredient_index = RecipeIngredientIndex()
+
+
+def tag_choices():
+    return [(slug, slug) for slug in tag_slug_map.load()]
@@ -1,11 +1,19 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Prefetch
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
-from core.constants import (MAX_AMOUNT_OF_INGREDIENT, MAX_COOKING_TIME,
-                            MIN_AMOUNT_OF_INGREDIENT, MIN_COOKING_TIME)
-from core.models import Ingredient, IngredientsInRecipe, Recipe, Tag
-from users.models import Follow, User
+from api.fields import Base64ImageField
+from api.utils import annotate_user_flags, get_recipes_limit
+from core.constants import (COOKABLE_RECIPES_LIMIT, MAX_AMOUNT_OF_INGREDIENT,
+                            MAX_COOKABLE_RECIPES_LIMIT, MAX_COOKING_TIME,
+                            MAX_RECIPES_IN_BATCH, MIN_AMOUNT_OF_INGREDIENT,
+                            MIN_COOKING_TIME)
+from core.models import (Ingredient, IngredientsInRecipe, Recipe, Tag,
+                         TagsInRecipe)
+from users.models import Follow, ShoppingListItem, User
 
 
 class IngredientInRecipeSerializer(serializers.ModelSerializer):
@@ -36,12 +44,19 @@ class CustomUserSerializer(UserSerializer):
             'is_subscribed',
         )
 
+    def get_subscriptions(self):
+        if 'subscriptions' not in self.context:
+            subscriptions = set()
+            user = self.context['request'].user
+            if user.is_authenticated:
+                subscriptions = set(
+                    user.is_subscribed.values_list('following_id', flat=True)
+                )
+            self.context['subscriptions'] = subscriptions
+        return self.context['subscriptions']
+
     def get_is_subscribed(self, obj):
-        result = False
-        user = self.context['request'].user
-        if user.is_authenticated:
-            result = user.is_subscribed.filter(following=obj).exists()
-        return result
+        return obj.id in self.get_subscriptions()
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -71,42 +86,60 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class ThumbnailField(serializers.ImageField):
+    """Миниатюра рецепта; пока она не готова, отдаётся оригинал."""
+
+    def __init__(self, **kwargs):
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        return super().to_representation(recipe.thumbnail or recipe.image)
+
+
 class RecipeRetrieveSerializer(serializers.ModelSerializer):
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
+    is_favorited = serializers.BooleanField(
+        source='favorited',
+        read_only=True
+    )
+    is_in_shopping_cart = serializers.BooleanField(
+        source='in_shopping_cart',
+        read_only=True
+    )
     tags = TagSerializer(many=True)
     ingredients = IngredientInRecipeSerializer(
         source='ingredients_in_recipe',
         many=True
     )
     author = CustomUserSerializer()
+    thumbnail = ThumbnailField()
 
     class Meta:
         model = Recipe
         fields = '__all__'
 
-    def validator(self, obj, model):
-        result = False
-        user = self.context['request'].user
-        if user.is_authenticated:
-            models_dict = {
-                'Favorite': user.favorite_list,
-                'ShoppingCart': user.shopping_cart
-            }
-            result = models_dict[model].filter(recipe=obj).exists()
-        return result
 
-    def get_is_favorited(self, obj):
-        return self.validator(obj, 'Favorite')
+class AuthorSerializer(UserSerializer):
+    """Автор рецепта без is_subscribed: одинаков для всех зрителей."""
 
-    def get_is_in_shopping_cart(self, obj):
-        return self.validator(obj, 'ShoppingCart')
+    class Meta:
+        model = User
+        fields = UserSerializer.Meta.fields + (
+            'username',
+            'first_name',
+            'last_name',
+        )
+
+
+class RecipeCacheSerializer(RecipeRetrieveSerializer):
+    """Часть рецепта, не зависящая от зрителя, для кэша."""
+    is_favorited = None
+    is_in_shopping_cart = None
+    author = AuthorSerializer()
 
 
 class IngredientsListingSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all()
-    )
+    id = serializers.IntegerField(min_value=1)
     amount = serializers.IntegerField(
         min_value=MIN_AMOUNT_OF_INGREDIENT,
         max_value=MAX_AMOUNT_OF_INGREDIENT
@@ -118,9 +151,8 @@ class IngredientsListingSerializer(serializers.ModelSerializer):
 
 
 class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True,
-        queryset=Tag.objects.all()
+    tags = serializers.ListField(
+        child=serializers.IntegerField(min_value=1)
     )
     ingredients = IngredientsListingSerializer(
         many=True,
@@ -144,26 +176,200 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
             'cooking_time'
         )
 
+    def validate_ingredients(self, ingredients):
+        amounts = Counter()
+        for ingredient in ingredients:
+            amounts[ingredient['id']] += ingredient['amount']
+        too_much = [
+            str(ingredient_id) for ingredient_id, amount in amounts.items()
+            if amount > MAX_AMOUNT_OF_INGREDIENT
+        ]
+        if too_much:
+            raise serializers.ValidationError(
+                'Суммарное количество больше '
+                f'{MAX_AMOUNT_OF_INGREDIENT}: {", ".join(too_much)}'
+            )
+        return [
+            {'id': ingredient_id, 'amount': amount}
+            for ingredient_id, amount in amounts.items()
+        ]
+
+    def validate_tags(self, tags):
+        return list(dict.fromkeys(tags))
+
+    def validate(self, attrs):
+        """Проверяет ссылки на ингредиенты и теги.
+
+        Каждая модель читается одним in_bulk(), все ненайденные id
+        возвращаются в одной ошибке.
+        """
+        errors = {}
+        ingredients = attrs.get('ingredients_in_recipe')
+        if ingredients is not None:
+            found = Ingredient.objects.in_bulk(
+                [ingredient['id'] for ingredient in ingredients]
+            )
+            missing = [
+                str(ingredient['id']) for ingredient in ingredients
+                if ingredient['id'] not in found
+            ]
+            if missing:
+                errors['ingredients'] = [
+                    f'Ингредиенты не найдены: {", ".join(missing)}'
+                ]
+            else:
+                for ingredient in ingredients:
+                    ingredient['id'] = found[ingredient['id']]
+        tags = attrs.get('tags')
+        if tags is not None:
+            found = Tag.objects.in_bulk(tags)
+            missing = [str(tag_id) for tag_id in tags if tag_id not in found]
+            if missing:
+                errors['tags'] = [f'Теги не найдены: {", ".join(missing)}']
+            else:
+                attrs['tags'] = [found[tag_id] for tag_id in tags]
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients_in_recipe')
-        recipe = Recipe.objects.create(**validated_data)
-        recipe.tags.set(tags)
-        IngredientsInRecipe.objects.bulk_create(
+        with transaction.atomic():
+            recipe = Recipe.objects.create(**validated_data)
+            TagsInRecipe.objects.bulk_create(
+                TagsInRecipe(recipe=recipe, tag=tag) for tag in tags
+            )
+            IngredientsInRecipe.objects.bulk_create(
+                IngredientsInRecipe(
+                    amount=ingredient['amount'],
+                    ingredient=ingredient['id'],
+                    recipe=recipe,
+                ) for ingredient in ingredients
+            )
+        return recipe
+
+    def to_representation(self, instance):
+        recipe = annotate_user_flags(
+            Recipe.objects.filter(pk=instance.pk),
+            self.context['request'].user
+        ).select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredients_in_recipe',
+                queryset=IngredientsInRecipe.objects.select_related(
+                    'ingredient'
+                )
+            ),
+        ).get()
+        return RecipeRetrieveSerializer(recipe, context=self.context).data
+
+    def update(self, instance, validated_data):
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients_in_recipe', None)
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if tags is not None:
+                self.update_tags(instance, tags)
+            if ingredients is not None:
+                self.update_ingredients(instance, ingredients)
+        return instance
+
+    def update_tags(self, recipe, tags):
+        current = set(recipe.tags_in_recipe.values_list('tag_id', flat=True))
+        new = {tag.id for tag in tags}
+        TagsInRecipe.objects.bulk_create(
+            TagsInRecipe(recipe=recipe, tag_id=tag_id)
+            for tag_id in new - current
+        )
+        if current - new:
+            recipe.tags_in_recipe.filter(tag_id__in=current - new).delete()
+
+    def update_ingredients(self, recipe, ingredients):
+        """Пишет только изменившиеся строки IngredientsInRecipe.
+
+        Добавленные строки вставляются одним bulk_create, изменённые
+        количества обновляются одним bulk_update, удалённые стираются
+        одним DELETE. Разница сразу применяется к спискам покупок всех,
+        у кого рецепт в корзине.
+        """
+        new = {
+            ingredient['id'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        current = {}
+        to_delete = []
+        for row in recipe.ingredients_in_recipe.all():
+            if row.ingredient_id in current or row.ingredient_id not in new:
+                to_delete.append(row)
+            else:
+                current[row.ingredient_id] = row
+        to_create = [
             IngredientsInRecipe(
-                amount=ingredient['amount'],
-                ingredient=ingredient['id'],
-                recipe=recipe,
-            ) for ingredient in ingredients
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            ) for ingredient_id, amount in new.items()
+            if ingredient_id not in current
+        ]
+        to_update = []
+        deltas = Counter()
+        for ingredient_id, row in current.items():
+            if row.amount != new[ingredient_id]:
+                deltas[ingredient_id] += new[ingredient_id] - row.amount
+                row.amount = new[ingredient_id]
+                to_update.append(row)
+        for row in to_create:
+            deltas[row.ingredient_id] += row.amount
+        IngredientsInRecipe.objects.bulk_create(to_create)
+        IngredientsInRecipe.objects.bulk_update(to_update, ['amount'])
+        if to_delete:
+            # Без post_delete: разница учитывается в deltas, и только для
+            # строк, которые удалил этот запрос.
+            deleted = set(IngredientsInRecipe.objects.delete_without_signals(
+                [row.id for row in to_delete]
+            ))
+            for row in to_delete:
+                if row.id in deleted:
+                    deltas[row.ingredient_id] -= row.amount
+        ShoppingListItem.objects.add_amounts(
+            recipe.is_in_shopping_cart.values_list('user_id', flat=True),
+            deltas
         )
-        return recipe
 
 
 class RecipeMinifiedSerializer(serializers.ModelSerializer):
+    thumbnail = ThumbnailField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'thumbnail', 'cooking_time')
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_RECIPES_IN_BATCH
+    )
+
+
+class CookableParamsSerializer(serializers.Serializer):
+    ingredients = serializers.CharField()
+    limit = serializers.IntegerField(
+        min_value=1,
+        max_value=MAX_COOKABLE_RECIPES_LIMIT,
+        default=COOKABLE_RECIPES_LIMIT
+    )
+
+    def validate_ingredients(self, value):
+        try:
+            ids = {int(pk) for pk in value.split(',') if pk.strip()}
+        except ValueError:
+            raise serializers.ValidationError(
+                'Ожидаются id ингредиентов через запятую'
+            )
+        if not ids:
+            raise serializers.ValidationError('Укажите хотя бы один id')
+        return ids
 
 
 class SubscriptionSerializer(serializers.ModelSerializer):
@@ -188,15 +394,8 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         required=False
     )
     is_subscribed = serializers.SerializerMethodField()
-    recipes = RecipeMinifiedSerializer(
-        source='following.recipes',
-        many=True,
-        required=False
-    )
-    recipes_count = serializers.IntegerField(
-        source='following.recipes.count',
-        required=False
-    )
+    recipes = serializers.SerializerMethodField()
+    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Follow
@@ -206,9 +405,21 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        if self.context['request'].user.id == obj.id:
-            raise serializers.ValidationError(
-                'Вы пытаетесь подписаться на себя'
-            )
-        return self.context['request'].user.is_subscribed.filter(
-            user_id=obj.id).exists()
+        return obj.user_id == self.context['request'].user.id
+
+    def get_recipes(self, obj):
+        recipes = getattr(obj.following, 'limited_recipes', None)
+        if recipes is None:
+            recipes = obj.following.recipes.all()
+            limit = get_recipes_limit(self.context['request'])
+            if limit is not None:
+                recipes = recipes[:limit]
+        return RecipeMinifiedSerializer(
+            recipes, many=True, context=self.context
+        ).data
+
+    def get_recipes_count(self, obj):
+        recipes_count = getattr(obj, 'recipes_count', None)
+        if recipes_count is None:
+            recipes_count = obj.following.recipes.count()
+        return recipes_count
@@ -0,0 +1,37 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import Ingredient, IngredientsInRecipe, Recipe, Tag
+
+from .search import ingredient_index, recipe_ingredient_index, tag_slug_map
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    transaction.on_commit(ingredient_index.invalidate)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_slug_map(sender, **kwargs):
+    transaction.on_commit(tag_slug_map.invalidate)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe_ingredients(sender, instance, **kwargs):
+    transaction.on_commit(
+        partial(recipe_ingredient_index.invalidate, instance.id)
+    )
+
+
+@receiver(post_save, sender=IngredientsInRecipe)
+@receiver(post_delete, sender=IngredientsInRecipe)
+def invalidate_recipe_ingredients_on_relation(sender, instance, **kwargs):
+    transaction.on_commit(
+        partial(recipe_ingredient_index.invalidate, instance.recipe_id)
+    )
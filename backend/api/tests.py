@@ -0,0 +1,1634 @@
+import json
+import threading
+from base64 import b64encode
+from decimal import Decimal
+from io import BytesIO, StringIO
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.db.models.signals import post_delete
+from django.http import HttpResponse
+from django.test import (RequestFactory, TestCase, modify_settings,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.utils.http import http_date
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from api import projections, renderers
+from api.cache import recipe_cache
+from api.fields import Base64ImageField
+from api.profiling import SQLProfilingMiddleware, assert_max_queries, normalize
+from api.renderers import FastJSONRenderer, JSONFragment
+from api.search import (RecipeIngredientIndex, ingredient_index,
+                        recipe_ingredient_index, tag_slug_map)
+from api.serializers import RecipeCacheSerializer, RecipeMinifiedSerializer
+from api.utils import annotate_user_flags
+from core import fulltext
+from core.constants import MAX_AMOUNT_OF_INGREDIENT, MAX_RECIPES_IN_BATCH
+from core.models import (Ingredient, IngredientsInRecipe, ModelVersion, Recipe,
+                         Tag, TagsInRecipe)
+from users.models import Favorite, Follow, ShoppingCart, ShoppingListItem, User
+
+MAX_RECIPE_LIST_QUERIES = 10
+MAX_NOOP_PATCH_QUERIES = 17
+
+
+class RecipeListQueriesTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='cook', email='cook@example.com'
+        )
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {i}', slug=f'tag-{i}',
+                               color='#49B64E')
+            for i in range(3)
+        ]
+        cls.ingredients = list(Ingredient.objects.order_by('id')[:5])
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=cls.user, name=f'Рецепт {i}', text='Текст',
+                cooking_time=i + 1
+            ) for i in range(60)
+        )
+        recipes = list(Recipe.objects.order_by('id'))
+        TagsInRecipe.objects.bulk_create(
+            TagsInRecipe(recipe=recipe, tag=tag)
+            for i, recipe in enumerate(recipes)
+            for tag in cls.tags[:i % 3 + 1]
+        )
+        IngredientsInRecipe.objects.bulk_create(
+            IngredientsInRecipe(recipe=recipe, ingredient=ingredient,
+                                amount=i + j + 1)
+            for i, recipe in enumerate(recipes)
+            for j, ingredient in enumerate(cls.ingredients[:i % 5 + 1])
+        )
+        cls.favorites = {recipe.id for recipe in recipes[::2]}
+        cls.cart = {recipe.id for recipe in recipes[::3]}
+        Favorite.objects.insert_ignore(
+            Favorite(user=cls.user, recipe_id=recipe_id)
+            for recipe_id in cls.favorites
+        )
+        ShoppingCart.objects.insert_ignore(
+            ShoppingCart(user=cls.user, recipe_id=recipe_id)
+            for recipe_id in cls.cart
+        )
+        cls.token = Token.objects.create(user=cls.user)
+        cls.recipes = {
+            recipe.id: i for i, recipe in enumerate(recipes)
+        }
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def get_recipes(self, limit, client=None):
+        caches[settings.RECIPE_CACHE_ALIAS].clear()
+        response = (client or self.client).get(
+            '/api/recipes/', {'limit': limit}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), limit)
+        return response.json()['results']
+
+    def expected(self, recipe_id, authenticated=True):
+        i = self.recipes[recipe_id]
+        return {
+            'id': recipe_id,
+            'is_favorited': authenticated and recipe_id in self.favorites,
+            'is_in_shopping_cart': authenticated and recipe_id in self.cart,
+            'tags': [
+                {'id': tag.id, 'slug': tag.slug, 'color': tag.color,
+                 'name': tag.name}
+                for tag in self.tags[:i % 3 + 1]
+            ],
+            'ingredients': [
+                {'id': ingredient.id, 'name': ingredient.name,
+                 'measurement_unit': ingredient.measurement_unit,
+                 'amount': i + j + 1}
+                for j, ingredient in enumerate(self.ingredients[:i % 5 + 1])
+            ],
+            'author': {
+                'email': self.user.email, 'id': self.user.id,
+                'username': self.user.username, 'first_name': '',
+                'last_name': '', 'is_subscribed': False,
+            },
+            'thumbnail': None,
+            'image': None,
+            'name': f'Рецепт {i}',
+            'cooking_time': i + 1,
+            'text': 'Текст',
+        }
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        with CaptureQueriesContext(connection) as small_page:
+            self.get_recipes(6)
+        with assert_max_queries(MAX_RECIPE_LIST_QUERIES):
+            with self.assertNumQueries(len(small_page.captured_queries)):
+                self.get_recipes(50)
+
+    def test_body(self):
+        results = self.get_recipes(50)
+        self.assertEqual(
+            [recipe['id'] for recipe in results],
+            sorted(self.recipes, key=self.recipes.get, reverse=True)[:50]
+        )
+        for recipe in results:
+            with self.subTest(recipe=recipe['id']):
+                self.assertEqual(recipe, self.expected(recipe['id']))
+
+    def test_anonymous_flags(self):
+        for recipe in self.get_recipes(10, client=APIClient()):
+            with self.subTest(recipe=recipe['id']):
+                self.assertEqual(
+                    recipe, self.expected(recipe['id'], authenticated=False)
+                )
+
+
+def encode_cursor(value):
+    return b64encode(json.dumps(value).encode(), altchars=b'-_').decode()
+
+
+class KeysetPaginationTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author', email='author@example.com'
+        )
+        cls.reader = User.objects.create(
+            username='reader', email='reader@example.com'
+        )
+        Follow.objects.insert_ignore([
+            Follow(user=cls.reader, following=cls.author)
+        ])
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=cls.author, name=f'Рецепт {i}', text='Текст',
+                cooking_time=i % 4 + 1
+            ) for i in range(25)
+        )
+        cls.expected = list(Recipe.objects.order_by(
+            '-cooking_time', '-id'
+        ).values_list('id', flat=True))
+        cls.token = Token.objects.create(user=cls.reader)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def walk(self, url):
+        ids = []
+        pages = 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertLessEqual(len(data['results']), 4)
+            ids.extend(recipe['id'] for recipe in data['results'])
+            url = data['next']
+            pages += 1
+        return ids, pages
+
+    def test_cursor_walk_returns_every_recipe_once_in_order(self):
+        for url in ('/api/recipes/?cursor=&limit=4',
+                    '/api/recipes/feed/?limit=4'):
+            with self.subTest(url=url):
+                ids, pages = self.walk(url)
+                self.assertEqual(ids, self.expected)
+                self.assertEqual(pages, 7)
+
+    def test_count_only_on_request(self):
+        data = self.client.get('/api/recipes/feed/?limit=4').json()
+        self.assertIsNone(data['count'])
+        data = self.client.get('/api/recipes/feed/?limit=4&count=1').json()
+        self.assertEqual(data['count'], 25)
+
+    def test_invalid_cursor_is_not_found(self):
+        cursors = (
+            'мусор',
+            '!!!',
+            encode_cursor(None),
+            encode_cursor({'cooking_time': 1, 'id': 1}),
+            encode_cursor([1]),
+            encode_cursor([1, 2, 3]),
+            encode_cursor([None, None]),
+            encode_cursor(['a', 'b']),
+            encode_cursor([1.5, 2]),
+            encode_cursor([True, 1]),
+            encode_cursor([1, 2 ** 70]),
+            b64encode(b'not json').decode(),
+        )
+        for path in ('/api/recipes/', '/api/recipes/feed/'):
+            for cursor in cursors:
+                with self.subTest(path=path, cursor=cursor):
+                    response = self.client.get(path, {'cursor': cursor})
+                    self.assertEqual(response.status_code, 404)
+
+
+class RecipeUpdateTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author', email='author@example.com'
+        )
+        cls.buyer = User.objects.create(
+            username='buyer', email='buyer@example.com'
+        )
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {i}', slug=f'tag-{i}',
+                               color='#49B64E')
+            for i in range(3)
+        ]
+        cls.ingredients = list(Ingredient.objects.order_by('id')[:4])
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Текст', cooking_time=10
+        )
+        TagsInRecipe.objects.bulk_create(
+            TagsInRecipe(recipe=cls.recipe, tag=tag) for tag in cls.tags[:2]
+        )
+        IngredientsInRecipe.objects.bulk_create(
+            IngredientsInRecipe(
+                recipe=cls.recipe, ingredient=ingredient, amount=amount
+            ) for ingredient, amount in zip(cls.ingredients, (10, 20, 30))
+        )
+        ShoppingCart.objects.insert_ignore([
+            ShoppingCart(user=cls.buyer, recipe=cls.recipe)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+        self.rows = dict(self.recipe.ingredients_in_recipe.values_list(
+            'ingredient_id', 'id'
+        ))
+
+    def patch(self, **data):
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.id}/', data, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def recipe_ingredients(self):
+        return {
+            ingredient_id: (row_id, amount) for row_id, ingredient_id, amount
+            in self.recipe.ingredients_in_recipe.values_list(
+                'id', 'ingredient_id', 'amount'
+            )
+        }
+
+    def shopping_list(self):
+        return dict(self.buyer.shopping_list.values_list(
+            'ingredient_id', 'amount'
+        ))
+
+    def assertShoppingListsConsistent(self):
+        self.assertEqual(
+            sorted(ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            )),
+            sorted(ShoppingListItem.objects.expected())
+        )
+
+    def test_ingredients_diff(self):
+        unchanged, changed, removed, added = self.ingredients
+        data = self.patch(ingredients=[
+            {'id': unchanged.id, 'amount': 10},
+            {'id': changed.id, 'amount': 25},
+            {'id': added.id, 'amount': 5},
+        ])
+        rows = self.recipe_ingredients()
+        self.assertEqual(rows[unchanged.id], (self.rows[unchanged.id], 10))
+        self.assertEqual(rows[changed.id], (self.rows[changed.id], 25))
+        self.assertNotIn(removed.id, rows)
+        self.assertEqual(rows[added.id][1], 5)
+        self.assertNotIn(rows[added.id][0], self.rows.values())
+        self.assertEqual(
+            {item['id']: item['amount'] for item in data['ingredients']},
+            {unchanged.id: 10, changed.id: 25, added.id: 5}
+        )
+        self.assertEqual(self.shopping_list(), {
+            unchanged.id: 10, changed.id: 25, added.id: 5
+        })
+        self.assertShoppingListsConsistent()
+
+    def test_changed_rows_are_written_with_one_update(self):
+        first, second, third, _ = self.ingredients
+        with CaptureQueriesContext(connection) as queries:
+            self.patch(ingredients=[
+                {'id': first.id, 'amount': 11},
+                {'id': second.id, 'amount': 21},
+                {'id': third.id, 'amount': 30},
+            ])
+        table = IngredientsInRecipe._meta.db_table
+        updates = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith(f'UPDATE "{table}"')
+        ]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.shopping_list(), {
+            first.id: 11, second.id: 21, third.id: 30
+        })
+
+    def test_removed_rows_skip_post_delete(self):
+        deleted = []
+
+        def receiver(sender, instance, **kwargs):
+            deleted.append(instance)
+
+        post_delete.connect(receiver, sender=IngredientsInRecipe)
+        self.addCleanup(
+            post_delete.disconnect, receiver, sender=IngredientsInRecipe
+        )
+        first, second, third, _ = self.ingredients
+        self.patch(ingredients=[{'id': first.id, 'amount': 10}])
+        self.assertEqual(deleted, [])
+        self.assertEqual(list(self.recipe_ingredients()), [first.id])
+        # Разница применена ровно один раз.
+        self.assertEqual(self.shopping_list(), {first.id: 10})
+        self.assertShoppingListsConsistent()
+
+    def test_duplicate_rows_are_collapsed(self):
+        first, second, third, _ = self.ingredients
+        IngredientsInRecipe.objects.create(
+            recipe=self.recipe, ingredient=first, amount=1
+        )
+        self.assertEqual(self.shopping_list()[first.id], 11)
+        self.patch(ingredients=[
+            {'id': first.id, 'amount': 10},
+            {'id': second.id, 'amount': 20},
+            {'id': third.id, 'amount': 30},
+        ])
+        self.assertEqual(
+            self.recipe.ingredients_in_recipe.filter(
+                ingredient=first
+            ).count(),
+            1
+        )
+        self.assertEqual(self.shopping_list(), {
+            first.id: 10, second.id: 20, third.id: 30
+        })
+        self.assertShoppingListsConsistent()
+
+    def test_tags_diff(self):
+        kept, removed, added = self.tags
+        kept_row = self.recipe.tags_in_recipe.get(tag=kept).id
+        data = self.patch(tags=[kept.id, added.id])
+        self.assertEqual(
+            dict(self.recipe.tags_in_recipe.values_list('tag_id', 'id'))[
+                kept.id
+            ],
+            kept_row
+        )
+        self.assertEqual(
+            set(self.recipe.tags_in_recipe.values_list('tag_id', flat=True)),
+            {kept.id, added.id}
+        )
+        self.assertEqual(
+            {tag['id'] for tag in data['tags']}, {kept.id, added.id}
+        )
+
+    def test_noop_patch_writes_no_relation_rows(self):
+        first, second, third, _ = self.ingredients
+        data = {
+            'ingredients': [
+                {'id': first.id, 'amount': 10},
+                {'id': second.id, 'amount': 20},
+                {'id': third.id, 'amount': 30},
+            ],
+            'tags': [tag.id for tag in self.tags[:2]],
+        }
+        with assert_max_queries(MAX_NOOP_PATCH_QUERIES):
+            with CaptureQueriesContext(connection) as queries:
+                self.patch(**data)
+        tables = (
+            IngredientsInRecipe._meta.db_table,
+            TagsInRecipe._meta.db_table,
+            ShoppingListItem._meta.db_table,
+        )
+        writes = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].split(' ', 1)[0] in ('INSERT', 'UPDATE', 'DELETE')
+            and any(f'"{table}"' in query['sql'] for table in tables)
+        ]
+        self.assertEqual(writes, [])
+        self.assertEqual(self.shopping_list(), {
+            first.id: 10, second.id: 20, third.id: 30
+        })
+
+
+class ConditionalGetTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author', email='author@example.com'
+        )
+        cls.tag = Tag.objects.create(
+            name='Завтрак', slug='breakfast', color='#E26C2D'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Текст', cooking_time=5
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        caches[settings.RECIPE_CACHE_ALIAS].clear()
+
+    def test_unchanged_list_is_not_modified(self):
+        for url in ('/api/tags/', '/api/ingredients/',
+                    f'/api/recipes/{self.recipe.id}/'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                etag = response['ETag']
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+                self.assertEqual(response.content, b'')
+
+    def test_change_produces_new_etag(self):
+        etag = self.client.get('/api/tags/')['ETag']
+        Tag.objects.create(name='Обед', slug='lunch', color='#49B64E')
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()), 2)
+
+        url = f'/api/recipes/{self.recipe.id}/'
+        etag = self.client.get(url)['ETag']
+        self.recipe.name = 'Новое название'
+        self.recipe.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'Новое название')
+
+    def test_etag_depends_on_viewer(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        etag = self.client.get(url)['ETag']
+        self.client.force_authenticate(self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Authorization', response['Vary'])
+
+    def test_if_modified_since(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        response = self.client.get(url)
+        last_modified = response['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(0))
+        self.assertEqual(response.status_code, 200)
+
+    def test_missing_recipe_is_not_found(self):
+        url = '/api/recipes/999999/'
+        for headers in (
+            {'HTTP_IF_NONE_MATCH': '*'},
+            {'HTTP_IF_MODIFIED_SINCE': http_date(2 ** 32)},
+            {'HTTP_IF_NONE_MATCH': self.client.get(url).get('ETag', '"x"')},
+        ):
+            with self.subTest(headers=headers):
+                self.assertEqual(
+                    self.client.get(url, **headers).status_code, 404
+                )
+
+    def test_deleted_recipe_is_not_found(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        response = self.client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.recipe.delete()
+        for headers in (
+            {'HTTP_IF_NONE_MATCH': '*'},
+            {'HTTP_IF_NONE_MATCH': etag},
+            {'HTTP_IF_MODIFIED_SINCE': last_modified},
+        ):
+            with self.subTest(headers=headers):
+                self.assertEqual(
+                    self.client.get(url, **headers).status_code, 404
+                )
+
+    def test_wildcard_runs_handler(self):
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['slug'], 'breakfast')
+
+
+def image_data_uri(image_format, size=(4, 3), mime=None):
+    buffer = BytesIO()
+    Image.new('RGB', size, '#49B64E').save(buffer, image_format)
+    mime = mime or Image.MIME[image_format]
+    return f'data:{mime};base64,{b64encode(buffer.getvalue()).decode()}'
+
+
+class Base64ImageFieldTest(TestCase):
+
+    def assertInvalid(self, data, code):
+        with self.assertRaises(ValidationError) as raised:
+            Base64ImageField().to_internal_value(data)
+        self.assertEqual(raised.exception.detail[0].code, code)
+
+    def test_supported_formats(self):
+        for image_format, extension in (
+            ('JPEG', 'jpg'), ('PNG', 'png'), ('GIF', 'gif'), ('WEBP', 'webp')
+        ):
+            with self.subTest(image_format=image_format):
+                file = Base64ImageField().to_internal_value(
+                    image_data_uri(image_format)
+                )
+                self.assertTrue(file.name.endswith(f'.{extension}'))
+                self.assertEqual(file.content_type, Image.MIME[image_format])
+                self.assertEqual(Image.open(file).size, (4, 3))
+
+    def test_base64_without_header(self):
+        data = image_data_uri('PNG').split(',', 1)[1]
+        file = Base64ImageField().to_internal_value(data)
+        self.assertTrue(file.name.endswith('.png'))
+
+    def test_whitespace_is_ignored(self):
+        header, payload = image_data_uri('PNG').split(',', 1)
+        data = header + ',' + '\n'.join(
+            payload[i:i + 10] for i in range(0, len(payload), 10)
+        )
+        self.assertEqual(
+            Image.open(Base64ImageField().to_internal_value(data)).size,
+            (4, 3)
+        )
+
+    def test_unsupported_format(self):
+        self.assertInvalid(image_data_uri('BMP'), 'invalid_image')
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=100)
+    def test_byte_limit(self):
+        self.assertInvalid(image_data_uri('PNG', (64, 64)), 'max_size')
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=100)
+    def test_pixel_limit(self):
+        Base64ImageField().to_internal_value(image_data_uri('PNG', (10, 10)))
+        self.assertInvalid(image_data_uri('PNG', (11, 10)), 'max_pixels')
+
+    def test_invalid_base64(self):
+        header, payload = image_data_uri('PNG').split(',', 1)
+        for data, code in (
+            (f'{header},{payload[:-1]}', 'invalid'),
+            (f'{header},=={payload}', 'invalid'),
+            (123, 'invalid'),
+            (f'{header},', 'invalid_image'),
+            (f'{header},{b64encode(b"not an image").decode()}',
+             'invalid_image'),
+        ):
+            with self.subTest(data=str(data)[:40]):
+                self.assertInvalid(data, code)
+
+    def test_bad_data_uri_header(self):
+        payload = image_data_uri('PNG').split(',', 1)[1]
+        for header in (
+            'data:text/plain;base64',
+            'data:image/png',
+            'data:image/png;charset=utf-8',
+            'data:;base64',
+            'data:image/png;base64' + ' ' * 100,
+        ):
+            with self.subTest(header=header):
+                self.assertInvalid(f'{header},{payload}', 'invalid')
+        self.assertInvalid(f'data:image/png;base64{payload}', 'invalid')
+
+    def test_recipe_accepts_webp(self):
+        media_root = mkdtemp()
+        self.addCleanup(rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        user = User.objects.create(username='cook', email='cook@example.com')
+        tag = Tag.objects.create(name='Ужин', slug='dinner', color='#8775D2')
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post('/api/recipes/', {
+            'ingredients': [
+                {'id': Ingredient.objects.order_by('id')[0].id, 'amount': 1}
+            ],
+            'tags': [tag.id],
+            'image': image_data_uri('WEBP'),
+            'name': 'Рецепт',
+            'text': 'Текст',
+            'cooking_time': 5,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.json())
+        self.assertTrue(response.json()['image'].endswith('.webp'))
+
+
+class CookableTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author', email='author@example.com'
+        )
+        cls.ingredients = [
+            ingredient.id
+            for ingredient in Ingredient.objects.order_by('id')[:4]
+        ]
+        first, second, third, fourth = cls.ingredients
+        cls.recipes = {}
+        for name, ingredients in (
+            ('full', (first, second)),
+            ('half', (first, third)),
+            ('third', (second, third, fourth)),
+            ('none', (fourth,)),
+        ):
+            recipe = Recipe.objects.create(
+                author=cls.author, name=name, text='Текст', cooking_time=5
+            )
+            IngredientsInRecipe.objects.bulk_create(
+                IngredientsInRecipe(
+                    recipe=recipe, ingredient_id=ingredient_id, amount=1
+                ) for ingredient_id in ingredients
+            )
+            cls.recipes[name] = recipe.id
+
+    def setUp(self):
+        recipe_ingredient_index.postings = None
+        self.addCleanup(setattr, recipe_ingredient_index, 'postings', None)
+
+    def cookable(self, *ingredients, limit=None):
+        params = {'ingredients': ','.join(map(str, ingredients))}
+        if limit is not None:
+            params['limit'] = limit
+        response = APIClient().get('/api/recipes/cookable/', params)
+        self.assertEqual(response.status_code, 200)
+        return [
+            (recipe['name'], recipe['coverage'], recipe['missing'])
+            for recipe in response.json()
+        ]
+
+    def test_ranked_by_coverage_then_missing(self):
+        first, second, _, _ = self.ingredients
+        self.assertEqual(self.cookable(first, second), [
+            ('full', 1.0, 0), ('half', 0.5, 1), ('third', 0.3333, 2),
+        ])
+        self.assertEqual(self.cookable(first, second, limit=1), [
+            ('full', 1.0, 0),
+        ])
+
+    def test_invalid_params(self):
+        for params in ({}, {'ingredients': 'a,b'}, {'ingredients': ','},
+                       {'ingredients': '1', 'limit': 0}):
+            with self.subTest(params=params):
+                response = APIClient().get('/api/recipes/cookable/', params)
+                self.assertEqual(response.status_code, 400)
+
+    def test_index_follows_recipe_changes(self):
+        first, second, third, fourth = self.ingredients
+        self.cookable(first)
+        with self.captureOnCommitCallbacks(execute=True):
+            IngredientsInRecipe.objects.create(
+                recipe_id=self.recipes['none'], ingredient_id=first, amount=1
+            )
+            Recipe.objects.filter(id=self.recipes['full']).delete()
+        self.assertEqual(sorted(self.cookable(first)), [
+            ('half', 0.5, 1), ('none', 0.5, 1),
+        ])
+
+    def test_invalidate_waits_for_lock(self):
+        index = RecipeIngredientIndex()
+        index.lock.acquire()
+        thread = threading.Thread(target=index.invalidate, args=(1,))
+        thread.start()
+        thread.join(timeout=0.1)
+        self.assertTrue(thread.is_alive())
+        self.assertEqual(index.stale, set())
+        index.lock.release()
+        thread.join()
+        self.assertEqual(index.stale, {1})
+
+
+class RecipeCacheTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author', email='author@example.com'
+        )
+        cls.reader = User.objects.create(
+            username='reader', email='reader@example.com'
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {i}', text='Текст',
+                cooking_time=i + 1
+            ) for i in range(3)
+        ]
+        Favorite.objects.insert_ignore([
+            Favorite(user=cls.reader, recipe=cls.recipes[0])
+        ])
+        Follow.objects.insert_ignore([
+            Follow(user=cls.reader, following=cls.author)
+        ])
+
+    def setUp(self):
+        caches[settings.RECIPE_CACHE_ALIAS].clear()
+
+    def get_many(self, user):
+        request = RequestFactory().get('/api/recipes/')
+        request.user = user
+        recipes = list(annotate_user_flags(
+            Recipe.objects.filter(author=self.author).order_by('id'), user
+        ))
+        return recipes, {'request': request}
+
+    def test_viewer_fields_are_overlaid(self):
+        recipes, context = self.get_many(self.reader)
+        data = recipe_cache.get_many(recipes, context)
+        self.assertEqual(
+            [item['id'] for item in data],
+            [recipe.id for recipe in self.recipes]
+        )
+        self.assertEqual(
+            [item['is_favorited'] for item in data], [True, False, False]
+        )
+        self.assertTrue(data[0]['author']['is_subscribed'])
+        recipes, context = self.get_many(AnonymousUser())
+        data = recipe_cache.get_many(recipes, context)
+        self.assertEqual(
+            [item['is_favorited'] for item in data], [False] * 3
+        )
+        self.assertFalse(data[0]['author']['is_subscribed'])
+
+    def test_hits_and_invalidation(self):
+        recipes, context = self.get_many(AnonymousUser())
+        recipe_cache.get_many(recipes, context)
+        recipe_cache.get_many(recipes, context)
+        self.assertEqual(recipe_cache.stats(), {
+            'hits': 3, 'misses': 3, 'hit_ratio': 0.5
+        })
+        Recipe.objects.filter(id=self.recipes[1].id).update(name='Новое')
+        recipe = Recipe.objects.get(id=self.recipes[1].id)
+        recipe.save()
+        recipes, context = self.get_many(AnonymousUser())
+        data = recipe_cache.get_many(recipes, context)
+        self.assertEqual(data[1]['name'], 'Новое')
+        self.assertEqual(recipe_cache.stats()['misses'], 4)
+
+    def test_recipe_deleted_after_page_query_is_skipped(self):
+        recipes, context = self.get_many(AnonymousUser())
+        Recipe.objects.filter(id=self.recipes[1].id).delete()
+        data = recipe_cache.get_many(recipes, context)
+        self.assertEqual(
+            [item['id'] for item in data],
+            [self.recipes[0].id, self.recipes[2].id]
+        )
+
+
+class DownloadShoppingCartTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='buyer', email='buyer@example.com'
+        )
+        cls.salt, cls.sugar = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Соль, морская', 'Сахар "тростниковый"')
+        )
+        recipes = [
+            Recipe.objects.create(
+                author=cls.user, name=f'Рецепт {i}', text='Текст',
+                cooking_time=5
+            ) for i in range(2)
+        ]
+        IngredientsInRecipe.objects.bulk_create([
+            IngredientsInRecipe(
+                recipe=recipes[0], ingredient=cls.salt, amount=5
+            ),
+            IngredientsInRecipe(
+                recipe=recipes[0], ingredient=cls.sugar, amount=100
+            ),
+            IngredientsInRecipe(
+                recipe=recipes[1], ingredient=cls.salt, amount=10
+            ),
+        ])
+        ShoppingCart.objects.insert_ignore(
+            ShoppingCart(user=cls.user, recipe=recipe) for recipe in recipes
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def download(self, file_format):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/', {'format': file_format}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            response['Content-Disposition'],
+            f'attachment; filename="list.{file_format}"'
+        )
+        return b''.join(response.streaming_content).decode()
+
+    def test_txt(self):
+        self.assertEqual(self.download('txt'), (
+            'Сахар "тростниковый" (г) — 100 \n'
+            'Соль, морская (г) — 15 \n'
+        ))
+
+    def test_csv(self):
+        self.assertEqual(self.download('csv').splitlines(), [
+            'name,measurement_unit,amount',
+            '"Сахар ""тростниковый""",г,100',
+            '"Соль, морская",г,15',
+        ])
+
+    def test_json(self):
+        self.assertEqual(json.loads(self.download('json')), [
+            {'name': 'Сахар "тростниковый"', 'measurement_unit': 'г',
+             'amount': 100},
+            {'name': 'Соль, морская', 'measurement_unit': 'г', 'amount': 15},
+        ])
+
+    def test_empty_list_is_not_found(self):
+        ShoppingCart.objects.filter(user=self.user).remove()
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_anonymous(self):
+        response = APIClient().get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(response.status_code, 401)
+
+
+class IngredientSearchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.found = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Зюзюка', 'зюзюка тёртая', 'Сушёная зюзюка')
+        ]
+
+    def setUp(self):
+        ingredient_index.invalidate()
+        self.addCleanup(ingredient_index.invalidate)
+
+    def search(self, **params):
+        response = APIClient().get('/api/ingredients/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_prefix_matches_first_then_substring(self):
+        self.assertEqual(self.search(name='ЗЮЗЮ'), [
+            {'id': ingredient.id, 'measurement_unit': 'г',
+             'name': ingredient.name}
+            for ingredient in self.found
+        ])
+        self.assertEqual(
+            [row['name'] for row in self.search(name='тёрт')],
+            ['зюзюка тёртая']
+        )
+        self.assertEqual(self.search(name='нет такого'), [])
+
+    def test_without_name_returns_catalog(self):
+        data = self.search()
+        self.assertEqual(len(data), Ingredient.objects.count())
+        names = [row['name'].casefold() for row in data]
+        self.assertEqual(names, sorted(names))
+
+    def test_index_follows_catalog_version(self):
+        self.search(name='зюзю')
+        Ingredient.objects.bulk_create([
+            Ingredient(name='Зюзюка вяленая', measurement_unit='г')
+        ])
+        self.assertEqual(len(self.search(name='зюзю')), 3)
+        ModelVersion.objects.bump(ModelVersion.INGREDIENTS)
+        self.assertEqual(len(self.search(name='зюзю')), 4)
+
+
+class SubscriptionFlagTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create(
+            username='reader', email='reader@example.com'
+        )
+        cls.authors = [
+            User.objects.create(
+                username=f'author{i}', email=f'author{i}@example.com'
+            ) for i in range(6)
+        ]
+        Follow.objects.insert_ignore(
+            Follow(user=cls.reader, following=author)
+            for author in cls.authors[::2]
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.authors[0], name='Рецепт', text='Текст',
+            cooking_time=5
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+        caches[settings.RECIPE_CACHE_ALIAS].clear()
+
+    def subscribed(self, page):
+        response = self.client.get('/api/users/', {'page': page})
+        self.assertEqual(response.status_code, 200)
+        return {
+            user['id']: user['is_subscribed']
+            for user in response.json()['results']
+        }
+
+    def test_users_list(self):
+        followed = {author.id for author in self.authors[::2]}
+        self.assertEqual({**self.subscribed(1), **self.subscribed(2)}, {
+            user.id: user.id in followed
+            for user in [self.reader, *self.authors]
+        })
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        with CaptureQueriesContext(connection) as short_page:
+            self.assertEqual(len(self.subscribed(2)), 1)
+        with self.assertNumQueries(len(short_page.captured_queries)):
+            self.assertEqual(len(self.subscribed(1)), 6)
+
+    def test_recipe_author(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        self.assertTrue(self.client.get(url).json()['author']['is_subscribed'])
+        response = self.client.delete(
+            f'/api/users/{self.authors[0].id}/subscribe/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(
+            self.client.get(url).json()['author']['is_subscribed']
+        )
+        self.assertFalse(
+            APIClient().get(url).json()['author']['is_subscribed']
+        )
+
+
+class SubscriptionListTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create(
+            username='reader', email='reader@example.com'
+        )
+        cls.authors = [
+            User.objects.create(
+                username=f'author{i}', email=f'author{i}@example.com'
+            ) for i in range(4)
+        ]
+        Follow.objects.insert_ignore(
+            Follow(user=cls.reader, following=author)
+            for author in cls.authors[:3]
+        )
+        cls.recipes = {}
+        for i, author in enumerate(cls.authors):
+            cls.recipes[author.id] = [
+                Recipe.objects.create(
+                    author=author, name=f'Рецепт {j}', text='Текст',
+                    cooking_time=j % 3 + 1
+                ) for j in range(i + 1)
+            ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def subscriptions(self, **params):
+        response = self.client.get('/api/users/subscriptions/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def ordered_ids(self, author):
+        return [
+            recipe.id for recipe in sorted(
+                self.recipes[author.id],
+                key=lambda recipe: (recipe.cooking_time, recipe.id),
+                reverse=True
+            )
+        ]
+
+    def test_recipes_limit_and_counts(self):
+        data = self.subscriptions(recipes_limit=2)
+        self.assertEqual(data['count'], 3)
+        results = data['results']
+        self.assertEqual(
+            [row['id'] for row in results],
+            [author.id for author in self.authors[:3]]
+        )
+        for author, row in zip(self.authors, results):
+            with self.subTest(author=author.username):
+                self.assertTrue(row['is_subscribed'])
+                self.assertEqual(row['email'], author.email)
+                self.assertEqual(
+                    row['recipes_count'], len(self.recipes[author.id])
+                )
+                self.assertEqual(
+                    [recipe['id'] for recipe in row['recipes']],
+                    self.ordered_ids(author)[:2]
+                )
+                self.assertEqual(
+                    set(row['recipes'][0]),
+                    {'id', 'name', 'image', 'thumbnail', 'cooking_time'}
+                )
+
+    def test_without_or_with_bad_limit_returns_all_recipes(self):
+        for params in ({}, {'recipes_limit': 'много'}):
+            with self.subTest(params=params):
+                results = self.subscriptions(**params)['results']
+                self.assertEqual(
+                    [len(row['recipes']) for row in results], [1, 2, 3]
+                )
+        results = self.subscriptions(recipes_limit=-1)['results']
+        self.assertEqual([row['recipes'] for row in results], [[], [], []])
+
+    def test_query_count_does_not_depend_on_authors(self):
+        with CaptureQueriesContext(connection) as one_author:
+            self.subscriptions(limit=1, recipes_limit=2)
+        with self.assertNumQueries(len(one_author.captured_queries)):
+            self.subscriptions(limit=3, recipes_limit=2)
+
+
+class FeedTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader, cls.followed, cls.other = (
+            User.objects.create(username=name, email=f'{name}@example.com')
+            for name in ('reader', 'followed', 'other')
+        )
+        Follow.objects.insert_ignore([
+            Follow(user=cls.reader, following=cls.followed)
+        ])
+        for author in (cls.followed, cls.other, cls.reader):
+            for i in range(3):
+                Recipe.objects.create(
+                    author=author, name=f'Рецепт {i}', text='Текст',
+                    cooking_time=i + 1
+                )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+        caches[settings.RECIPE_CACHE_ALIAS].clear()
+
+    def feed_ids(self):
+        response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_only_followed_authors(self):
+        self.assertEqual(self.feed_ids(), list(
+            Recipe.objects.filter(author=self.followed).order_by(
+                '-cooking_time', '-id'
+            ).values_list('id', flat=True)
+        ))
+
+    def test_follow_and_unfollow(self):
+        url = f'/api/users/{self.other.id}/subscribe/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(len(self.feed_ids()), 6)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(len(self.feed_ids()), 3)
+        Follow.objects.filter(user=self.reader).remove()
+        self.assertEqual(self.feed_ids(), [])
+
+    def test_anonymous(self):
+        response = APIClient().get('/api/recipes/feed/')
+        self.assertEqual(response.status_code, 401)
+
+
+class RecipeFilterTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.other = (
+            User.objects.create(username=name, email=f'{name}@example.com')
+            for name in ('cook', 'other')
+        )
+        cls.breakfast, cls.lunch, cls.dinner = (
+            Tag.objects.create(name=name, slug=slug, color='#49B64E')
+            for name, slug in (
+                ('Завтрак', 'breakfast'), ('Обед', 'lunch'), ('Ужин', 'dinner')
+            )
+        )
+        cls.recipes = {}
+        for name, author, tags in (
+            ('breakfast', cls.user, (cls.breakfast,)),
+            ('lunch', cls.user, (cls.lunch,)),
+            ('both', cls.other, (cls.breakfast, cls.lunch)),
+            ('untagged', cls.other, ()),
+        ):
+            recipe = Recipe.objects.create(
+                author=author, name=name, text='Текст', cooking_time=5
+            )
+            TagsInRecipe.objects.bulk_create(
+                TagsInRecipe(recipe=recipe, tag=tag) for tag in tags
+            )
+            cls.recipes[name] = recipe
+        Favorite.objects.insert_ignore([
+            Favorite(user=cls.user, recipe=cls.recipes['lunch']),
+            Favorite(user=cls.user, recipe=cls.recipes['both']),
+        ])
+        ShoppingCart.objects.insert_ignore([
+            ShoppingCart(user=cls.user, recipe=cls.recipes['breakfast']),
+        ])
+
+    def setUp(self):
+        tag_slug_map.invalidate()
+        self.addCleanup(tag_slug_map.invalidate)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        caches[settings.RECIPE_CACHE_ALIAS].clear()
+
+    def names(self, query, client=None):
+        response = (client or self.client).get(f'/api/recipes/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return {recipe['name'] for recipe in response.json()['results']}
+
+    def test_tags(self):
+        self.assertEqual(
+            self.names('tags=breakfast'), {'breakfast', 'both'}
+        )
+        self.assertEqual(
+            self.names('tags=breakfast&tags=lunch'),
+            {'breakfast', 'lunch', 'both'}
+        )
+        self.assertEqual(self.names('tags=dinner'), set())
+
+    def test_unknown_tag_is_rejected(self):
+        response = self.client.get('/api/recipes/?tags=brunch')
+        self.assertEqual(response.status_code, 400)
+
+    def test_new_tag_is_seen_after_commit(self):
+        self.names('tags=breakfast')
+        with self.captureOnCommitCallbacks(execute=True):
+            brunch = Tag.objects.create(
+                name='Бранч', slug='brunch', color='#8775D2'
+            )
+        TagsInRecipe.objects.create(
+            recipe=self.recipes['untagged'], tag=brunch
+        )
+        self.assertEqual(self.names('tags=brunch'), {'untagged'})
+
+    def test_user_lists(self):
+        self.assertEqual(self.names('is_favorited=1'), {'lunch', 'both'})
+        self.assertEqual(
+            self.names('is_favorited=0'), {'breakfast', 'untagged'}
+        )
+        self.assertEqual(self.names('is_in_shopping_cart=1'), {'breakfast'})
+        self.assertEqual(
+            self.names('is_favorited=1&tags=breakfast'), {'both'}
+        )
+        self.assertEqual(self.names('is_favorited=1', APIClient()), set())
+        self.assertEqual(len(self.names('is_favorited=0', APIClient())), 4)
+
+    def test_author(self):
+        self.assertEqual(
+            self.names(f'author={self.other.id}'), {'both', 'untagged'}
+        )
+
+
+class RecipeSearchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='cook', email='cook@example.com'
+        )
+        cls.recipes = {
+            key: Recipe.objects.create(
+                author=cls.user, name=name, text=text, cooking_time=5
+            ) for key, name, text in (
+                ('borscht', 'Борщ с пампушками', 'Свёкла, капуста, чеснок'),
+                ('garlic', 'Чесночный соус', 'Чеснок и сметана'),
+                ('salad', 'Салат', 'Огурцы и сметана'),
+            )
+        }
+
+    def setUp(self):
+        self.client = APIClient()
+        caches[settings.RECIPE_CACHE_ALIAS].clear()
+
+    def names(self, query):
+        response = self.client.get('/api/recipes/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return {recipe['name'] for recipe in response.json()['results']}
+
+    def test_name_and_text_are_searched(self):
+        self.assertEqual(self.names('сметана'), {
+            'Чесночный соус', 'Салат'
+        })
+        self.assertEqual(self.names('борщ'), {'Борщ с пампушками'})
+        self.assertEqual(self.names('пампуш'), {'Борщ с пампушками'})
+        self.assertEqual(self.names('сметана огурцы'), {'Салат'})
+        self.assertEqual(self.names('ананас'), set())
+        self.assertEqual(self.names('"*'), set())
+
+    def test_name_match_ranks_first(self):
+        recipes = fulltext.search(Recipe.objects.all(), 'чесночный')
+        self.assertEqual(list(recipes), [self.recipes['garlic']])
+        recipe = Recipe.objects.create(
+            author=self.user, name='Суп', cooking_time=5,
+            text='Чесночный, чесночный и ещё раз чесночный'
+        )
+        self.assertEqual(
+            list(fulltext.search(Recipe.objects.all(), 'чесночный')),
+            [self.recipes['garlic'], recipe]
+        )
+
+    def test_index_follows_changes(self):
+        salad = self.recipes['salad']
+        salad.name = 'Винегрет'
+        salad.save()
+        self.assertEqual(self.names('салат'), set())
+        self.assertEqual(self.names('винегрет'), {'Винегрет'})
+        salad.text = 'Свёкла и горошек'
+        salad.save(update_fields=['cooking_time'])
+        self.assertEqual(self.names('горошек'), set())
+        salad.save(update_fields=['text'])
+        self.assertEqual(self.names('горошек'), {'Винегрет'})
+        self.recipes['borscht'].delete()
+        self.assertEqual(self.names('свёкла'), {'Винегрет'})
+        self.assertEqual(
+            list(fulltext.search(Recipe.objects.all(), 'капуста')), []
+        )
+
+
+class ProjectionsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='cook', email='cook@example.com',
+            first_name='Иван', last_name='Поваров'
+        )
+        tags = [
+            Tag.objects.create(name=name, slug=slug, color='#49B64E')
+            for name, slug in (('Ужин', 'dinner'), ('Завтрак', 'breakfast'))
+        ]
+        ingredients = list(Ingredient.objects.order_by('id')[:3])
+        cls.recipes = []
+        for i, (image, thumbnail) in enumerate((
+            ('recipes/a.png', 'recipes/a_320.webp'),
+            ('recipes/b.png', ''),
+            ('', ''),
+        )):
+            recipe = Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {i}', text='Текст',
+                cooking_time=5 + i
+            )
+            Recipe.objects.filter(pk=recipe.pk).update(
+                image=image, thumbnail=thumbnail
+            )
+            TagsInRecipe.objects.bulk_create(
+                TagsInRecipe(recipe=recipe, tag=tag) for tag in tags[i:]
+            )
+            IngredientsInRecipe.objects.bulk_create(
+                IngredientsInRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=10 * j + i
+                ) for j, ingredient in enumerate(ingredients[i:], 1)
+            )
+            cls.recipes.append(recipe)
+
+    def queryset(self):
+        return Recipe.objects.filter(
+            id__in=[recipe.id for recipe in self.recipes]
+        ).order_by('id')
+
+    def test_recipes_match_cache_serializer(self):
+        recipes = projections.recipes([recipe.id for recipe in self.recipes])
+        for recipe in self.queryset():
+            with self.subTest(recipe=recipe.name):
+                expected = RecipeCacheSerializer(
+                    recipe, context={'request': None}
+                ).data
+                self.assertEqual(
+                    json.dumps(recipes[recipe.id]), json.dumps(expected)
+                )
+                self.assertEqual(
+                    tuple(recipes[recipe.id]), projections.RECIPE_FIELDS
+                )
+
+    def test_minified_recipes_match_serializer(self):
+        request = RequestFactory().get('/api/users/subscriptions/')
+        for context_request in (None, request):
+            with self.subTest(request=context_request):
+                recipes = projections.minified_recipes(
+                    self.queryset(), context_request
+                )
+                for recipe in recipes:
+                    self.assertEqual(recipe.pop('author_id'), self.author.id)
+                self.assertEqual(
+                    json.dumps(recipes),
+                    json.dumps(RecipeMinifiedSerializer(
+                        self.queryset(), many=True,
+                        context={'request': context_request}
+                    ).data)
+                )
+        self.assertTrue(recipes[0]['image'].startswith('http://testserver/'))
+        self.assertTrue(recipes[1]['thumbnail'].endswith('/recipes/b.png'))
+        self.assertIsNone(recipes[2]['thumbnail'])
+
+    def test_benchmark_command_finds_no_differences(self):
+        stdout = StringIO()
+        call_command(
+            'benchmark_serializers', '--authors', '3', '--recipes', '12',
+            '--page-size', '5', '--repeat', '1', stdout=stdout
+        )
+        self.assertIn('recipes:', stdout.getvalue())
+        self.assertIn('subscriptions:', stdout.getvalue())
+
+
+class FastJSONRendererTest(TestCase):
+    data = {
+        'name': 'Борщ\u2028с\u2029пампушками',
+        'amount': Decimal('1.5'),
+        'tags': [1, 2],
+        'nested': {'empty': None, 'flag': True},
+    }
+
+    def render(self, data, media_type=None):
+        return FastJSONRenderer().render(data, media_type)
+
+    def test_output_matches_json_renderer(self):
+        for orjson in (renderers.orjson, None):
+            with self.subTest(orjson=orjson is not None), \
+                    mock.patch.object(renderers, 'orjson', orjson):
+                ret = self.render(self.data)
+                self.assertEqual(json.loads(ret), json.loads(
+                    JSONRenderer().render(self.data)
+                ))
+                self.assertNotIn('\u2028'.encode(), ret)
+                self.assertNotIn('\u2029'.encode(), ret)
+                self.assertEqual(self.render(None), b'')
+
+    def test_indent_uses_json(self):
+        ret = self.render(self.data, 'application/json; indent=2')
+        self.assertIn(b'\n  "name"', ret)
+        self.assertEqual(json.loads(ret)['amount'], 1.5)
+
+    def test_fragments_are_inserted_as_is(self):
+        fragment = JSONFragment.encode(self.data)
+        for orjson in (renderers.orjson, None):
+            with self.subTest(orjson=orjson is not None), \
+                    mock.patch.object(renderers, 'orjson', orjson):
+                data = {
+                    'id': 1,
+                    'recipe': fragment,
+                    'list': [fragment, JSONFragment(b'[]')],
+                    'text': '"json-fragment-0:0"',
+                }
+                ret = self.render(data)
+                self.assertIn(bytes(fragment), ret)
+                parsed = json.loads(ret)
+                expected = json.loads(fragment)
+                self.assertEqual(parsed['recipe'], expected)
+                self.assertEqual(parsed['list'], [expected, []])
+                self.assertEqual(parsed['text'], data['text'])
+                self.assertEqual(self.render(fragment), bytes(fragment))
+
+
+class SQLProfilingTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='cook', email='cook@example.com'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='Рецепт', text='Текст', cooking_time=5
+        )
+
+    def test_normalize(self):
+        self.assertEqual(
+            normalize(
+                "SELECT * FROM t WHERE a = 'it''s' AND b = 1.5 "
+                "AND c IN (1, 2, 3) AND d IN (%s, %s) AND e2 = %s"
+            ),
+            'SELECT * FROM t WHERE a = ? AND b = ? '
+            'AND c IN (...) AND d IN (...) AND e2 = ?'
+        )
+
+    def test_assert_max_queries(self):
+        with assert_max_queries(2) as log:
+            list(User.objects.all())
+            list(User.objects.all())
+        self.assertEqual(log.count, 2)
+        with self.assertRaisesRegex(AssertionError, '2 x SELECT') as error:
+            with assert_max_queries(1):
+                list(Recipe.objects.filter(id=1))
+                list(Recipe.objects.filter(id=2))
+        self.assertIn('Выполнено 2 запросов', str(error.exception))
+
+    def test_repeated_queries_are_logged(self):
+        def get_response(request):
+            for pk in range(3):
+                list(Recipe.objects.filter(pk=pk))
+            User.objects.count()
+            return HttpResponse()
+
+        request = RequestFactory().get('/api/recipes/')
+        with override_settings(SQL_PROFILING_REPEAT_THRESHOLD=2):
+            middleware = SQLProfilingMiddleware(get_response)
+        with self.assertLogs('api.profiling', 'WARNING') as logs:
+            response = middleware(request)
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('3 раз', logs.output[0])
+        self.assertIn('/api/recipes/', logs.output[0])
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('desc="4 sql"', response['Server-Timing'])
+
+    @modify_settings(MIDDLEWARE={
+        'prepend': 'api.profiling.SQLProfilingMiddleware'
+    })
+    @override_settings(SQL_PROFILING_REPEAT_THRESHOLD=0)
+    def test_server_timing_header(self):
+        caches[settings.RECIPE_CACHE_ALIAS].clear()
+        with self.assertLogs('api.profiling', 'WARNING') as logs:
+            response = APIClient().get(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(response.status_code, 200)
+        phases = [
+            phase.split(';')[0]
+            for phase in response['Server-Timing'].split(', ')
+        ]
+        self.assertEqual(phases, ['db', 'serialize', 'render', 'total'])
+        for phase in response['Server-Timing'].split(', '):
+            duration = float(phase.split(';')[1].removeprefix('dur='))
+            self.assertGreaterEqual(duration, 0)
+        self.assertIn('api.views.RecipeViewSet', logs.output[0])
+
+
+class BatchRelationsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='cook', email='cook@example.com'
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.user, name=f'Рецепт {i}', text='Текст',
+                cooking_time=5
+            ).id for i in range(3)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def batch(self, method, url, recipes, client=None):
+        return getattr(client or self.client, method)(
+            url, {'recipes': recipes}, format='json'
+        )
+
+    def test_add_and_remove(self):
+        first, second, third = self.recipes
+        for model, url in (
+            (Favorite, '/api/recipes/favorite/'),
+            (ShoppingCart, '/api/recipes/shopping_cart/'),
+        ):
+            with self.subTest(url=url):
+                model.objects.insert_ignore([
+                    model(user=self.user, recipe_id=first)
+                ])
+                response = self.batch(
+                    'post', url, [first, second, 999999, second]
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json(), [
+                    {'id': first, 'status': 'exists'},
+                    {'id': second, 'status': 'created'},
+                    {'id': 999999, 'status': 'not_found'},
+                ])
+                response = self.batch('delete', url, [second, third])
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json(), [
+                    {'id': second, 'status': 'deleted'},
+                    {'id': third, 'status': 'not_found'},
+                ])
+                self.assertEqual(
+                    list(model.objects.filter(user=self.user).values_list(
+                        'recipe_id', flat=True
+                    )),
+                    [first]
+                )
+
+    def test_invalid_payload(self):
+        for recipes in (
+            [], ['a'], [0], 'x', list(range(1, MAX_RECIPES_IN_BATCH + 2))
+        ):
+            with self.subTest(recipes=str(recipes)[:20]):
+                response = self.batch(
+                    'post', '/api/recipes/favorite/', recipes
+                )
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(Favorite.objects.exists())
+
+    def test_anonymous(self):
+        response = self.batch(
+            'post', '/api/recipes/favorite/', self.recipes, APIClient()
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+class RecipeCreateTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='cook', email='cook@example.com'
+        )
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {i}', slug=f'tag-{i}',
+                               color='#49B64E')
+            for i in range(2)
+        ]
+        cls.ingredients = [
+            ingredient.id
+            for ingredient in Ingredient.objects.order_by('id')[:20]
+        ]
+
+    def setUp(self):
+        media_root = mkdtemp()
+        self.addCleanup(rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create(self, ingredients, tags):
+        return self.client.post('/api/recipes/', {
+            'ingredients': ingredients,
+            'tags': tags,
+            'image': image_data_uri('PNG'),
+            'name': 'Рецепт',
+            'text': 'Текст',
+            'cooking_time': 5,
+        }, format='json')
+
+    def test_all_missing_references_in_one_error(self):
+        response = self.create(
+            [{'id': self.ingredients[0], 'amount': 1},
+             {'id': 999998, 'amount': 1}, {'id': 999999, 'amount': 1}],
+            [self.tags[0].id, 999997],
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {
+            'ingredients': ['Ингредиенты не найдены: 999998, 999999'],
+            'tags': ['Теги не найдены: 999997'],
+        })
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_repeated_ingredients_and_tags_are_merged(self):
+        first, second = self.ingredients[:2]
+        response = self.create(
+            [{'id': first, 'amount': 2}, {'id': second, 'amount': 3},
+             {'id': first, 'amount': 5}],
+            [self.tags[0].id, self.tags[0].id],
+        )
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual(
+            [(row['id'], row['amount']) for row in data['ingredients']],
+            [(first, 7), (second, 3)]
+        )
+        self.assertEqual([tag['id'] for tag in data['tags']],
+                         [self.tags[0].id])
+
+    def test_total_amount_is_limited(self):
+        first = self.ingredients[0]
+        response = self.create(
+            [{'id': first, 'amount': MAX_AMOUNT_OF_INGREDIENT},
+             {'id': first, 'amount': 1}],
+            [self.tags[0].id],
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ingredients', response.json())
+
+    def test_validation_query_count_does_not_depend_on_size(self):
+        def missing(count):
+            return self.create(
+                [{'id': ingredient_id, 'amount': 1}
+                 for ingredient_id in self.ingredients[:count]]
+                + [{'id': 999999, 'amount': 1}],
+                [tag.id for tag in self.tags[:min(count, 2)]],
+            )
+
+        with CaptureQueriesContext(connection) as one:
+            self.assertEqual(missing(1).status_code, 400)
+        with self.assertNumQueries(len(one.captured_queries)):
+            self.assertEqual(missing(20).status_code, 400)
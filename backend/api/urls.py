@@ -46,6 +46,20 @@ urlpatterns = [
         ),
         name='subscription_create_delete'
     ),
+    path(
+        'recipes/favorite/',
+        views.FavoriteViewSet.as_view(
+            {'post': 'create_many', 'delete': 'delete_many'}
+        ),
+        name='favorite_batch'
+    ),
+    path(
+        'recipes/shopping_cart/',
+        views.ShoppingCartViewSet.as_view(
+            {'post': 'create_many', 'delete': 'delete_many'}
+        ),
+        name='shopping_cart_batch'
+    ),
     re_path(
         r'recipes/(?P<recipe_id>[\d]+)/favorite/',
         views.FavoriteViewSet.as_view(
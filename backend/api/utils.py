@@ -1,23 +1,45 @@
-from django_filters.rest_framework import (AllValuesMultipleFilter, FilterSet,
-                                           NumberFilter)
+import csv
+import json
+from base64 import b64decode, b64encode
+from binascii import Error as BinasciiError
+from hashlib import md5
+
+from django.db.models import (BooleanField, Exists, F, OuterRef, Q, Value,
+                              Window)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from django_filters.rest_framework import (CharFilter, FilterSet,
+                                           MultipleChoiceFilter, NumberFilter)
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import SAFE_METHODS, IsAuthenticatedOrReadOnly
 from rest_framework.renderers import BaseRenderer
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
-from core.models import Recipe
+from api.search import tag_choices, tag_slug_map
+from core import fulltext
+from core.models import ModelVersion, Recipe, TagsInRecipe
+from users.models import Favorite, ShoppingCart
 
 
 class RecipeFilter(FilterSet):
     is_favorited = NumberFilter(
         method='get_is_favorited',
     )
-    tags = AllValuesMultipleFilter(
-        field_name='tags__slug',
+    tags = MultipleChoiceFilter(
+        choices=tag_choices,
+        method='get_tags',
         label='tags',
     )
     is_in_shopping_cart = NumberFilter(
         method='get_is_in_shopping_cart',
     )
+    search = CharFilter(
+        method='get_search',
+    )
 
     class Meta:
         model = Recipe
@@ -25,24 +47,80 @@ class RecipeFilter(FilterSet):
             'tags',
             'author',
             'is_favorited',
-            'is_in_shopping_cart'
+            'is_in_shopping_cart',
+            'search',
         )
 
-    def get_is_favorited(self, queryset, name, value):
+    def get_tags(self, queryset, name, value):
+        return queryset.filter(Exists(TagsInRecipe.objects.filter(
+            recipe=OuterRef('pk'),
+            tag_id__in=tag_slug_map.ids(value)
+        )))
+
+    def get_search(self, queryset, name, value):
+        return fulltext.search(queryset, value)
+
+    def filter_by_user(self, queryset, model, value):
         user = self.request.user
-        if value == 1:
-            return queryset.filter(is_favorited__user=user)
-        if value == 0:
-            return queryset.exclude(is_favorited__user=user)
-        return queryset
+        if value not in (0, 1):
+            return queryset
+        if not user.is_authenticated:
+            return queryset.none() if value == 1 else queryset
+        exists = Exists(model.objects.filter(user=user, recipe=OuterRef('pk')))
+        return queryset.filter(exists if value == 1 else ~exists)
+
+    def get_is_favorited(self, queryset, name, value):
+        return self.filter_by_user(queryset, Favorite, value)
 
     def get_is_in_shopping_cart(self, queryset, name, value):
-        user = self.request.user
-        if value == 1:
-            return queryset.filter(is_in_shopping_cart__user=user)
-        if value == 0:
-            return queryset.exclude(is_in_shopping_cart__user=user)
-        return queryset
+        return self.filter_by_user(queryset, ShoppingCart, value)
+
+
+def annotate_user_flags(queryset, user):
+    """Добавляет рецептам флаги favorited и in_shopping_cart для user."""
+    if not user.is_authenticated:
+        return queryset.annotate(
+            favorited=Value(False, output_field=BooleanField()),
+            in_shopping_cart=Value(False, output_field=BooleanField()),
+        )
+    return queryset.annotate(
+        favorited=Exists(
+            Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+        ),
+        in_shopping_cart=Exists(
+            ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+        ),
+    )
+
+
+def get_recipes_limit(request):
+    """Значение ?recipes_limit= или None, если параметр не задан."""
+    try:
+        limit = int(request.query_params['recipes_limit'])
+    except (KeyError, ValueError):
+        return None
+    return max(limit, 0)
+
+
+def limit_recipes_per_author(queryset, limit):
+    """Оставляет в queryset не больше limit рецептов каждого автора.
+
+    Номера строк считаются оконной функцией ROW_NUMBER() с разбиением по
+    автору в порядке Recipe.Meta.ordering.
+    """
+    ranked = queryset.annotate(
+        row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=[F('cooking_time').desc(), F('id').desc()],
+        )
+    ).values('id', 'row_number')
+    sql, params = ranked.query.sql_with_params()
+    return queryset.filter(id__in=RawSQL(
+        f'SELECT ranked.id FROM ({sql}) ranked '
+        'WHERE ranked.row_number <= %s',
+        (*params, limit)
+    ))
 
 
 class FoodgramCurrentUserOrAdminOrReadOnly(IsAuthenticatedOrReadOnly):
@@ -53,13 +131,226 @@ class FoodgramCurrentUserOrAdminOrReadOnly(IsAuthenticatedOrReadOnly):
         return request.method in SAFE_METHODS or user.is_staff
 
 
+class ConditionalGetMixin:
+    """Отвечает 304, если версии данных из version_keys не менялись.
+
+    Проверка делается до запроса основной выборки и сериализации, поэтому
+    304 возможен, только если есть все ключи get_required_version_keys():
+    без версии объекта нельзя отличить его от несуществующего. По той же
+    причине If-None-Match: * всегда передаётся обработчику.
+    """
+    version_keys = ()
+    conditional_actions = ('list', 'retrieve')
+    # Версии, прочитанные при проверке; обработчик может их использовать.
+    versions = None
+
+    def get_version_keys(self):
+        return list(self.version_keys)
+
+    def get_required_version_keys(self):
+        return []
+
+    def conditional(self, handler, request, *args, **kwargs):
+        keys = self.get_version_keys()
+        versions = self.versions = ModelVersion.objects.get_versions(keys)
+        state = repr((
+            request.get_full_path(),
+            [(key, versions.get(key, (0, None))[0]) for key in keys],
+        ))
+        etag = quote_etag(md5(state.encode()).hexdigest())
+        last_modified = max(
+            (int(updated.timestamp()) for _, updated in versions.values()),
+            default=None
+        )
+        response = None
+        if (request.META.get('HTTP_IF_NONE_MATCH', '').strip() != '*'
+                and all(key in versions
+                        for key in self.get_required_version_keys())):
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        if self.action not in self.conditional_actions:
+            return super().list(request, *args, **kwargs)
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        if self.action not in self.conditional_actions:
+            return super().retrieve(request, *args, **kwargs)
+        return self.conditional(super().retrieve, request, *args, **kwargs)
+
+
+# Больше не помещается в BIGINT.
+MAX_CURSOR_VALUE = 2 ** 63 - 1
+
+
 class PageLimitPagination(PageNumberPagination):
     page_size_query_param = 'limit'
 
 
+class KeysetPagination(PageLimitPagination):
+    """Постраничная выдача по курсору (?cursor=) без COUNT и OFFSET.
+
+    Курсор хранит значения полей ordering у последнего объекта страницы:
+    поля должны быть целочисленными, последнее — уникальным. Без ?cursor=
+    работает как PageLimitPagination. Точный count считается только по
+    ?count=1.
+    """
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    ordering = ('-cooking_time', '-id')
+    invalid_cursor_message = 'Неверный курсор.'
+
+    cursor_only = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (not self.cursor_only
+                and self.cursor_query_param not in request.query_params):
+            self.cursor_mode = False
+            return super().paginate_queryset(queryset, request, view)
+        self.cursor_mode = True
+        self.request = request
+        page_size = self.get_page_size(request)
+        self.count = None
+        if request.query_params.get(self.count_query_param) == '1':
+            self.count = queryset.count()
+        queryset = queryset.order_by(*self.ordering)
+        cursor = self.decode_cursor(
+            request.query_params.get(self.cursor_query_param, '')
+        )
+        if cursor is not None:
+            queryset = queryset.filter(self.after(cursor))
+        page = list(queryset[:page_size + 1])
+        self.has_next = len(page) > page_size
+        page = page[:page_size]
+        self.next_cursor = None
+        if self.has_next:
+            self.next_cursor = self.encode_cursor([
+                getattr(page[-1], field.lstrip('-'))
+                for field in self.ordering
+            ])
+        return page
+
+    def after(self, values):
+        """Условие «строго после values» в порядке self.ordering."""
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def encode_cursor(self, values):
+        return b64encode(
+            json.dumps(values).encode(), altchars=b'-_'
+        ).decode()
+
+    @staticmethod
+    def valid_cursor_value(value):
+        # bool — подкласс int, но в курсоре ему взяться неоткуда.
+        return type(value) is int and abs(value) <= MAX_CURSOR_VALUE
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            values = json.loads(b64decode(cursor.encode(), altchars=b'-_'))
+        except (BinasciiError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if (not isinstance(values, list)
+                or len(values) != len(self.ordering)
+                or not all(map(self.valid_cursor_value, values))):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.next_cursor
+        )
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        })
+
+
+class FeedPagination(KeysetPagination):
+    cursor_only = True
+
+
 class PlainTextRenderer(BaseRenderer):
     media_type = 'text/plain'
     format = 'txt'
 
     def render(self, data, media_type=None, renderer_context=None):
         return data
+
+
+class CSVRenderer(PlainTextRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class Echo:
+    """Файлоподобный объект, который отдаёт записанную строку обратно."""
+
+    def write(self, value):
+        return value
+
+
+def shopping_list_txt(ingredients):
+    for ingredient in ingredients:
+        yield (f'{ingredient["name"]} ({ingredient["measurement_unit"]}) —'
+               f' {ingredient["total_amount"]} \n')
+
+
+def shopping_list_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['name'],
+            ingredient['measurement_unit'],
+            ingredient['total_amount'],
+        ))
+
+
+def shopping_list_json(ingredients):
+    separator = '['
+    for ingredient in ingredients:
+        yield separator + json.dumps({
+            'name': ingredient['name'],
+            'measurement_unit': ingredient['measurement_unit'],
+            'amount': ingredient['total_amount'],
+        }, ensure_ascii=False)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+SHOPPING_LIST_WRITERS = {
+    'txt': shopping_list_txt,
+    'csv': shopping_list_csv,
+    'json': shopping_list_json,
+}
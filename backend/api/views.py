@@ -1,53 +1,147 @@
-from io import StringIO
+from itertools import chain
 
-from django.shortcuts import get_list_or_404, get_object_or_404
+from django.db import transaction
+from django.db.models import Count, F
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets
-from rest_framework.decorators import api_view, renderer_classes
-from rest_framework.permissions import AllowAny
+from rest_framework.decorators import action, api_view, renderer_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
-from api import serializers, utils
-from core.models import Ingredient, Recipe, Tag
+from api import projections, serializers, utils
+from api.cache import RecipeCacheMixin, recipe_cache
+from api.search import ingredient_index, recipe_ingredient_index
+from core.models import Ingredient, ModelVersion, Recipe, Tag
 from users.models import Favorite, Follow, ShoppingCart, User
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.all()
+class RecipeViewSet(utils.ConditionalGetMixin, RecipeCacheMixin,
+                    viewsets.ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete']
+    conditional_actions = ('retrieve',)
     permission_classes = (utils.FoodgramCurrentUserOrAdminOrReadOnly,)
-    pagination_class = utils.PageLimitPagination
+    pagination_class = utils.KeysetPagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = utils.RecipeFilter
 
     def get_serializer_class(self):
-        if self.action in ('create', 'update'):
+        if self.action in ('create', 'update', 'partial_update'):
             return serializers.RecipeCreateUpdateSerializer
         return serializers.RecipeRetrieveSerializer
 
+    def get_version_keys(self):
+        keys = [
+            ModelVersion.TAGS,
+            ModelVersion.INGREDIENTS,
+            ModelVersion.recipe_key(self.kwargs.get('pk')),
+        ]
+        if self.request.user.is_authenticated:
+            keys.append(ModelVersion.user_key(self.request.user.id))
+        return keys
+
+    def get_required_version_keys(self):
+        return [ModelVersion.recipe_key(self.kwargs.get('pk'))]
+
+    def get_queryset(self):
+        queryset = Recipe.objects.select_related('author')
+        user = self.request.user
+        if self.action == 'feed':
+            queryset = queryset.filter(author__is_followed__user=user)
+        return utils.annotate_user_flags(queryset, user)
+
+    @action(
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        pagination_class=utils.FeedPagination
+    )
+    def feed(self, request):
+        return self.list(request)
+
+    @action(detail=False)
+    def cookable(self, request):
+        """Рецепты по доле ингредиентов из ?ingredients=, которые есть."""
+        params = serializers.CookableParamsSerializer(
+            data=request.query_params
+        )
+        params.is_valid(raise_exception=True)
+        scores = recipe_ingredient_index.cookable(
+            params.validated_data['ingredients'],
+            params.validated_data['limit']
+        )
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in scores]
+        )
+        found = [
+            (recipes[recipe_id], coverage, missing)
+            for recipe_id, coverage, missing in scores
+            if recipe_id in recipes
+        ]
+        data = {
+            item['id']: item for item in recipe_cache.get_many(
+                [recipe for recipe, _, _ in found],
+                self.get_serializer_context()
+            )
+        }
+        return Response([
+            dict(data[recipe.id], coverage=round(coverage, 4),
+                 missing=missing)
+            for recipe, coverage, missing in found if recipe.id in data
+        ])
+
     def perform_create(self, serializer):
         author = self.request.user
         serializer.save(author=author)
 
-    def perform_update(self, serializer):
-        author = self.request.user
-        pk = self.kwargs.get('pk')
-        serializer.save(author=author, id=pk)
-
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(utils.ConditionalGetMixin,
+                        viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
+    version_keys = (ModelVersion.INGREDIENTS,)
     serializer_class = serializers.IngredientSerializer
     pagination_class = None
     permission_classes = (AllowAny,)
 
+    def list(self, request, *args, **kwargs):
+        return self.conditional(self.search, request, *args, **kwargs)
+
+    def search(self, request, *args, **kwargs):
+        version = self.versions.get(ModelVersion.INGREDIENTS, (0, None))[0]
+        name = request.query_params.get('name')
+        if name is None:
+            return Response(ingredient_index.encoded(version))
+        return Response(ingredient_index.search(name, version))
+
 
 class SubscriptionListViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = serializers.SubscriptionSerializer
+    pagination_class = utils.PageLimitPagination
+
+    def get_recipes(self):
+        recipes = Recipe.objects.filter(
+            author__is_followed__user=self.request.user
+        )
+        limit = utils.get_recipes_limit(self.request)
+        if limit is not None:
+            recipes = utils.limit_recipes_per_author(recipes, limit)
+        return recipes
 
     def get_queryset(self):
-        user = self.request.user
-        return user.is_subscribed.all().select_related('following')
+        return self.request.user.is_subscribed.annotate(
+            recipes_count=Count('following__recipes')
+        ).order_by('id')
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset().values(
+            'recipes_count',
+            *(f'following__{field}' for field in projections.AUTHOR_FIELDS)
+        ))
+        return self.get_paginated_response(
+            projections.subscriptions(page, self.get_recipes(), request)
+        )
 
 
 class SubscriptionCreateDestroyViewSet(viewsets.ModelViewSet):
@@ -63,7 +157,11 @@ class SubscriptionCreateDestroyViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         user = self.request.user
         following = self.get_user()
-        serializer.save(following=following, user=user)
+        if following == user:
+            raise ValidationError('Вы пытаетесь подписаться на себя')
+        instance = Follow(user=user, following=following)
+        Follow.objects.insert_ignore([instance])
+        serializer.instance = instance
 
     def delete(self, request, *args, **kwargs):
         user = self.request.user
@@ -73,8 +171,9 @@ class SubscriptionCreateDestroyViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(utils.ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
+    version_keys = (ModelVersion.TAGS,)
     serializer_class = serializers.TagSerializer
     pagination_class = None
     permission_classes = (AllowAny,)
@@ -88,54 +187,98 @@ class FavoriteViewSet(viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         return get_object_or_404(Recipe, id=self.kwargs.get('recipe_id'))
 
+    # Строка корзины и список покупок, который обновляют её сигналы,
+    # пишутся в одной транзакции.
+    @transaction.atomic
     def create(self, request, *args, **kwargs):
         user = self.request.user
         recipe = self.get_queryset()
-        if not self.model.objects.filter(user=user, recipe=recipe).exists():
-            self.model.objects.create(user=user, recipe=recipe)
+        self.model.objects.insert_ignore(
+            [self.model(user=user, recipe=recipe)]
+        )
         serializer = self.get_serializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @transaction.atomic
     def delete(self, request, *args, **kwargs):
+        # remove() учитывает только строку, удалённую этим запросом, поэтому
+        # два параллельных DELETE не вычтут рецепт из списка покупок дважды.
         user = self.request.user
         recipe = self.get_queryset()
-        instance = get_object_or_404(self.model, user=user, recipe=recipe)
-        instance.delete()
+        if not self.model.objects.filter(user=user, recipe=recipe).remove():
+            raise Http404
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def get_recipe_ids(self):
+        serializer = serializers.RecipeIdsSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        return list(dict.fromkeys(serializer.validated_data['recipes']))
+
+    @transaction.atomic
+    def create_many(self, request, *args, **kwargs):
+        user = self.request.user
+        recipe_ids = self.get_recipe_ids()
+        recipes = Recipe.objects.in_bulk(recipe_ids)
+        created = {
+            instance.recipe_id for instance in
+            self.model.objects.insert_ignore(
+                self.model(user=user, recipe=recipe)
+                for recipe in recipes.values()
+            )
+        }
+        results = []
+        for recipe_id in recipe_ids:
+            result = 'not_found'
+            if recipe_id in created:
+                result = 'created'
+            elif recipe_id in recipes:
+                result = 'exists'
+            results.append({'id': recipe_id, 'status': result})
+        return Response(results, status=status.HTTP_200_OK)
+
+    @transaction.atomic
+    def delete_many(self, request, *args, **kwargs):
+        user = self.request.user
+        recipe_ids = self.get_recipe_ids()
+        deleted = {
+            instance.recipe_id for instance in self.model.objects.filter(
+                user=user, recipe_id__in=recipe_ids
+            ).remove()
+        }
+        return Response([
+            {
+                'id': recipe_id,
+                'status': 'deleted' if recipe_id in deleted else 'not_found'
+            } for recipe_id in recipe_ids
+        ], status=status.HTTP_200_OK)
+
 
 class ShoppingCartViewSet(FavoriteViewSet):
     model = ShoppingCart
 
 
 @api_view(['GET'])
-@renderer_classes([utils.PlainTextRenderer])
+@renderer_classes(
+    [utils.PlainTextRenderer, utils.CSVRenderer, JSONRenderer]
+)
 def download_shopping_cart(request):
-    user = request.user
-    cart = get_list_or_404(
-        ShoppingCart.objects.select_related('recipe').prefetch_related(
-            'recipe__ingredients_in_recipe'
-        ),
-        user=user
+    # Строки читаются курсором по мере отправки ответа; первая читается
+    # сразу, чтобы ответить 404 на пустой список.
+    ingredients = request.user.shopping_list.values(
+        name=F('ingredient__name'),
+        measurement_unit=F('ingredient__measurement_unit'),
+        total_amount=F('amount'),
+    ).order_by('name', 'measurement_unit').iterator()
+    first = next(ingredients, None)
+    if first is None:
+        raise Http404
+    renderer = request.accepted_renderer
+    writer = utils.SHOPPING_LIST_WRITERS[renderer.format]
+    response = StreamingHttpResponse(
+        writer(chain([first], ingredients)),
+        content_type=f'{renderer.media_type}; charset=utf-8',
     )
-    ingredients = []
-    for ingredient in cart:
-        ingredients.extend(
-            ingredient.recipe.ingredients_in_recipe.all()
-        )
-    ingredients_dict = {}
-    for ingredient in ingredients:
-        if ingredient.ingredient_id not in ingredients_dict:
-            ingredients_dict[ingredient.ingredient_id] = 0
-        ingredients_dict[ingredient.ingredient_id] += ingredient.amount
-    data = StringIO()
-    for ingredient_id in ingredients_dict:
-        ingredient = Ingredient.objects.get(id=ingredient_id)
-        text = f'{ingredient.name} ({ingredient.measurement_unit}) —'
-        text += f' {ingredients_dict[ingredient_id]} \n'
-        data.write(text)
-    data.seek(0)
-    headers = {
-        'Content-Disposition': 'attachment; filename="list.txt"',
-    }
-    return Response(data, status=status.HTTP_200_OK, headers=headers)
+    response['Content-Disposition'] = (
+        f'attachment; filename="list.{renderer.format}"'
+    )
+    return response
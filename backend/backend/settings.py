@@ -46,6 +46,12 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+SQL_PROFILING = os.getenv('SQL_PROFILING', default='False') == 'True'
+SQL_PROFILING_REPEAT_THRESHOLD = int(os.getenv('SQL_PROFILING_REPEAT_THRESHOLD', default=5))
+
+if SQL_PROFILING:
+    MIDDLEWARE.insert(0, 'api.profiling.SQLProfilingMiddleware')
+
 ROOT_URLCONF = 'backend.urls'
 
 TEMPLATES_DIR = BASE_DIR / 'templates'
@@ -87,6 +93,30 @@ else:
         }
     }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'recipes': {
+        'BACKEND': os.getenv('RECIPE_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('RECIPE_CACHE_LOCATION', default='recipes'),
+        'TIMEOUT': int(os.getenv('RECIPE_CACHE_TIMEOUT', default=3600)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('RECIPE_CACHE_MAX_ENTRIES', default=10000)),
+        },
+    },
+}
+
+RECIPE_CACHE_ALIAS = 'recipes'
+
+RECIPE_IMAGE_WIDTHS = tuple(
+    int(width) for width in os.getenv('RECIPE_IMAGE_WIDTHS', default='320,960').split(',')
+)
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', default=2))
+
+IMAGE_UPLOAD_MAX_SIZE = int(os.getenv('IMAGE_UPLOAD_MAX_SIZE', default=10 * 1024 * 1024))
+IMAGE_UPLOAD_MAX_PIXELS = int(os.getenv('IMAGE_UPLOAD_MAX_PIXELS', default=40_000_000))
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -130,7 +160,7 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6,
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        'api.renderers.FastJSONRenderer',
     ),
 }
 
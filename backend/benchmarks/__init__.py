@@ -0,0 +1,11 @@
+"""Нагрузочные замеры API на воспроизводимом наборе данных.
+
+Запуск из каталога backend:
+
+    python -m benchmarks --users 200 --recipes 2000 --output bench.json
+
+Данные создаются в тестовой базе (test_<NAME> на PostgreSQL, в памяти на
+SQLite) и удаляются после замеров. Для каждого эндпоинта в отчёт пишутся
+p50/p95/p99, пропускная способность и число SQL-запросов на запрос;
+JSON-файлы разных коммитов удобно сравнивать diff'ом.
+"""
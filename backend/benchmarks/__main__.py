@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+from dataclasses import asdict, fields
+
+import django
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            capture_output=True, check=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(sizes_class):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Замеры эндпоинтов API на детерминированных данных.'
+    )
+    for size in fields(sizes_class):
+        parser.add_argument(
+            f'--{size.name.replace("_", "-")}', type=int, default=size.default
+        )
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--mode', choices=('client', 'wsgi'), default='client')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument(
+        '--requests', type=int, default=200,
+        help='Число запросов к каждому эндпоинту'
+    )
+    parser.add_argument(
+        '--endpoint', action='append', dest='endpoints',
+        help='Замерить только указанные эндпоинты'
+    )
+    parser.add_argument('--output', help='Файл для JSON-отчёта')
+    return parser.parse_args()
+
+
+def main():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import (override_settings, setup_databases,
+                                   setup_test_environment, teardown_databases,
+                                   teardown_test_environment)
+
+    from benchmarks import dataset, runner
+    from benchmarks.dataset import Sizes
+
+    args = parse_args(Sizes)
+    sizes = Sizes(**{
+        size.name: getattr(args, size.name) for size in fields(Sizes)
+    })
+    setup_test_environment()
+    databases = setup_databases(verbosity=0, interactive=False)
+    try:
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            data = dataset.seed(sizes, args.seed)
+            results = runner.run(
+                data, args.mode, args.requests, args.workers, args.seed,
+                args.endpoints
+            )
+        report = {
+            'meta': {
+                'commit': git_commit(),
+                'seed': args.seed,
+                'sizes': asdict(sizes),
+                'mode': args.mode,
+                'workers': args.workers,
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+            },
+            'endpoints': results,
+        }
+    finally:
+        teardown_databases(databases, verbosity=0)
+        teardown_test_environment()
+    output = json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
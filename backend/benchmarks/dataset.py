@@ -0,0 +1,134 @@
+"""Детерминированный набор данных для замеров."""
+import random
+from dataclasses import dataclass, field
+
+from rest_framework.authtoken.models import Token
+
+from core import fulltext
+from core.models import (Ingredient, IngredientsInRecipe, Recipe, Tag,
+                         TagsInRecipe)
+from users.models import Favorite, Follow, ShoppingCart, User
+
+BATCH_SIZE = 1000
+PREFIX = 'bench'
+
+
+@dataclass
+class Sizes:
+    users: int = 100
+    recipes: int = 1000
+    follows: int = 10
+    favorites: int = 20
+    carts: int = 5
+    ingredients_per_recipe: int = 8
+
+
+@dataclass
+class Dataset:
+    tokens: list = field(default_factory=list)
+    recipe_ids: list = field(default_factory=list)
+    ingredient_names: list = field(default_factory=list)
+
+
+def seed(sizes, seed=0):
+    """Заполняет базу; при одинаковых sizes и seed данные совпадают."""
+    rng = random.Random(seed)
+    ingredients = list(Ingredient.objects.order_by('id').values_list(
+        'id', 'name'
+    ))
+    tags = [
+        Tag(slug=f'{PREFIX}-{i}', name=f'Тег {i}', color='#49B64E')
+        for i in range(6)
+    ]
+    Tag.objects.bulk_create(tags, batch_size=BATCH_SIZE)
+    tag_ids = list(Tag.objects.filter(
+        slug__startswith=PREFIX
+    ).order_by('id').values_list('id', flat=True))
+
+    User.objects.bulk_create(
+        (
+            User(
+                username=f'{PREFIX}{i}',
+                email=f'{PREFIX}{i}@example.com',
+                first_name=f'Имя{i}',
+                last_name=f'Фамилия{i}',
+            ) for i in range(sizes.users)
+        ),
+        batch_size=BATCH_SIZE
+    )
+    user_ids = list(User.objects.filter(
+        username__startswith=PREFIX
+    ).order_by('id').values_list('id', flat=True))
+    Token.objects.bulk_create(
+        (Token(key=f'{i:040x}', user_id=user_id)
+         for i, user_id in enumerate(user_ids)),
+        batch_size=BATCH_SIZE
+    )
+
+    Recipe.objects.bulk_create(
+        (
+            Recipe(
+                author_id=rng.choice(user_ids),
+                name=f'Рецепт {i}',
+                text=' '.join(
+                    rng.choice(ingredients)[1]
+                    for _ in range(rng.randint(5, 40))
+                ),
+                cooking_time=rng.randint(1, 180),
+            ) for i in range(sizes.recipes)
+        ),
+        batch_size=BATCH_SIZE
+    )
+    recipe_ids = list(Recipe.objects.filter(
+        author_id__in=user_ids
+    ).order_by('id').values_list('id', flat=True))
+    fulltext.index(recipe_ids)
+    TagsInRecipe.objects.bulk_create(
+        (
+            TagsInRecipe(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in rng.sample(tag_ids, rng.randint(1, 3))
+        ),
+        batch_size=BATCH_SIZE
+    )
+    IngredientsInRecipe.objects.bulk_create(
+        (
+            IngredientsInRecipe(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=rng.randint(1, 500),
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id, _ in rng.sample(
+                ingredients, min(len(ingredients), rng.randint(
+                    1, 2 * sizes.ingredients_per_recipe - 1
+                ))
+            )
+        ),
+        batch_size=BATCH_SIZE
+    )
+
+    Follow.objects.insert_ignore(
+        Follow(user_id=user_id, following_id=following_id)
+        for user_id in user_ids
+        for following_id in rng.sample(
+            user_ids, min(sizes.follows, len(user_ids))
+        )
+        if following_id != user_id
+    )
+    for model, count in ((Favorite, sizes.favorites),
+                         (ShoppingCart, sizes.carts)):
+        model.objects.insert_ignore(
+            model(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in rng.sample(
+                recipe_ids, min(count, len(recipe_ids))
+            )
+        )
+    return Dataset(
+        tokens=list(Token.objects.filter(
+            user_id__in=user_ids
+        ).order_by('user_id').values_list('key', flat=True)),
+        recipe_ids=recipe_ids,
+        ingredient_names=[name for _, name in ingredients],
+    )
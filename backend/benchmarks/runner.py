@@ -0,0 +1,240 @@
+"""Прогон эндпоинтов параллельными потоками и сбор статистики."""
+import http.client
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from socketserver import ThreadingMixIn
+from statistics import mean, quantiles
+from time import perf_counter
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.core.wsgi import get_wsgi_application
+from django.db import close_old_connections, connection
+from django.test import Client
+
+from api.profiling import QueryLog
+
+QUERY_COUNT_HEADER = 'X-Benchmark-Queries'
+
+
+@dataclass
+class Endpoint:
+    name: str
+    # Функция (rng, dataset) -> путь с query string.
+    path: object
+    authenticated: bool = True
+
+
+ENDPOINTS = (
+    Endpoint(
+        'recipes',
+        lambda rng, data: f'/api/recipes/?page={rng.randint(1, 5)}&limit=6'
+    ),
+    Endpoint(
+        'recipes-anonymous',
+        lambda rng, data: f'/api/recipes/?page={rng.randint(1, 5)}&limit=6',
+        authenticated=False
+    ),
+    Endpoint(
+        'recipe',
+        lambda rng, data: f'/api/recipes/{rng.choice(data.recipe_ids)}/'
+    ),
+    Endpoint(
+        'recipes-feed',
+        lambda rng, data: '/api/recipes/feed/?limit=6'
+    ),
+    Endpoint(
+        'recipes-search',
+        lambda rng, data: '/api/recipes/?search='
+        + rng.choice(data.ingredient_names).split()[0]
+    ),
+    Endpoint(
+        'subscriptions',
+        lambda rng, data: '/api/users/subscriptions/?recipes_limit=3'
+    ),
+    Endpoint(
+        'ingredients',
+        lambda rng, data: '/api/ingredients/',
+        authenticated=False
+    ),
+    Endpoint(
+        'ingredients-search',
+        lambda rng, data: '/api/ingredients/?name='
+        + rng.choice(data.ingredient_names)[:2],
+        authenticated=False
+    ),
+    Endpoint(
+        'download-shopping-cart',
+        lambda rng, data: '/api/recipes/download_shopping_cart/'
+    ),
+)
+
+
+class ClientDriver:
+    """Запросы через django.test.Client в потоке воркера."""
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def get(self, path, token):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = Client(raise_request_exception=False)
+        headers = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+        log = QueryLog()
+        with log.capture():
+            response = client.get(path, **headers)
+            b''.join(response)
+        return response.status_code, log.count
+
+    def finish_worker(self):
+        connection.close()
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietHandler(WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WSGIDriver:
+    """Запросы по HTTP к WSGI-серверу, поднятому в этом же процессе."""
+
+    def __init__(self):
+        self.local = threading.local()
+        self.server = None
+
+    def start(self):
+        self.server = make_server(
+            '127.0.0.1', 0, self.application(get_wsgi_application()),
+            server_class=ThreadingWSGIServer, handler_class=QuietHandler
+        )
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @staticmethod
+    def application(application):
+        def wrapper(environ, start_response):
+            log = QueryLog()
+            response = {}
+
+            def capture(status, headers, exc_info=None):
+                response.update(status=status, headers=headers)
+
+            try:
+                with log.capture():
+                    body = b''.join(application(environ, capture))
+            finally:
+                close_old_connections()
+            start_response(response['status'], [
+                *response['headers'],
+                (QUERY_COUNT_HEADER, str(log.count)),
+            ])
+            return [body]
+
+        return wrapper
+
+    def get(self, path, token):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = http.client.HTTPConnection(
+                *self.server.server_address
+            )
+        headers = {'Host': 'testserver'}
+        if token:
+            headers['Authorization'] = f'Token {token}'
+        conn.request('GET', path, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        return response.status, int(response.getheader(QUERY_COUNT_HEADER))
+
+    def finish_worker(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            conn.close()
+
+
+DRIVERS = {
+    'client': ClientDriver,
+    'wsgi': WSGIDriver,
+}
+
+
+def percentile(values, percent):
+    if len(values) < 2:
+        return values[0]
+    return quantiles(values, n=100, method='inclusive')[percent - 1]
+
+
+def run_endpoint(driver, endpoint, dataset, requests, workers, seed):
+    """Делает requests запросов в workers потоков, возвращает статистику."""
+
+    def work(worker):
+        rng = random.Random(f'{seed}:{endpoint.name}:{worker}')
+        timings, queries, errors = [], [], 0
+        try:
+            for _ in range(worker, requests, workers):
+                token = None
+                if endpoint.authenticated:
+                    token = rng.choice(dataset.tokens)
+                path = endpoint.path(rng, dataset)
+                start = perf_counter()
+                status, count = driver.get(path, token)
+                timings.append((perf_counter() - start) * 1000)
+                queries.append(count)
+                errors += status >= 400
+        finally:
+            driver.finish_worker()
+        return timings, queries, errors
+
+    start = perf_counter()
+    with ThreadPoolExecutor(workers) as executor:
+        results = list(executor.map(work, range(workers)))
+    elapsed = perf_counter() - start
+    timings = sorted(t for result in results for t in result[0])
+    queries = [q for result in results for q in result[1]]
+    return {
+        'requests': len(timings),
+        'errors': sum(result[2] for result in results),
+        'throughput_rps': round(len(timings) / elapsed, 1),
+        'latency_ms': {
+            'mean': round(mean(timings), 2),
+            'p50': round(percentile(timings, 50), 2),
+            'p95': round(percentile(timings, 95), 2),
+            'p99': round(percentile(timings, 99), 2),
+            'max': round(timings[-1], 2),
+        },
+        'queries': {
+            'mean': round(mean(queries), 2),
+            'max': max(queries),
+        },
+    }
+
+
+def run(dataset, mode, requests, workers, seed, names=None):
+    driver = DRIVERS[mode]()
+    driver.start()
+    try:
+        return {
+            endpoint.name: run_endpoint(
+                driver, endpoint, dataset, requests, workers, seed
+            )
+            for endpoint in ENDPOINTS
+            if not names or endpoint.name in names
+        }
+    finally:
+        driver.stop()
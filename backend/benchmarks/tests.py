@@ -0,0 +1,125 @@
+import threading
+
+from django.db import transaction
+from django.db.models import F
+from django.test import TestCase
+
+from benchmarks import dataset, runner
+from benchmarks.dataset import Sizes
+from core.models import Recipe
+from users.models import Favorite, Follow
+
+
+class FakeDriver:
+    """Запоминает запросы; каждый третий отвечает 404."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = []
+        self.finished = 0
+
+    def get(self, path, token):
+        with self.lock:
+            self.requests.append((path, token))
+            return 404 if len(self.requests) % 3 == 0 else 200, 2
+
+    def finish_worker(self):
+        with self.lock:
+            self.finished += 1
+
+
+class PercentileTest(TestCase):
+
+    def test_percentile(self):
+        self.assertEqual(runner.percentile([5.0], 99), 5.0)
+        values = [float(value) for value in range(1, 102)]
+        self.assertEqual(runner.percentile(values, 50), 51.0)
+        self.assertEqual(runner.percentile(values, 95), 96.0)
+        self.assertEqual(runner.percentile(values, 99), 100.0)
+
+
+class DatasetTest(TestCase):
+    sizes = Sizes(
+        users=6, recipes=15, follows=3, favorites=4, carts=2,
+        ingredients_per_recipe=3
+    )
+
+    def snapshot(self, seed):
+        """Данные seed без id: после отката id могут не повториться."""
+        with transaction.atomic():
+            data = dataset.seed(self.sizes, seed)
+            result = (
+                len(data.tokens),
+                len(data.recipe_ids),
+                list(Recipe.objects.filter(
+                    id__in=data.recipe_ids
+                ).order_by('name').values_list(
+                    'name', 'author__username', 'cooking_time', 'text'
+                )),
+                sorted(Follow.objects.values_list(
+                    'user__username', 'following__username'
+                )),
+                sorted(Favorite.objects.values_list(
+                    'user__username', 'recipe__name'
+                )),
+                Follow.objects.filter(user=F('following')).exists(),
+            )
+            transaction.set_rollback(True)
+        return result
+
+    def test_same_seed_gives_same_data(self):
+        first = self.snapshot(0)
+        self.assertEqual(first[:2], (6, 15))
+        self.assertFalse(first[-1])
+        self.assertEqual(self.snapshot(0), first)
+        self.assertNotEqual(self.snapshot(1), first)
+
+
+class RunEndpointTest(TestCase):
+    data = dataset.Dataset(
+        tokens=['a', 'b', 'c'], recipe_ids=[1, 2, 3],
+        ingredient_names=['морковь', 'лук репчатый']
+    )
+
+    def run_endpoint(self, name, seed=0):
+        endpoint, = (
+            endpoint for endpoint in runner.ENDPOINTS if endpoint.name == name
+        )
+        driver = FakeDriver()
+        stats = runner.run_endpoint(driver, endpoint, self.data, 10, 3, seed)
+        return driver, stats
+
+    def test_statistics(self):
+        driver, stats = self.run_endpoint('recipe')
+        self.assertEqual(stats['requests'], 10)
+        self.assertEqual(stats['errors'], 3)
+        self.assertEqual(stats['queries'], {'mean': 2, 'max': 2})
+        self.assertEqual(driver.finished, 3)
+        latency = stats['latency_ms']
+        self.assertLessEqual(latency['p50'], latency['p95'])
+        self.assertLessEqual(latency['p95'], latency['p99'])
+        self.assertLessEqual(latency['p99'], latency['max'])
+        for path, token in driver.requests:
+            self.assertIn(token, self.data.tokens)
+            self.assertRegex(path, r'^/api/recipes/[123]/$')
+
+    def test_requests_depend_only_on_seed(self):
+        first, _ = self.run_endpoint('recipe')
+        second, _ = self.run_endpoint('recipe')
+        self.assertEqual(sorted(first.requests), sorted(second.requests))
+        driver, _ = self.run_endpoint('recipes-anonymous')
+        self.assertEqual({token for _, token in driver.requests}, {None})
+
+
+class ClientDriverTest(TestCase):
+
+    def test_status_and_query_count(self):
+        data = dataset.seed(Sizes(users=2, recipes=3))
+        driver = runner.ClientDriver()
+        status, queries = driver.get(
+            f'/api/recipes/{data.recipe_ids[0]}/', data.tokens[0]
+        )
+        self.assertEqual(status, 200)
+        self.assertGreater(queries, 0)
+        status, _ = driver.get('/api/recipes/download_shopping_cart/', None)
+        self.assertEqual(status, 401)
@@ -1,6 +1,7 @@
 from django.contrib.admin import ModelAdmin, register, site
 from django.contrib.auth.admin import UserAdmin
 
+from . import fulltext
 from .models import (Ingredient, IngredientsInRecipe, Recipe, Tag,
                      TagsInRecipe, User)
 
@@ -19,6 +20,11 @@ class RecipeAdmin(ModelAdmin):
     search_fields = ('text', 'name')
     list_filter = ('author', 'name', 'tags')
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return fulltext.search(queryset, search_term), False
+
 
 @register(Tag)
 class TagAdmin(ModelAdmin):
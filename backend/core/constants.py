@@ -2,3 +2,6 @@ MIN_AMOUNT_OF_INGREDIENT = 1
 MAX_AMOUNT_OF_INGREDIENT = 5000
 MIN_COOKING_TIME = 1
 MAX_COOKING_TIME = 300
+MAX_RECIPES_IN_BATCH = 100
+COOKABLE_RECIPES_LIMIT = 10
+MAX_COOKABLE_RECIPES_LIMIT = 100
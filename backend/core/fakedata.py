@@ -0,0 +1,219 @@
+"""Синтетические данные для проверок на больших объёмах.
+
+Модуль не обращается ни к Django, ни к БД: функции users, recipes и
+relations выполняются в процессах-воркерах и по номеру пачки строят
+кортежи строк для вставки. Генератор случайных чисел каждой пачки
+получает seed из общего seed, вида пачки и её номера, поэтому результат не
+зависит от числа воркеров и порядка выполнения.
+
+Популярность авторов, ингредиентов и рецептов распределена по степенному
+закону: ранг r выбирается с весом 1 / r ** skew, а ранги переставлены
+биекцией r -> (r * step + offset) % n, чтобы популярные строки не шли
+подряд по id.
+"""
+import random
+from bisect import bisect
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import accumulate
+from math import gcd
+
+from .constants import (MAX_AMOUNT_OF_INGREDIENT, MAX_COOKING_TIME,
+                        MIN_AMOUNT_OF_INGREDIENT, MIN_COOKING_TIME)
+
+USER_COLUMNS = (
+    'id', 'password', 'last_login', 'is_superuser', 'username',
+    'first_name', 'last_name', 'email', 'is_staff', 'is_active',
+    'date_joined',
+)
+RECIPE_COLUMNS = (
+    'id', 'author_id', 'name', 'text', 'cooking_time', 'image', 'thumbnail',
+)
+RECIPE_TAG_COLUMNS = ('recipe_id', 'tag_id')
+RECIPE_INGREDIENT_COLUMNS = ('recipe_id', 'ingredient_id', 'amount')
+FOLLOW_COLUMNS = ('user_id', 'following_id')
+USER_RECIPE_COLUMNS = ('user_id', 'recipe_id')
+
+FIRST_NAMES = (
+    'Анна', 'Мария', 'Елена', 'Ольга', 'Наталья', 'Ирина', 'Светлана',
+    'Александр', 'Сергей', 'Дмитрий', 'Андрей', 'Алексей', 'Максим', 'Иван',
+)
+LAST_NAMES = (
+    'Иванова', 'Смирнова', 'Кузнецова', 'Попова', 'Соколова', 'Лебедева',
+    'Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов', 'Лебедев',
+)
+DISHES = (
+    'Салат', 'Суп', 'Пирог', 'Рагу', 'Запеканка', 'Каша', 'Омлет', 'Паста',
+    'Соус', 'Десерт', 'Жаркое', 'Блины', 'Смузи', 'Котлеты',
+)
+STEPS = (
+    'Нарежьте и обжарьте на среднем огне.',
+    'Смешайте и запекайте до румяной корочки.',
+    'Доведите до кипения и варите под крышкой.',
+    'Взбейте до однородности и охладите.',
+    'Потушите, посолите и поперчите по вкусу.',
+    'Подавайте сразу, украсив зеленью.',
+)
+
+
+@dataclass
+class Plan:
+    seed: int
+    first_user_id: int
+    users: int
+    first_recipe_id: int
+    recipes: int
+    ingredients: list
+    tag_ids: list
+    follows: int
+    favorites: int
+    carts: int
+    ingredients_per_recipe: int
+    skew: float
+    password: str
+    date_joined: object
+    batch_size: int
+
+    def chunks(self, count):
+        return range((count + self.batch_size - 1) // self.batch_size)
+
+
+plan = None
+
+
+def init(new_plan):
+    """Инициализатор воркера: план передаётся один раз, а не с каждой
+    пачкой."""
+    global plan
+    plan = new_plan
+
+
+@lru_cache(maxsize=None)
+def cumulative_weights(n, skew):
+    return list(accumulate(1 / rank ** skew for rank in range(1, n + 1)))
+
+
+class PowerLaw:
+    """Выбор индексов 0..n-1 со степенным распределением популярности."""
+
+    def __init__(self, n, skew, salt):
+        self.n = n
+        self.weights = cumulative_weights(n, skew)
+        self.total = self.weights[-1]
+        self.step = int(n * 0.6180339887) + salt
+        while gcd(self.step, n) != 1:
+            self.step += 1
+        self.offset = salt * 7919 % n
+
+    def pick(self, rng):
+        rank = bisect(self.weights, rng.random() * self.total)
+        return (min(rank, self.n - 1) * self.step + self.offset) % self.n
+
+    def sample(self, rng, k, exclude=None):
+        """k различных индексов; при сильном перекосе добирает равномерно."""
+        k = min(k, self.n - (exclude is not None))
+        chosen = {}
+        for _ in range(4 * k):
+            if len(chosen) == k:
+                break
+            index = self.pick(rng)
+            if index != exclude:
+                chosen[index] = None
+        while len(chosen) < k:
+            index = rng.randrange(self.n)
+            if index != exclude:
+                chosen[index] = None
+        return list(chosen)
+
+
+def rng_for(kind, chunk):
+    return random.Random(f'{plan.seed}:{kind}:{chunk}')
+
+
+def chunk_range(first_id, count, chunk):
+    start = chunk * plan.batch_size
+    return range(first_id + start,
+                 first_id + min(start + plan.batch_size, count))
+
+
+def users(chunk):
+    rng = rng_for('users', chunk)
+    return {'users': [
+        (
+            user_id, plan.password, None, False, f'fake{user_id}',
+            rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES),
+            f'fake{user_id}@example.com', False, True, plan.date_joined,
+        )
+        for user_id in chunk_range(plan.first_user_id, plan.users, chunk)
+    ]}
+
+
+def recipes(chunk):
+    rng = rng_for('recipes', chunk)
+    authors = PowerLaw(plan.users, plan.skew, 0)
+    ingredients = PowerLaw(len(plan.ingredients), plan.skew, 1)
+    recipe_rows, tag_rows, ingredient_rows = [], [], []
+    for recipe_id in chunk_range(plan.first_recipe_id, plan.recipes, chunk):
+        used = [plan.ingredients[index] for index in ingredients.sample(
+            rng, rng.randint(1, 2 * plan.ingredients_per_recipe - 1)
+        )]
+        names = [name for _, name in used]
+        recipe_rows.append((
+            recipe_id,
+            plan.first_user_id + authors.pick(rng),
+            f'{rng.choice(DISHES)}: {names[0]}'[:200],
+            f'Понадобится: {", ".join(names)}. '
+            + ' '.join(rng.sample(STEPS, rng.randint(1, len(STEPS)))),
+            min(MAX_COOKING_TIME, max(
+                MIN_COOKING_TIME, round(rng.lognormvariate(3.4, 0.6))
+            )),
+            None,
+            '',
+        ))
+        tag_rows.extend(
+            (recipe_id, tag_id) for tag_id in rng.sample(
+                plan.tag_ids, rng.randint(1, min(3, len(plan.tag_ids)))
+            )
+        )
+        ingredient_rows.extend(
+            (recipe_id, ingredient_id, min(
+                MAX_AMOUNT_OF_INGREDIENT,
+                max(MIN_AMOUNT_OF_INGREDIENT,
+                    round(rng.lognormvariate(4.5, 1)))
+            ))
+            for ingredient_id, _ in used
+        )
+    return {
+        'recipes': recipe_rows,
+        'recipe_tags': tag_rows,
+        'recipe_ingredients': ingredient_rows,
+    }
+
+
+def relations(chunk):
+    """Подписки, избранное и корзины пользователей пачки."""
+    rng = rng_for('relations', chunk)
+    authors = PowerLaw(plan.users, plan.skew, 0)
+    popular = PowerLaw(plan.recipes, plan.skew, 2)
+    follows, favorites, carts = [], [], []
+    for user_id in chunk_range(plan.first_user_id, plan.users, chunk):
+        index = user_id - plan.first_user_id
+        follows.extend(
+            (user_id, plan.first_user_id + following)
+            for following in authors.sample(
+                rng, rng.randint(0, 2 * plan.follows), exclude=index
+            )
+        )
+        favorites.extend(
+            (user_id, plan.first_recipe_id + recipe)
+            for recipe in popular.sample(
+                rng, rng.randint(0, 2 * plan.favorites)
+            )
+        )
+        carts.extend(
+            (user_id, plan.first_recipe_id + recipe)
+            for recipe in rng.sample(range(plan.recipes), min(
+                plan.recipes, rng.randint(0, 2 * plan.carts)
+            ))
+        )
+    return {'follows': follows, 'favorites': favorites, 'carts': carts}
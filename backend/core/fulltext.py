@@ -0,0 +1,146 @@
+"""Полнотекстовый поиск рецептов по названию и тексту.
+
+На PostgreSQL индекс — столбец core_recipe.search_vector (tsvector) с
+GIN-индексом, на SQLite — таблица FTS5 core_recipe_fts с rowid рецепта.
+Оба создаются миграцией core.0007 и обновляются сигналами; на прочих
+СУБД поиск идёт по icontains.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Recipe
+
+CONFIG = 'russian'
+NAME_WEIGHT = 10.0
+TEXT_WEIGHT = 1.0
+
+TABLE = Recipe._meta.db_table
+
+
+class FallbackSearch:
+
+    @staticmethod
+    def index(recipe_ids):
+        pass
+
+    @staticmethod
+    def unindex(recipe_ids):
+        pass
+
+    @staticmethod
+    def search(queryset, query):
+        return queryset.filter(
+            Q(name__icontains=query) | Q(text__icontains=query)
+        )
+
+
+class PostgresSearch(FallbackSearch):
+    VECTOR = (
+        "setweight(to_tsvector(%s, name), 'A') || "
+        "setweight(to_tsvector(%s, text), 'D')"
+    )
+
+    @classmethod
+    def index(cls, recipe_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {TABLE} SET search_vector = {cls.VECTOR} '
+                'WHERE id = ANY(%s)',
+                (CONFIG, CONFIG, list(recipe_ids))
+            )
+
+    @staticmethod
+    def search(queryset, query):
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT id FROM {TABLE} '
+            'WHERE search_vector @@ websearch_to_tsquery(%s, %s)',
+            (CONFIG, query)
+        )).annotate(rank=RawSQL(
+            f'ts_rank({TABLE}.search_vector, '
+            'websearch_to_tsquery(%s, %s))',
+            (CONFIG, query)
+        )).order_by('-rank', '-id')
+
+
+class SqliteSearch(FallbackSearch):
+    FTS_TABLE = f'{TABLE}_fts'
+
+    @classmethod
+    def index(cls, recipe_ids):
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {cls.FTS_TABLE} '
+                f'WHERE rowid IN ({placeholders})',
+                recipe_ids
+            )
+            cursor.execute(
+                f'INSERT INTO {cls.FTS_TABLE} (rowid, name, text) '
+                f'SELECT id, name, text FROM {TABLE} '
+                f'WHERE id IN ({placeholders})',
+                recipe_ids
+            )
+
+    @classmethod
+    def unindex(cls, recipe_ids):
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {cls.FTS_TABLE} '
+                f'WHERE rowid IN ({placeholders})',
+                recipe_ids
+            )
+
+    @staticmethod
+    def match(query):
+        """Каждое слово запроса — префикс в кавычках, слова через AND."""
+        return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', query))
+
+    @classmethod
+    def search(cls, queryset, query):
+        match = cls.match(query)
+        if not match:
+            return queryset.none()
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {cls.FTS_TABLE} '
+            f'WHERE {cls.FTS_TABLE} MATCH %s',
+            (match,)
+        )).annotate(rank=RawSQL(
+            f'SELECT -bm25({cls.FTS_TABLE}, %s, %s) '
+            f'FROM {cls.FTS_TABLE} '
+            f'WHERE {cls.FTS_TABLE} MATCH %s '
+            f'AND rowid = {TABLE}.id',
+            (NAME_WEIGHT, TEXT_WEIGHT, match)
+        )).order_by('-rank', '-id')
+
+
+BACKENDS = {
+    'postgresql': PostgresSearch,
+    'sqlite': SqliteSearch,
+}
+
+
+def get_backend():
+    return BACKENDS.get(connection.vendor, FallbackSearch)
+
+
+def index(recipe_ids):
+    get_backend().index(recipe_ids)
+
+
+def unindex(recipe_ids):
+    get_backend().unindex(recipe_ids)
+
+
+def search(queryset, query):
+    """Рецепты из queryset, подходящие под query, по убыванию rank."""
+    return get_backend().search(queryset, query)
@@ -0,0 +1,117 @@
+"""Уменьшенные копии фотографий рецептов.
+
+Оригинал из recipes/ пережимается в WebP и JPEG для каждой ширины из
+settings.RECIPE_IMAGE_WIDTHS; копии кладутся рядом с оригиналом как
+recipes/<имя>_<ширина>.<формат>. Сжатие идёт в пуле процессов, запись
+файлов и обновление рецепта — в фоновом потоке, чтобы не держать запрос.
+"""
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+from threading import Lock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from PIL import Image, ImageOps
+
+from .models import ModelVersion, Recipe
+
+logger = logging.getLogger(__name__)
+
+FORMATS = (('WEBP', 'webp'), ('JPEG', 'jpg'))
+QUALITY = 80
+
+_lock = Lock()
+_executors = None
+
+
+def derivative_name(name, width, extension):
+    return f'{os.path.splitext(name)[0]}_{width}.{extension}'
+
+
+def thumbnail_name(name):
+    """Имя копии, которую API отдаёт как thumbnail."""
+    return derivative_name(name, min(settings.RECIPE_IMAGE_WIDTHS), 'webp')
+
+
+def delete_derivatives(name):
+    """Удаляет все копии фотографии name (оригинал остаётся)."""
+    for width in settings.RECIPE_IMAGE_WIDTHS:
+        for _, extension in FORMATS:
+            default_storage.delete(derivative_name(name, width, extension))
+
+
+def render(data, widths):
+    """Возвращает {(ширина, расширение): байты} для всех копий."""
+    image = Image.open(BytesIO(data))
+    # JPEG декодируется сразу в уменьшенном виде, но не меньше нужного.
+    image.draft('RGB', (max(widths),) * 2)
+    image = ImageOps.exif_transpose(image).convert('RGB')
+    result = {}
+    for width in widths:
+        resized = image
+        if width < image.width:
+            resized = image.resize(
+                (width, round(image.height * width / image.width)),
+                Image.LANCZOS
+            )
+        for image_format, extension in FORMATS:
+            buffer = BytesIO()
+            resized.save(buffer, image_format, quality=QUALITY)
+            result[width, extension] = buffer.getvalue()
+    return result
+
+
+def process(recipe_id, name, pool=None):
+    """Создаёт копии фотографии name и проставляет рецепту thumbnail."""
+    with default_storage.open(name) as file:
+        data = file.read()
+    widths = settings.RECIPE_IMAGE_WIDTHS
+    if pool is None:
+        rendered = render(data, widths)
+    else:
+        rendered = pool.submit(render, data, widths).result()
+    for (width, extension), content in rendered.items():
+        target = derivative_name(name, width, extension)
+        default_storage.delete(target)
+        default_storage.save(target, ContentFile(content))
+    if Recipe.objects.filter(pk=recipe_id, image=name).update(
+        thumbnail=thumbnail_name(name)
+    ):
+        ModelVersion.objects.bump(ModelVersion.recipe_key(recipe_id))
+
+
+def process_in_background(recipe_id, name, pool):
+    try:
+        process(recipe_id, name, pool)
+    except Exception:
+        logger.exception('Не удалось обработать фотографию %s', name)
+    finally:
+        connection.close()
+
+
+def get_executors():
+    global _executors
+    with _lock:
+        if _executors is None:
+            workers = settings.RECIPE_IMAGE_WORKERS
+            _executors = (
+                ThreadPoolExecutor(workers, thread_name_prefix='images'),
+                ProcessPoolExecutor(workers),
+            )
+        return _executors
+
+
+def schedule(recipe_id, name):
+    """Ставит обработку фотографии в очередь.
+
+    При RECIPE_IMAGE_WORKERS = 0 обрабатывает сразу в текущем потоке.
+    """
+    if not settings.RECIPE_IMAGE_WORKERS:
+        process(recipe_id, name)
+        return
+    threads, processes = get_executors()
+    threads.submit(process_in_background, recipe_id, name, processes)
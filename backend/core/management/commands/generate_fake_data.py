@@ -0,0 +1,259 @@
+import csv
+import multiprocessing
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core import fakedata, fulltext
+from core.models import (Ingredient, IngredientsInRecipe, ModelVersion, Recipe,
+                         Tag, TagsInRecipe)
+from users.models import Favorite, Follow, ShoppingCart, ShoppingListItem, User
+
+TABLES = {
+    'users': (User, fakedata.USER_COLUMNS),
+    'recipes': (Recipe, fakedata.RECIPE_COLUMNS),
+    'recipe_tags': (TagsInRecipe, fakedata.RECIPE_TAG_COLUMNS),
+    'recipe_ingredients': (
+        IngredientsInRecipe, fakedata.RECIPE_INGREDIENT_COLUMNS
+    ),
+    'follows': (Follow, fakedata.FOLLOW_COLUMNS),
+    'favorites': (Favorite, fakedata.USER_RECIPE_COLUMNS),
+    'carts': (ShoppingCart, fakedata.USER_RECIPE_COLUMNS),
+}
+DEFAULT_TAGS = (
+    ('Завтрак', 'breakfast', '#E26C2D'),
+    ('Обед', 'lunch', '#49B64E'),
+    ('Ужин', 'dinner', '#8775D2'),
+)
+
+
+def insert_sql(model, columns):
+    quote = connection.ops.quote_name
+    return quote(model._meta.db_table), ', '.join(
+        quote(model._meta.get_field(name).column) for name in columns
+    )
+
+
+def write_executemany(cursor, model, columns, rows):
+    table, names = insert_sql(model, columns)
+    cursor.executemany(
+        f'INSERT INTO {table} ({names}) '
+        f'VALUES ({", ".join(["%s"] * len(columns))})',
+        rows
+    )
+
+
+def write_copy(cursor, model, columns, rows):
+    """COPY из CSV; NULL передаётся как \\N, чтобы отличать его от ''."""
+    table, names = insert_sql(model, columns)
+    buffer = StringIO()
+    csv.writer(buffer).writerows(
+        ['\\N' if value is None else value for value in row]
+        for row in rows
+    )
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY {table} ({names}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+        buffer
+    )
+
+
+WRITERS = {
+    'postgresql': write_copy,
+}
+
+
+def ordered_results(pool, function, chunks, window):
+    """Результаты pool.submit по порядку, не больше window пачек в работе."""
+    chunks = iter(chunks)
+    pending = deque(
+        pool.submit(function, chunk) for chunk in islice(chunks, window)
+    )
+    while pending:
+        result = pending.popleft().result()
+        for chunk in islice(chunks, 1):
+            pending.append(pool.submit(function, chunk))
+        yield result
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерирует пользователей, рецепты, подписки, избранное и корзины '
+        'для проверок на больших объёмах данных'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Среднее число подписок пользователя',
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=30,
+            help='Среднее число рецептов в избранном',
+        )
+        parser.add_argument(
+            '--carts', type=int, default=3,
+            help='Среднее число рецептов в корзине',
+        )
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=8,
+            help='Среднее число ингредиентов в рецепте',
+        )
+        parser.add_argument(
+            '--skew', type=float, default=1.0,
+            help='Показатель степенного закона популярности',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--workers', type=int, default=(os.cpu_count() or 1) - 1,
+            help=(
+                'Число процессов-генераторов (по умолчанию ядер минус одно: '
+                'основной процесс пишет в БД), 0 — генерировать в основном'
+            ),
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Пользователей или рецептов в одной пачке',
+        )
+        parser.add_argument(
+            '--catalog',
+            default=settings.BASE_DIR.parent / 'data' / 'ingredients.csv',
+            help='Каталог ингредиентов, загружается через load_ingredients',
+        )
+        parser.add_argument(
+            '--password',
+            help='Пароль пользователей; по умолчанию войти под ними нельзя',
+        )
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['recipes'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь и рецепт')
+        if os.path.exists(options['catalog']):
+            # Поднимает ModelVersion.INGREDIENTS, если что-то добавилось.
+            call_command('load_ingredients', options['catalog'])
+        ingredients = list(
+            Ingredient.objects.order_by('id').values_list('id', 'name')
+        )
+        if not ingredients:
+            raise CommandError('Каталог ингредиентов пуст')
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, slug=slug, color=color)
+                for name, slug, color in DEFAULT_TAGS
+            )
+            ModelVersion.objects.bump(ModelVersion.TAGS)
+        users_max = User.objects.order_by('-id').values_list('id').first()
+        recipes_max = Recipe.objects.order_by('-id').values_list(
+            'id'
+        ).first()
+        plan = fakedata.Plan(
+            seed=options['seed'],
+            first_user_id=(users_max[0] if users_max else 0) + 1,
+            users=options['users'],
+            first_recipe_id=(recipes_max[0] if recipes_max else 0) + 1,
+            recipes=options['recipes'],
+            ingredients=ingredients,
+            tag_ids=list(Tag.objects.order_by('id').values_list(
+                'id', flat=True
+            )),
+            follows=options['follows'],
+            favorites=options['favorites'],
+            carts=options['carts'],
+            ingredients_per_recipe=options['ingredients_per_recipe'],
+            skew=options['skew'],
+            password=make_password(options['password']),
+            date_joined=User._meta.get_field('date_joined').get_db_prep_save(
+                timezone.now(), connection
+            ),
+            batch_size=options['batch_size'],
+        )
+        started = time.monotonic()
+        counts = Counter()
+        with transaction.atomic():
+            self.insert(plan, options['workers'], counts)
+            inserted = time.monotonic()
+            self.finish(plan)
+        finished = time.monotonic()
+        rows = sum(counts.values())
+        for table, count in counts.items():
+            self.stdout.write(f'{table}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Вставлено {rows} строк за {inserted - started:.1f} с '
+            f'({rows / max(inserted - started, 1e-9):.0f} строк/с), '
+            f'индексы и списки покупок — {finished - inserted:.1f} с'
+        ))
+        self.stdout.write(
+            'Работающие процессы backend держат индексы рецептов в памяти: '
+            'перезапустите их, чтобы увидеть новые данные.'
+        )
+
+    def insert(self, plan, workers, counts):
+        write = WRITERS.get(connection.vendor, write_executemany)
+        phases = (
+            (fakedata.users, plan.chunks(plan.users)),
+            (fakedata.recipes, plan.chunks(plan.recipes)),
+            (fakedata.relations, plan.chunks(plan.users)),
+        )
+        if workers:
+            pool = ProcessPoolExecutor(
+                workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=fakedata.init,
+                initargs=(plan,),
+            )
+        else:
+            fakedata.init(plan)
+        try:
+            with connection.cursor() as cursor:
+                for function, chunks in phases:
+                    results = (
+                        ordered_results(pool, function, chunks, 2 * workers)
+                        if workers else map(function, chunks)
+                    )
+                    for result in results:
+                        for table, rows in result.items():
+                            if rows:
+                                write(cursor, *TABLES[table], rows)
+                                counts[table] += len(rows)
+        finally:
+            if workers:
+                pool.shutdown(cancel_futures=True)
+
+    @staticmethod
+    def finish(plan):
+        """Сиквенсы, полнотекстовый индекс и списки покупок новых
+        пользователей."""
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                no_style(), [User, Recipe]
+            ):
+                cursor.execute(sql)
+            last_recipe_id = plan.first_recipe_id + plan.recipes
+            for start in range(
+                plan.first_recipe_id, last_recipe_id, plan.batch_size
+            ):
+                fulltext.index(range(
+                    start, min(start + plan.batch_size, last_recipe_id)
+                ))
+            sql, params = ShoppingListItem.objects.expected(
+                users=User.objects.filter(
+                    id__gte=plan.first_user_id
+                ).values('id')
+            ).query.sql_with_params()
+            table, names = insert_sql(
+                ShoppingListItem, ('user_id', 'ingredient_id', 'amount')
+            )
+            cursor.execute(f'INSERT INTO {table} ({names}) {sql}', params)
@@ -0,0 +1,166 @@
+import csv
+import json
+import time
+from io import StringIO
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.models import Ingredient, ModelVersion
+
+CHUNK_SIZE = 1 << 16
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            name, measurement_unit = row[:2]
+            yield name.strip(), measurement_unit.strip()
+
+
+def read_json(file):
+    """Потоково разбирает JSON-массив объектов, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается JSON-массив ингредиентов')
+    position = 1
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if buffer.startswith(']', position):
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                raise CommandError('Файл ингредиентов обрывается')
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item['name'].strip(), item['measurement_unit'].strip()
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    batch = list(islice(rows, size))
+    while batch:
+        yield batch
+        batch = list(islice(rows, size))
+
+
+def load_batch_orm(batch):
+    Ingredient.objects.bulk_create(
+        (Ingredient(name=name, measurement_unit=measurement_unit)
+         for name, measurement_unit in batch),
+        batch_size=len(batch),
+        ignore_conflicts=True,
+    )
+
+
+def load_batch_executemany(batch):
+    """Один подготовленный INSERT ... ON CONFLICT на всю пачку (SQLite)."""
+    table = Ingredient._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {table} (name, measurement_unit) VALUES (%s, %s) '
+            'ON CONFLICT (name, measurement_unit) DO NOTHING',
+            batch
+        )
+
+
+def csv_buffer(batch):
+    buffer = StringIO()
+    csv.writer(buffer).writerows(batch)
+    buffer.seek(0)
+    return buffer
+
+
+def load_batch_copy(batch):
+    """COPY во временную таблицу и один INSERT ... ON CONFLICT."""
+    table = Ingredient._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMP TABLE IF NOT EXISTS ingredient_staging '
+            '(name varchar(200), measurement_unit varchar(200)) '
+            'ON COMMIT DELETE ROWS'
+        )
+        buffer = csv_buffer(batch)
+        cursor.copy_expert(
+            'COPY ingredient_staging (name, measurement_unit) '
+            'FROM STDIN WITH (FORMAT csv)',
+            buffer
+        )
+        cursor.execute(
+            f'INSERT INTO {table} (name, measurement_unit) '
+            'SELECT DISTINCT name, measurement_unit FROM ingredient_staging '
+            'ON CONFLICT (name, measurement_unit) DO NOTHING'
+        )
+        cursor.execute('TRUNCATE ingredient_staging')
+
+
+LOADERS = {
+    'postgresql': load_batch_copy,
+    'sqlite': load_batch_executemany,
+}
+
+
+class Command(BaseCommand):
+    help = 'Загружает каталог ингредиентов из CSV или JSON (идемпотентно)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=settings.BASE_DIR / 'ingredient.json',
+            type=Path,
+            help='Путь к .csv (name,measurement_unit) или .json файлу',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='Количество строк в одной пачке',
+        )
+        parser.add_argument(
+            '--orm',
+            action='store_true',
+            help='Загружать через bulk_create вместо COPY/executemany',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        load_batch = load_batch_orm
+        if not options['orm']:
+            load_batch = LOADERS.get(connection.vendor, load_batch_orm)
+        before = Ingredient.objects.count()
+        total = 0
+        started = time.monotonic()
+        with open(path, encoding='utf-8', newline='') as file:
+            for batch in batches(reader(file), options['batch_size']):
+                with transaction.atomic():
+                    load_batch(batch)
+                total += len(batch)
+        elapsed = time.monotonic() - started
+        created = Ingredient.objects.count() - before
+        if created:
+            # Пачки пишутся без сигналов: версию каталога (ETag и индекс
+            # поиска в процессах backend) поднимаем явно.
+            ModelVersion.objects.bump(ModelVersion.INGREDIENTS)
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано {total} строк, добавлено {created} за '
+            f'{elapsed:.2f} с ({total / max(elapsed, 1e-9):.0f} строк/с)'
+        ))
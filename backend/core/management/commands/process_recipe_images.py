@@ -0,0 +1,57 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core import images
+from core.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создаёт уменьшенные копии фотографий, у которых их ещё нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать копии для всех рецептов',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Число процессов для сжатия (по умолчанию по числу ядер)',
+        )
+
+    def handle(self, *args, **options):
+        pending = [
+            (recipe_id, image)
+            for recipe_id, image, thumbnail
+            in Recipe.objects.exclude(image='').exclude(image=None)
+            .values_list('id', 'image', 'thumbnail').iterator()
+            if options['all'] or thumbnail != images.thumbnail_name(image)
+        ]
+        workers = options['workers']
+        with ProcessPoolExecutor(workers) as pool, \
+                ThreadPoolExecutor(workers) as threads:
+            errors = [
+                error for error in threads.map(
+                    lambda item: self.process(*item, pool), pending
+                ) if error
+            ]
+        for error in errors:
+            self.stderr.write(error)
+        self.stdout.write(
+            f'Обработано: {len(pending) - len(errors)}, '
+            f'ошибок: {len(errors)}'
+        )
+
+    @staticmethod
+    def process(recipe_id, image, pool):
+        try:
+            images.process(recipe_id, image, pool)
+        except Exception as error:
+            return f'{image}: {error}'
+        finally:
+            connection.close()
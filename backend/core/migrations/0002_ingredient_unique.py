@@ -0,0 +1,74 @@
+# Generated by Django 3.2.18 on 2026-10-18 18:38
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+# Модели со ссылкой на ингредиент и количеством: (приложение, модель,
+# поле, в пределах которого строки с одним ингредиентом сливаются).
+REFERENCES = (
+    ('core', 'IngredientsInRecipe', 'recipe'),
+    ('users', 'ShoppingListItem', 'user'),
+)
+
+
+def merge_duplicates(apps, schema_editor):
+    """Сливает ингредиенты с одинаковыми name и measurement_unit.
+
+    Остаётся ингредиент с меньшим id; ссылки на остальные переводятся на
+    него, а строки одного рецепта (списка покупок) с этим ингредиентом
+    объединяются с суммой количеств. Из таких строк остаётся та, что уже
+    ссылается на оставляемый ингредиент, а остальные удаляются до
+    UPDATE: список покупок уникален по (user, ingredient).
+    """
+    ingredient = apps.get_model('core', 'Ingredient')
+    duplicates = ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(keep=Min('id'), total=Count('id')).filter(
+        total__gt=1
+    ).order_by()
+    for duplicate in duplicates:
+        keep = duplicate['keep']
+        extra = list(ingredient.objects.filter(
+            name=duplicate['name'],
+            measurement_unit=duplicate['measurement_unit'],
+        ).exclude(id=keep).values_list('id', flat=True))
+        for app_label, model_name, owner in REFERENCES:
+            model = apps.get_model(app_label, model_name)
+            groups = {}
+            for row_id, owner_id, ingredient_id, amount in (
+                model.objects.filter(
+                    ingredient_id__in=[keep, *extra]
+                ).order_by('id').values_list(
+                    'id', f'{owner}_id', 'ingredient_id', 'amount'
+                )
+            ):
+                group = groups.setdefault(owner_id, [None, 0, []])
+                if group[0] is None or ingredient_id == keep:
+                    group[0] = row_id
+                group[1] += amount
+                group[2].append(row_id)
+            model.objects.filter(id__in=[
+                row_id for target, _, row_ids in groups.values()
+                for row_id in row_ids if row_id != target
+            ]).delete()
+            for target, amount, _ in groups.values():
+                model.objects.filter(id=target).update(
+                    ingredient_id=keep, amount=amount
+                )
+        ingredient.objects.filter(id__in=extra).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('users', '0002_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
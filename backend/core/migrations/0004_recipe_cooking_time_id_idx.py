@@ -0,0 +1,17 @@
+# Generated by Django 3.2.18 on 2026-10-18 18:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_modelversion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-cooking_time', '-id'], name='recipe_cooking_time_id_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.18 on 2026-10-18 18:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_recipe_cooking_time_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tagsinrecipe',
+            index=models.Index(fields=['recipe', 'tag'], name='tagsinrecipe_recipe_tag_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.18 on 2026-10-18 18:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_tagsinrecipe_recipe_tag_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='thumbnail',
+            field=models.ImageField(blank=True, editable=False, upload_to='recipes/', verbose_name='Миниатюра фотографии'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations
+
+VECTOR = (
+    "setweight(to_tsvector('russian', name), 'A') || "
+    "setweight(to_tsvector('russian', text), 'D')"
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'ALTER TABLE core_recipe ADD COLUMN search_vector tsvector'
+        )
+        schema_editor.execute(
+            f'UPDATE core_recipe SET search_vector = {VECTOR}'
+        )
+        schema_editor.execute(
+            'CREATE INDEX recipe_search_vector_idx '
+            'ON core_recipe USING gin (search_vector)'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE core_recipe_fts USING fts5('
+            "name, text, tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            'INSERT INTO core_recipe_fts (rowid, name, text) '
+            'SELECT id, name, text FROM core_recipe'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'ALTER TABLE core_recipe DROP COLUMN search_vector'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE core_recipe_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_recipe_thumbnail'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
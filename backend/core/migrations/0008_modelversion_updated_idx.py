@@ -0,0 +1,17 @@
+# Generated by Django 3.2.18 on 2026-10-18 18:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_recipe_fulltext'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='modelversion',
+            index=models.Index(fields=['updated'], name='modelversion_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.18 on 2026-10-18 18:59
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_modelversion_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='recipe',
+            options={'ordering': ['-cooking_time', '-id'], 'verbose_name': 'Рецепт', 'verbose_name_plural': 'Рецепты'},
+        ),
+        migrations.AlterModelOptions(
+            name='tag',
+            options={'ordering': ['name', 'id'], 'verbose_name': 'Тег', 'verbose_name_plural': 'Теги'},
+        ),
+    ]
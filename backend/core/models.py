@@ -1,13 +1,58 @@
 from colorfield.fields import ColorField
 from django.contrib.auth import get_user_model
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import connections, models
+from django.db.models import F
+from django.utils import timezone
 
 from .constants import (MAX_AMOUNT_OF_INGREDIENT, MAX_COOKING_TIME,
                         MIN_AMOUNT_OF_INGREDIENT, MIN_COOKING_TIME)
 
 User = get_user_model()
 
+DELETE_BATCH_SIZE = 500
+
+
+class BatchDeleteQuerySet(models.QuerySet):
+
+    def delete_without_signals(self, pks=None):
+        """Удаляет строки выборки DELETE ... WHERE pk IN без сигналов.
+
+        Обычный delete() шлёт pre_delete/post_delete на каждую строку.
+        Метод нужен там, где вызывающий код сам пакетно делает работу
+        receivers (списки покупок, версии), иначе она выполнилась бы
+        второй раз и построчно. Каскадов нет, поэтому модели со ссылками на
+        себя не поддерживаются. Если строки уже прочитаны, их pk передаются
+        в pks, и выборка не запрашивается.
+
+        Возвращает pk строк, которые удалил именно этот DELETE (RETURNING):
+        строку, прочитанную двумя запросами одновременно, удалит только
+        один из них, и только он должен учитывать её удаление.
+        """
+        meta = self.model._meta
+        if meta.related_objects:
+            raise TypeError(
+                f'{meta.label}: на модель ссылаются другие, нужен delete()'
+            )
+        if pks is None:
+            pks = list(self.values_list('pk', flat=True))
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        pk_column = quote(meta.pk.column)
+        deleted = []
+        with connection.cursor() as cursor:
+            for start in range(0, len(pks), DELETE_BATCH_SIZE):
+                batch = pks[start:start + DELETE_BATCH_SIZE]
+                cursor.execute(
+                    f'DELETE FROM {quote(meta.db_table)} '
+                    f'WHERE {pk_column} IN '
+                    f'({", ".join(["%s"] * len(batch))}) '
+                    f'RETURNING {pk_column}',
+                    batch
+                )
+                deleted.extend(pk for pk, in cursor.fetchall())
+        return deleted
+
 
 class Ingredient(models.Model):
     measurement_unit = models.CharField(
@@ -23,6 +68,12 @@ class Ingredient(models.Model):
         ordering = ['name']
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name}({self.measurement_unit})'
@@ -41,7 +92,7 @@ class Tag(models.Model):
     )
 
     class Meta:
-        ordering = ['name']
+        ordering = ['name', 'id']
         verbose_name = 'Тег'
         verbose_name_plural = 'Теги'
 
@@ -62,6 +113,12 @@ class Recipe(models.Model):
         blank=True,
         verbose_name='Фотография блюда'
     )
+    thumbnail = models.ImageField(
+        upload_to='recipes/',
+        blank=True,
+        editable=False,
+        verbose_name='Миниатюра фотографии'
+    )
     name = models.CharField(
         max_length=200,
         verbose_name='Название рецепта'
@@ -84,9 +141,15 @@ class Recipe(models.Model):
     )
 
     class Meta:
-        ordering = ['-cooking_time']
+        ordering = ['-cooking_time', '-id']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=('-cooking_time', '-id'),
+                name='recipe_cooking_time_id_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'Рецепт {self.name} от автора {self.author.username}.'
@@ -113,6 +176,8 @@ class IngredientsInRecipe(models.Model):
         verbose_name='Количество ингредиента'
     )
 
+    objects = BatchDeleteQuerySet.as_manager()
+
     class Meta:
         ordering = ['id']
         verbose_name = 'Игнредиенты в рецептах'
@@ -141,6 +206,80 @@ class TagsInRecipe(models.Model):
         ordering = ['id']
         verbose_name = 'Тег'
         verbose_name_plural = 'Теги'
+        indexes = [
+            models.Index(
+                fields=('recipe', 'tag'),
+                name='tagsinrecipe_recipe_tag_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.recipe.name} содержит {self.tag.name})'
+
+
+class ModelVersionQuerySet(models.QuerySet):
+
+    def bump(self, *keys):
+        """Увеличивает счётчики версий для ключей, создавая недостающие."""
+        if not keys:
+            return
+        self.bulk_create(
+            (self.model(key=key) for key in keys),
+            ignore_conflicts=True
+        )
+        self.filter(key__in=keys).update(
+            version=F('version') + 1,
+            updated=timezone.now()
+        )
+
+    def get_versions(self, keys):
+        return {
+            key: (version, updated)
+            for key, version, updated in self.filter(
+                key__in=keys
+            ).values_list('key', 'version', 'updated')
+        }
+
+
+class ModelVersion(models.Model):
+    """Счётчик версий для условных GET-запросов и кэша."""
+    key = models.CharField(
+        max_length=100,
+        unique=True,
+        verbose_name='Ключ'
+    )
+    version = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Версия'
+    )
+    updated = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Время изменения'
+    )
+
+    TAGS = 'tags'
+    INGREDIENTS = 'ingredients'
+
+    objects = ModelVersionQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['key']
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
+        indexes = [
+            models.Index(
+                fields=('updated',),
+                name='modelversion_updated_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.key}: {self.version}'
+
+    @staticmethod
+    def recipe_key(recipe_id):
+        return f'recipe:{recipe_id}'
+
+    @staticmethod
+    def user_key(user_id):
+        return f'user:{user_id}'
@@ -0,0 +1,99 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import fulltext, images
+from .models import (Ingredient, IngredientsInRecipe, ModelVersion, Recipe,
+                     Tag, TagsInRecipe, User)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_tags_version(sender, **kwargs):
+    ModelVersion.objects.bump(ModelVersion.TAGS)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_ingredients_version(sender, **kwargs):
+    ModelVersion.objects.bump(ModelVersion.INGREDIENTS)
+
+
+@receiver(post_save, sender=Recipe)
+def bump_recipe_version(sender, instance, **kwargs):
+    ModelVersion.objects.bump(ModelVersion.recipe_key(instance.id))
+
+
+@receiver(post_delete, sender=Recipe)
+def drop_recipe_version(sender, instance, **kwargs):
+    # Без версии условный GET не ответит 304 на удалённый рецепт.
+    ModelVersion.objects.filter(
+        key=ModelVersion.recipe_key(instance.id)
+    ).delete()
+
+
+@receiver(pre_save, sender=Recipe)
+def reset_recipe_thumbnail(sender, instance, update_fields=None, **kwargs):
+    """При смене фотографии сбрасывает thumbnail в том же сохранении.
+
+    Пока новые копии не готовы, API отдаёт вместо миниатюры оригинал;
+    копии прежней фотографии удаляются после коммита.
+    """
+    if instance.pk is None or (
+        update_fields is not None and 'image' not in update_fields
+    ):
+        return
+    previous = sender.objects.filter(pk=instance.pk).values_list(
+        'image', flat=True
+    ).first()
+    if not previous:
+        return
+    if (instance.image.name == previous
+            and getattr(instance.image, '_committed', True)):
+        return
+    instance.thumbnail = ''
+    if update_fields is not None and 'thumbnail' not in update_fields:
+        sender.objects.filter(pk=instance.pk).update(thumbnail='')
+    transaction.on_commit(partial(images.delete_derivatives, previous))
+
+
+@receiver(post_save, sender=Recipe)
+def process_recipe_image(sender, instance, **kwargs):
+    if not instance.image:
+        return
+    if instance.thumbnail.name != images.thumbnail_name(instance.image.name):
+        transaction.on_commit(
+            partial(images.schedule, instance.id, instance.image.name)
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe_text(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or {'name', 'text'} & update_fields:
+        fulltext.index([instance.id])
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_recipe_text(sender, instance, **kwargs):
+    fulltext.unindex([instance.id])
+
+
+@receiver(post_save, sender=IngredientsInRecipe)
+@receiver(post_delete, sender=IngredientsInRecipe)
+@receiver(post_save, sender=TagsInRecipe)
+@receiver(post_delete, sender=TagsInRecipe)
+def bump_recipe_version_on_relation(sender, instance, **kwargs):
+    ModelVersion.objects.bump(ModelVersion.recipe_key(instance.recipe_id))
+
+
+@receiver(post_save, sender=User)
+def bump_author_recipes_version(sender, instance, created,
+                                update_fields=None, **kwargs):
+    if created or update_fields == frozenset({'last_login'}):
+        return
+    ModelVersion.objects.bump(*(
+        ModelVersion.recipe_key(recipe_id)
+        for recipe_id in instance.recipes.values_list('id', flat=True)
+    ))
@@ -0,0 +1,394 @@
+import json
+import random
+from collections import Counter
+from io import BytesIO, StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from PIL import Image
+
+from core import fakedata, images
+from core.management.commands import load_ingredients
+from core.models import (Ingredient, IngredientsInRecipe, ModelVersion, Recipe,
+                         User)
+from users.models import Follow, ShoppingListItem
+
+
+class MergeDuplicateIngredientsMigrationTest(TransactionTestCase):
+    migrate_from = [
+        ('core', '0001_initial'), ('users', '0002_shoppinglistitem')
+    ]
+    migrate_to = [('core', '0002_ingredient_unique')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_duplicates_are_merged_into_existing_rows(self):
+        apps = self.migrate(self.migrate_from)
+        ingredient = apps.get_model('core', 'Ingredient')
+        user_model = apps.get_model('auth', 'User')
+        recipe_model = apps.get_model('core', 'Recipe')
+        ingredients_in_recipe = apps.get_model('core', 'IngredientsInRecipe')
+        shopping_list_item = apps.get_model('users', 'ShoppingListItem')
+        keep, duplicate, other = (
+            ingredient.objects.create(name=name, measurement_unit='шт')
+            for name in ('морская соль', 'морская соль', 'розовый перец')
+        )
+        both, only_duplicate = (
+            user_model.objects.create(username=name, email=f'{name}@x.ru')
+            for name in ('both', 'only')
+        )
+        recipe = recipe_model.objects.create(
+            author=both, name='Рецепт', text='Текст', cooking_time=1
+        )
+        ingredients_in_recipe.objects.bulk_create([
+            ingredients_in_recipe(recipe=recipe, ingredient=keep, amount=5),
+            ingredients_in_recipe(
+                recipe=recipe, ingredient=duplicate, amount=7
+            ),
+            ingredients_in_recipe(recipe=recipe, ingredient=other, amount=1),
+        ])
+        shopping_list_item.objects.bulk_create([
+            shopping_list_item(user=both, ingredient=duplicate, amount=3),
+            shopping_list_item(user=both, ingredient=keep, amount=2),
+            shopping_list_item(
+                user=only_duplicate, ingredient=duplicate, amount=4
+            ),
+        ])
+
+        apps = self.migrate(self.migrate_to)
+
+        ingredient = apps.get_model('core', 'Ingredient')
+        self.assertEqual(
+            list(ingredient.objects.filter(
+                name='морская соль'
+            ).values_list('id', flat=True)),
+            [keep.id]
+        )
+        self.assertEqual(
+            sorted(apps.get_model(
+                'core', 'IngredientsInRecipe'
+            ).objects.values_list('ingredient_id', 'amount')),
+            sorted([(keep.id, 12), (other.id, 1)])
+        )
+        self.assertEqual(
+            sorted(apps.get_model(
+                'users', 'ShoppingListItem'
+            ).objects.values_list('user_id', 'ingredient_id', 'amount')),
+            [(both.id, keep.id, 5), (only_duplicate.id, keep.id, 4)]
+        )
+
+
+class LoadIngredientsTest(TestCase):
+    rows = [
+        ('Зюзюка', 'г'),
+        ('  Зюзюка ', 'г '),
+        ('Зюзюка', 'шт'),
+        ('абрикосовое варенье', 'г'),
+    ]
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def write(self, name, content):
+        path = self.directory / name
+        path.write_text(content, encoding='utf-8')
+        return path
+
+    def write_csv(self):
+        return self.write('ingredients.csv', ''.join(
+            f'{name},{unit}\n' for name, unit in self.rows
+        ) + '\n')
+
+    def write_json(self):
+        return self.write('ingredients.json', json.dumps([
+            {'name': name, 'measurement_unit': unit}
+            for name, unit in self.rows
+        ], ensure_ascii=False, indent=2))
+
+    def load(self, path, *args):
+        call_command('load_ingredients', path, *args, stdout=StringIO())
+
+    def version(self):
+        return ModelVersion.objects.get_versions(
+            [ModelVersion.INGREDIENTS]
+        ).get(ModelVersion.INGREDIENTS, (0, None))[0]
+
+    def assertLoaded(self):
+        self.assertEqual(
+            set(Ingredient.objects.filter(name='Зюзюка').values_list(
+                'name', 'measurement_unit'
+            )),
+            {('Зюзюка', 'г'), ('Зюзюка', 'шт')}
+        )
+
+    def test_formats_and_loaders_are_idempotent(self):
+        for path, args in (
+            (self.write_csv(), ()),
+            (self.write_csv(), ('--orm',)),
+            (self.write_json(), ('--batch-size', '1')),
+        ):
+            with self.subTest(path=path.name, args=args):
+                Ingredient.objects.filter(name='Зюзюка').delete()
+                before = Ingredient.objects.count()
+                self.load(path, *args)
+                self.load(path, *args)
+                self.assertLoaded()
+                self.assertEqual(Ingredient.objects.count(), before + 2)
+
+    def test_json_is_read_in_chunks(self):
+        with mock.patch.object(load_ingredients, 'CHUNK_SIZE', 7):
+            self.load(self.write_json())
+        self.assertLoaded()
+
+    def test_version_is_bumped_only_when_rows_are_added(self):
+        path = self.write_csv()
+        version = self.version()
+        self.load(path)
+        self.assertEqual(self.version(), version + 1)
+        self.load(path)
+        self.assertEqual(self.version(), version + 1)
+
+    def test_bad_files(self):
+        for name, content in (
+            ('ingredients.txt', 'Зюзюка,г'),
+            ('ingredients.json', '{"name": "Зюзюка"}'),
+            ('ingredients.json', '[{"name": "Зюзюка", "measurement_'),
+        ):
+            with self.subTest(name=name, content=content):
+                with self.assertRaises(CommandError):
+                    self.load(self.write(name, content))
+
+
+def image_bytes(size, image_format='PNG'):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, image_format)
+    return buffer.getvalue()
+
+
+class RecipeImageTest(TestCase):
+    widths = (16, 48)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author', email='author@example.com'
+        )
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(
+            MEDIA_ROOT=directory.name, RECIPE_IMAGE_WORKERS=0,
+            RECIPE_IMAGE_WIDTHS=self.widths
+        )
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def create_recipe(self, size=(64, 32)):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe(
+                author=self.author, name='Рецепт', text='Текст',
+                cooking_time=1
+            )
+            recipe.image.save(
+                'photo.png', ContentFile(image_bytes(size)), save=False
+            )
+            recipe.save()
+        recipe.refresh_from_db()
+        return recipe
+
+    def derivatives(self, name):
+        return [
+            images.derivative_name(name, width, extension)
+            for width in self.widths for _, extension in images.FORMATS
+        ]
+
+    def test_render_downsizes_without_upscaling(self):
+        rendered = images.render(image_bytes((32, 20)), self.widths)
+        self.assertEqual(set(rendered), {
+            (width, extension)
+            for width in self.widths for _, extension in images.FORMATS
+        })
+        for (width, extension), data in rendered.items():
+            with self.subTest(width=width, extension=extension):
+                image = Image.open(BytesIO(data))
+                self.assertEqual(image.format, dict(
+                    (value, key) for key, value in images.FORMATS
+                )[extension])
+                self.assertEqual(
+                    image.size, (16, 10) if width == 16 else (32, 20)
+                )
+
+    def test_saved_image_gets_derivatives_and_thumbnail(self):
+        recipe = self.create_recipe()
+        for name in self.derivatives(recipe.image.name):
+            self.assertTrue(default_storage.exists(name), name)
+        self.assertEqual(
+            recipe.thumbnail.name, images.thumbnail_name(recipe.image.name)
+        )
+        self.assertTrue(recipe.thumbnail.name.endswith('_16.webp'))
+
+    def test_stale_processing_does_not_set_thumbnail(self):
+        recipe = self.create_recipe()
+        Recipe.objects.filter(pk=recipe.pk).update(thumbnail='')
+        version = ModelVersion.objects.get_versions(
+            [ModelVersion.recipe_key(recipe.id)]
+        )
+        name = default_storage.save(
+            'recipes/other.png', ContentFile(image_bytes((8, 8)))
+        )
+        images.process(recipe.id, name)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.thumbnail.name, '')
+        self.assertEqual(
+            ModelVersion.objects.get_versions(
+                [ModelVersion.recipe_key(recipe.id)]
+            ),
+            version
+        )
+
+    def test_image_change_resets_thumbnail_and_deletes_derivatives(self):
+        recipe = self.create_recipe()
+        previous = recipe.image.name
+        with self.captureOnCommitCallbacks() as callbacks:
+            recipe.image.save(
+                'new.png', ContentFile(image_bytes((40, 40))), save=False
+            )
+            recipe.save()
+            self.assertEqual(
+                Recipe.objects.get(pk=recipe.pk).thumbnail.name, ''
+            )
+        for callback in callbacks:
+            callback()
+        recipe.refresh_from_db()
+        self.assertTrue(default_storage.exists(previous))
+        for name in self.derivatives(previous):
+            self.assertFalse(default_storage.exists(name), name)
+        for name in self.derivatives(recipe.image.name):
+            self.assertTrue(default_storage.exists(name), name)
+        self.assertEqual(
+            recipe.thumbnail.name, images.thumbnail_name(recipe.image.name)
+        )
+
+    def test_other_fields_keep_thumbnail(self):
+        recipe = self.create_recipe()
+        thumbnail = recipe.thumbnail.name
+        with mock.patch.object(images, 'schedule') as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                recipe.name = 'Другое название'
+                recipe.save()
+        schedule.assert_not_called()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.thumbnail.name, thumbnail)
+
+
+class FakeDataTest(TestCase):
+
+    def make_plan(self, **kwargs):
+        return fakedata.Plan(**{
+            'seed': 0, 'first_user_id': 101, 'users': 25,
+            'first_recipe_id': 1001, 'recipes': 40,
+            'ingredients': [(i, f'ингредиент {i}') for i in range(1, 31)],
+            'tag_ids': [1, 2, 3], 'follows': 3, 'favorites': 4, 'carts': 2,
+            'ingredients_per_recipe': 3, 'skew': 1.0, 'password': '!',
+            'date_joined': '2024-01-01', 'batch_size': 10, **kwargs,
+        })
+
+    def generate(self, plan, order=None):
+        fakedata.init(plan)
+        self.addCleanup(fakedata.init, None)
+        result = {}
+        for function, count in (
+            (fakedata.users, plan.users),
+            (fakedata.recipes, plan.recipes),
+            (fakedata.relations, plan.users),
+        ):
+            chunks = list(plan.chunks(count))
+            results = {
+                chunk: function(chunk) for chunk in (order or list)(chunks)
+            }
+            for chunk in chunks:
+                for table, rows in results[chunk].items():
+                    result.setdefault(table, []).extend(rows)
+        return result
+
+    def test_chunks_do_not_depend_on_order(self):
+        plan = self.make_plan()
+        data = self.generate(plan)
+        self.assertEqual(self.generate(plan, reversed), data)
+        self.assertNotEqual(self.generate(self.make_plan(seed=1)), data)
+        self.assertEqual(
+            [row[0] for row in data['users']], list(range(101, 126))
+        )
+        self.assertEqual(
+            [row[0] for row in data['recipes']], list(range(1001, 1041))
+        )
+        for table in ('follows', 'favorites', 'carts'):
+            with self.subTest(table=table):
+                self.assertEqual(
+                    len(set(data[table])), len(data[table])
+                )
+        for user_id, following_id in data['follows']:
+            self.assertNotEqual(user_id, following_id)
+            self.assertIn(following_id, range(101, 126))
+
+    def test_power_law(self):
+        rng = random.Random(0)
+        law = fakedata.PowerLaw(50, 1.0, 3)
+        self.assertEqual(
+            {(rank * law.step + law.offset) % 50 for rank in range(50)},
+            set(range(50))
+        )
+        counts = Counter(law.pick(rng) for _ in range(10000))
+        self.assertLessEqual(set(counts), set(range(50)))
+        (top, top_count), = counts.most_common(1)
+        self.assertEqual(top, law.offset)
+        self.assertGreater(top_count, 10 * min(counts.values()))
+        sample = law.sample(rng, 49, exclude=top)
+        self.assertEqual(len(set(sample)), 49)
+        self.assertNotIn(top, sample)
+        self.assertEqual(len(law.sample(rng, 100)), 50)
+
+    def test_command(self):
+        users = User.objects.count()
+        stdout = StringIO()
+        with TemporaryDirectory() as directory:
+            call_command(
+                'generate_fake_data', '--users', '12', '--recipes', '30',
+                '--batch-size', '5', '--workers', '0',
+                '--catalog', str(Path(directory) / 'missing.csv'),
+                stdout=stdout
+            )
+        self.assertIn('recipes: 30', stdout.getvalue())
+        self.assertEqual(User.objects.count(), users + 12)
+        self.assertEqual(Recipe.objects.count(), 30)
+        self.assertTrue(IngredientsInRecipe.objects.exists())
+        self.assertFalse(Follow.objects.filter(user=F('following')).exists())
+        self.assertEqual(
+            sorted(ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            )),
+            sorted(ShoppingListItem.objects.expected())
+        )
+        recipe = Recipe.objects.create(
+            author=User.objects.latest('id'), name='Новый', text='Текст',
+            cooking_time=1
+        )
+        self.assertEqual(recipe.id, 31)
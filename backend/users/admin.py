@@ -1,6 +1,6 @@
 from django.contrib.admin import ModelAdmin, site
 
-from .models import Favorite, Follow, ShoppingCart
+from .models import Favorite, Follow, ShoppingCart, ShoppingListItem
 
 
 class FollowAdmin(ModelAdmin):
@@ -11,6 +11,11 @@ class FavoriteAdmin(ModelAdmin):
     list_display = ('user', 'recipe')
 
 
+class ShoppingListItemAdmin(ModelAdmin):
+    list_display = ('user', 'ingredient', 'amount')
+
+
 site.register(Follow, FollowAdmin)
 site.register(Favorite, FavoriteAdmin)
 site.register(ShoppingCart, FavoriteAdmin)
+site.register(ShoppingListItem, ShoppingListItemAdmin)
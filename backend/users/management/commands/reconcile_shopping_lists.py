@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from users.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает списки покупок по корзинам и сообщает о расхождениях'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, не исправляя их',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            expected = {
+                (user_id, ingredient_id): total
+                for user_id, ingredient_id, total
+                in ShoppingListItem.objects.expected().iterator()
+            }
+            actual = dict(
+                ((user_id, ingredient_id), amount)
+                for user_id, ingredient_id, amount
+                in ShoppingListItem.objects.select_for_update().values_list(
+                    'user_id', 'ingredient_id', 'amount'
+                ).iterator()
+            )
+            drift = sorted(
+                (key, actual.get(key), expected.get(key))
+                for key in expected.keys() | actual.keys()
+                if actual.get(key) != expected.get(key)
+            )
+            for (user_id, ingredient_id), found, wanted in drift:
+                self.stdout.write(
+                    f'user={user_id} ingredient={ingredient_id}: '
+                    f'{found} -> {wanted}'
+                )
+            if not options['dry_run']:
+                ShoppingListItem.objects.all().delete()
+                ShoppingListItem.objects.bulk_create(
+                    (ShoppingListItem(user_id=user_id,
+                                      ingredient_id=ingredient_id,
+                                      amount=total)
+                     for (user_id, ingredient_id), total in expected.items()),
+                    batch_size=1000,
+                )
+        style = self.style.WARNING if drift else self.style.SUCCESS
+        self.stdout.write(style(
+            f'Расхождений: {len(drift)}, строк в списках: {len(expected)}'
+        ))
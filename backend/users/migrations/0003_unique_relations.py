@@ -0,0 +1,77 @@
+# Generated by Django 3.2.18 on 2026-10-18 18:46
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+RELATIONS = (
+    ('Follow', 'following'),
+    ('Favorite', 'recipe'),
+    ('ShoppingCart', 'recipe'),
+)
+
+
+def remove_duplicates(apps, schema_editor):
+    removed_from_cart = False
+    for model_name, field in RELATIONS:
+        model = apps.get_model('users', model_name)
+        duplicates = model.objects.values('user', field).annotate(
+            keep=Min('id'), total=Count('id')
+        ).filter(total__gt=1).order_by()
+        for duplicate in duplicates:
+            deleted, _ = model.objects.filter(
+                user=duplicate['user'], **{field: duplicate[field]}
+            ).exclude(id=duplicate['keep']).delete()
+            removed_from_cart |= model_name == 'ShoppingCart' and deleted > 0
+    if removed_from_cart:
+        rebuild_shopping_lists(apps)
+
+
+def rebuild_shopping_lists(apps):
+    ingredients_in_recipe = apps.get_model('core', 'IngredientsInRecipe')
+    shopping_list_item = apps.get_model('users', 'ShoppingListItem')
+    totals = ingredients_in_recipe.objects.filter(
+        recipe__is_in_shopping_cart__isnull=False
+    ).values_list(
+        'recipe__is_in_shopping_cart__user', 'ingredient'
+    ).annotate(total=Sum('amount')).order_by()
+    shopping_list_item.objects.all().delete()
+    shopping_list_item.objects.bulk_create(
+        shopping_list_item(user_id=user_id, ingredient_id=ingredient_id,
+                           amount=total)
+        for user_id, ingredient_id, total in totals.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['recipe', 'user'], name='favorite_recipe_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['following', 'user'], name='follow_following_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoppingcart',
+            index=models.Index(fields=['recipe', 'user'], name='shoppingcart_recipe_user_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite'),
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'following'), name='unique_follow'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_shopping_cart'),
+        ),
+    ]
@@ -1,10 +1,96 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import Case, F, Sum, Value, When
+from django.db.models.functions import Greatest
+from django.dispatch import Signal
 
-from core.models import Recipe
+from core.models import (BatchDeleteQuerySet, Ingredient, IngredientsInRecipe,
+                         Recipe)
 
 User = get_user_model()
 
+INSERT_BATCH_SIZE = 500
+
+# Пакетные аналоги post_save(created=True) и post_delete, аргумент instances.
+relations_created = Signal()
+relations_deleted = Signal()
+
+
+class UserRelationQuerySet(BatchDeleteQuerySet):
+
+    def insert_ignore(self, objs):
+        """Вставляет objs через INSERT ... ON CONFLICT DO NOTHING.
+
+        Конфликт определяется первым UniqueConstraint модели. Возвращает
+        только добавленные объекты и отправляет для них relations_created.
+        """
+        meta = self.model._meta
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        fields = [field for field in meta.concrete_fields
+                  if not field.primary_key]
+        unique = [
+            meta.get_field(name) for name in next(
+                constraint.fields for constraint in meta.constraints
+                if isinstance(constraint, models.UniqueConstraint)
+            )
+        ]
+        columns = ', '.join(quote(field.column) for field in fields)
+        conflict = ', '.join(quote(field.column) for field in unique)
+        placeholders = '(' + ', '.join(['%s'] * len(fields)) + ')'
+        created = []
+        objs = list(objs)
+        for start in range(0, len(objs), INSERT_BATCH_SIZE):
+            batch = objs[start:start + INSERT_BATCH_SIZE]
+            by_key = {
+                tuple(getattr(obj, field.attname) for field in unique): obj
+                for obj in batch
+            }
+            sql = (
+                f'INSERT INTO {quote(meta.db_table)} ({columns}) '
+                f'VALUES {", ".join([placeholders] * len(by_key))} '
+                f'ON CONFLICT ({conflict}) DO NOTHING '
+                f'RETURNING {quote(meta.pk.column)}, {conflict}'
+            )
+            params = [
+                field.get_db_prep_save(getattr(obj, field.attname),
+                                       connection)
+                for obj in by_key.values() for field in fields
+            ]
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                rows = cursor.fetchall()
+            for pk, *key in rows:
+                obj = by_key[tuple(key)]
+                obj.pk = pk
+                obj._state.adding = False
+                obj._state.db = self.db
+                created.append(obj)
+        if created:
+            relations_created.send(sender=self.model, instances=created)
+        return created
+
+    def remove(self):
+        """Удаляет строки одним DELETE и отправляет relations_deleted.
+
+        post_delete не отправляется: его receivers обновили бы списки
+        покупок и версии построчно, а relations_deleted делает то же
+        пакетно. Сигнал и результат содержат только строки, которые
+        удалил этот вызов: если параллельный запрос успел удалить строку
+        раньше, её удаление уже учтено им.
+        """
+        instances = list(self)
+        if instances:
+            deleted = set(self.delete_without_signals(
+                [instance.pk for instance in instances]
+            ))
+            instances = [
+                instance for instance in instances if instance.pk in deleted
+            ]
+        if instances:
+            relations_deleted.send(sender=self.model, instances=instances)
+        return instances
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -20,10 +106,24 @@ class Follow(models.Model):
         verbose_name='Блогер'
     )
 
+    objects = UserRelationQuerySet.as_manager()
+
     class Meta:
         ordering = ['user']
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'following'),
+                name='unique_follow'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=('following', 'user'),
+                name='follow_following_user_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username} follows {self.following.username}"
@@ -43,10 +143,24 @@ class Favorite(models.Model):
         verbose_name='Повар'
     )
 
+    objects = UserRelationQuerySet.as_manager()
+
     class Meta:
         ordering = ['user']
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранное'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_favorite'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=('recipe', 'user'),
+                name='favorite_recipe_user_idx'
+            ),
+        ]
 
     def __str__(self):
         return (f"{self.user.username} add to "
@@ -67,11 +181,137 @@ class ShoppingCart(models.Model):
         verbose_name='Покупатель'
     )
 
+    objects = UserRelationQuerySet.as_manager()
+
     class Meta:
         ordering = ['user']
         verbose_name = 'Покупки'
         verbose_name_plural = 'Покупки'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_shopping_cart'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=('recipe', 'user'),
+                name='shoppingcart_recipe_user_idx'
+            ),
+        ]
 
     def __str__(self):
         return (f"{self.user.username} add to "
                 f"shopping cart {self.recipe.name} recipe")
+
+
+class ShoppingListQuerySet(models.QuerySet):
+
+    def expected(self, users=None):
+        """Итоги списка покупок, посчитанные заново по корзинам.
+
+        users (id или подзапрос) ограничивает пересчёт этими покупателями.
+        """
+        filters = {'recipe__is_in_shopping_cart__isnull': False}
+        if users is not None:
+            filters['recipe__is_in_shopping_cart__user__in'] = users
+        return IngredientsInRecipe.objects.filter(**filters).values_list(
+            'recipe__is_in_shopping_cart__user', 'ingredient'
+        ).annotate(total=Sum('amount')).order_by()
+
+    def add_amounts(self, user_ids, amounts):
+        """Прибавляет amounts ({ingredient_id: delta}) к спискам user_ids.
+
+        Положительные дельты пишутся одним INSERT ... ON CONFLICT DO
+        UPDATE, поэтому параллельные добавления одного ингредиента не
+        падают на уникальном ограничении. Отрицательные уменьшают
+        количество (не ниже нуля), строки с нулевым остатком удаляются.
+        """
+        amounts = {
+            ingredient_id: delta
+            for ingredient_id, delta in amounts.items() if delta
+        }
+        if not amounts:
+            return
+        user_ids = sorted(set(user_ids))
+        if not user_ids:
+            return
+        added = [
+            (user_id, ingredient_id, delta)
+            for user_id in user_ids
+            for ingredient_id, delta in sorted(amounts.items()) if delta > 0
+        ]
+        removed = {
+            ingredient_id: -delta
+            for ingredient_id, delta in amounts.items() if delta < 0
+        }
+        with transaction.atomic(using=self.db):
+            for start in range(0, len(added), INSERT_BATCH_SIZE):
+                self.upsert_amounts(added[start:start + INSERT_BATCH_SIZE])
+            if removed:
+                items = self.filter(
+                    user_id__in=user_ids, ingredient_id__in=removed
+                )
+                items.update(amount=Greatest(
+                    F('amount') - Case(*(
+                        When(ingredient_id=ingredient_id, then=Value(amount))
+                        for ingredient_id, amount in removed.items()
+                    )),
+                    Value(0)
+                ))
+                items.filter(amount__lte=0).delete()
+
+    def upsert_amounts(self, rows):
+        """INSERT ... ON CONFLICT (user, ingredient) DO UPDATE для строк
+        (user_id, ingredient_id, delta) с положительной дельтой."""
+        meta = self.model._meta
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        table = quote(meta.db_table)
+        user, ingredient, amount = (
+            quote(meta.get_field(name).column)
+            for name in ('user', 'ingredient', 'amount')
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({user}, {ingredient}, {amount}) '
+                f'VALUES {", ".join(["(%s, %s, %s)"] * len(rows))} '
+                f'ON CONFLICT ({user}, {ingredient}) DO UPDATE '
+                f'SET {amount} = {table}.{amount} + EXCLUDED.{amount}',
+                [value for row in rows for value in row]
+            )
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Покупатель'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Общее количество'
+    )
+
+    objects = ShoppingListQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['user']
+        verbose_name = 'Список покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item'
+            ),
+        ]
+
+    def __str__(self):
+        return (f"{self.user.username} needs {self.amount} "
+                f"of {self.ingredient.name}")
@@ -0,0 +1,105 @@
+from collections import Counter, defaultdict
+
+from django.db.models import Sum
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.models import IngredientsInRecipe, ModelVersion
+
+from .models import (Favorite, Follow, ShoppingCart, ShoppingListItem,
+                     relations_created, relations_deleted)
+
+
+def update_shopping_lists(carts, sign):
+    """Учитывает в списках покупок добавленные (sign=1) или удалённые
+    (sign=-1) строки корзины."""
+    amounts = defaultdict(dict)
+    for recipe_id, ingredient_id, total in IngredientsInRecipe.objects.filter(
+        recipe_id__in={cart.recipe_id for cart in carts}
+    ).values_list('recipe_id', 'ingredient').annotate(
+        total=Sum('amount')
+    ).order_by():
+        amounts[recipe_id][ingredient_id] = sign * total
+    deltas = defaultdict(Counter)
+    for cart in carts:
+        deltas[cart.user_id].update(amounts[cart.recipe_id])
+    for user_id, user_deltas in deltas.items():
+        ShoppingListItem.objects.add_amounts([user_id], user_deltas)
+
+
+def cart_user_ids(recipe_id):
+    return ShoppingCart.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('user_id', flat=True)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_recipe_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        update_shopping_lists([instance], 1)
+
+
+@receiver(relations_created, sender=ShoppingCart)
+def add_recipes_to_shopping_list(sender, instances, **kwargs):
+    update_shopping_lists(instances, 1)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def remove_recipe_from_shopping_list(sender, instance, **kwargs):
+    update_shopping_lists([instance], -1)
+
+
+@receiver(relations_deleted, sender=ShoppingCart)
+def remove_recipes_from_shopping_list(sender, instances, **kwargs):
+    update_shopping_lists(instances, -1)
+
+
+@receiver(pre_save, sender=IngredientsInRecipe)
+def remember_ingredient_in_recipe(sender, instance, **kwargs):
+    instance.previous = None
+    if instance.pk is not None:
+        instance.previous = sender.objects.filter(
+            pk=instance.pk
+        ).values_list('ingredient_id', 'amount').first()
+
+
+@receiver(post_save, sender=IngredientsInRecipe)
+def update_shopping_lists_on_save(sender, instance, **kwargs):
+    amounts = {instance.ingredient_id: instance.amount}
+    previous = getattr(instance, 'previous', None)
+    if previous is not None:
+        ingredient_id, amount = previous
+        amounts[ingredient_id] = amounts.get(ingredient_id, 0) - amount
+    ShoppingListItem.objects.add_amounts(
+        cart_user_ids(instance.recipe_id), amounts
+    )
+
+
+@receiver(post_delete, sender=IngredientsInRecipe)
+def update_shopping_lists_on_delete(sender, instance, **kwargs):
+    ShoppingListItem.objects.add_amounts(
+        cart_user_ids(instance.recipe_id),
+        {instance.ingredient_id: -instance.amount}
+    )
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def bump_user_version(sender, instance, **kwargs):
+    ModelVersion.objects.bump(ModelVersion.user_key(instance.user_id))
+
+
+@receiver(relations_created, sender=Favorite)
+@receiver(relations_deleted, sender=Favorite)
+@receiver(relations_created, sender=ShoppingCart)
+@receiver(relations_deleted, sender=ShoppingCart)
+@receiver(relations_created, sender=Follow)
+@receiver(relations_deleted, sender=Follow)
+def bump_user_versions(sender, instances, **kwargs):
+    ModelVersion.objects.bump(*{
+        ModelVersion.user_key(instance.user_id) for instance in instances
+    })
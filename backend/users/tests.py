@@ -0,0 +1,287 @@
+from unittest import mock
+
+from django.db import IntegrityError, transaction
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, IngredientsInRecipe, Recipe
+from users import models
+from users.models import (Favorite, Follow, ShoppingCart, ShoppingListItem,
+                          User, relations_created)
+
+
+class ShoppingListTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author', email='author@example.com'
+        )
+        cls.buyers = [
+            User.objects.create(username=name, email=f'{name}@example.com')
+            for name in ('anna', 'boris')
+        ]
+        cls.ingredients = list(Ingredient.objects.order_by('id')[:4])
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {i}', text='Текст',
+                cooking_time=10
+            ) for i in range(3)
+        ]
+        first, second, third, fourth = cls.ingredients
+        IngredientsInRecipe.objects.bulk_create([
+            IngredientsInRecipe(
+                recipe=cls.recipes[0], ingredient=first, amount=100
+            ),
+            IngredientsInRecipe(
+                recipe=cls.recipes[0], ingredient=second, amount=2
+            ),
+            IngredientsInRecipe(
+                recipe=cls.recipes[1], ingredient=first, amount=50
+            ),
+            IngredientsInRecipe(
+                recipe=cls.recipes[1], ingredient=third, amount=7
+            ),
+            IngredientsInRecipe(
+                recipe=cls.recipes[2], ingredient=fourth, amount=1
+            ),
+        ])
+
+    def assertShoppingListsConsistent(self):
+        self.assertEqual(
+            sorted(ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            )),
+            sorted(ShoppingListItem.objects.expected())
+        )
+
+    def shopping_list(self, user):
+        return dict(user.shopping_list.values_list('ingredient_id', 'amount'))
+
+
+class ShoppingCartRemoveTest(ShoppingListTestCase):
+
+    def test_row_removed_concurrently_is_subtracted_once(self):
+        buyer = self.buyers[0]
+        ShoppingCart.objects.insert_ignore([
+            ShoppingCart(user=buyer, recipe=recipe)
+            for recipe in self.recipes[:2]
+        ])
+        stale = ShoppingCart.objects.filter(
+            user=buyer, recipe=self.recipes[0]
+        )
+        # Обе «параллельные» выборки прочитали строку до удаления.
+        self.assertEqual(len(stale), 1)
+        removed = ShoppingCart.objects.filter(
+            user=buyer, recipe=self.recipes[0]
+        ).remove()
+        self.assertEqual(len(removed), 1)
+        self.assertEqual(stale.remove(), [])
+        self.assertShoppingListsConsistent()
+        first, _, third, _ = self.ingredients
+        self.assertEqual(
+            self.shopping_list(buyer), {first.id: 50, third.id: 7}
+        )
+
+    def test_second_delete_is_not_found(self):
+        buyer = self.buyers[0]
+        ShoppingCart.objects.insert_ignore([
+            ShoppingCart(user=buyer, recipe=recipe)
+            for recipe in self.recipes[:2]
+        ])
+        client = APIClient()
+        client.force_authenticate(buyer)
+        url = f'/api/recipes/{self.recipes[0].id}/shopping_cart/'
+        self.assertEqual(client.delete(url).status_code, 204)
+        self.assertEqual(client.delete(url).status_code, 404)
+        self.assertShoppingListsConsistent()
+
+
+class ShoppingListMaintenanceTest(ShoppingListTestCase):
+    """После каждого изменения ShoppingListItem совпадает с expected()."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyers[0])
+
+    def fill_carts(self):
+        ShoppingCart.objects.insert_ignore([
+            ShoppingCart(user=buyer, recipe=recipe)
+            for buyer in self.buyers for recipe in self.recipes[:2]
+        ])
+
+    def test_cart_add_and_remove(self):
+        first, second, third, _ = self.ingredients
+        url = f'/api/recipes/{self.recipes[0].id}/shopping_cart/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertShoppingListsConsistent()
+        self.assertEqual(
+            self.shopping_list(self.buyers[0]), {first.id: 100, second.id: 2}
+        )
+        self.client.post(f'/api/recipes/{self.recipes[1].id}/shopping_cart/')
+        self.assertShoppingListsConsistent()
+        self.assertEqual(self.shopping_list(self.buyers[0]), {
+            first.id: 150, second.id: 2, third.id: 7
+        })
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertShoppingListsConsistent()
+        self.assertEqual(
+            self.shopping_list(self.buyers[0]), {first.id: 50, third.id: 7}
+        )
+
+    def test_batch_add_and_remove(self):
+        recipe_ids = [recipe.id for recipe in self.recipes]
+        response = self.client.post(
+            '/api/recipes/shopping_cart/', {'recipes': recipe_ids},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertShoppingListsConsistent()
+        response = self.client.delete(
+            '/api/recipes/shopping_cart/', {'recipes': recipe_ids[:2]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertShoppingListsConsistent()
+        self.assertEqual(
+            self.shopping_list(self.buyers[0]), {self.ingredients[3].id: 1}
+        )
+
+    def test_recipe_patch_applies_deltas(self):
+        self.fill_carts()
+        first, second, _, fourth = self.ingredients
+        self.client.force_authenticate(self.author)
+        response = self.client.patch(
+            f'/api/recipes/{self.recipes[0].id}/',
+            {'ingredients': [
+                {'id': first.id, 'amount': 30},
+                {'id': fourth.id, 'amount': 4},
+            ]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertShoppingListsConsistent()
+        for buyer in self.buyers:
+            self.assertEqual(self.shopping_list(buyer), {
+                first.id: 80, self.ingredients[2].id: 7, fourth.id: 4
+            })
+        self.assertNotIn(second.id, self.shopping_list(self.buyers[0]))
+
+    def test_ingredient_rows_saved_and_deleted(self):
+        self.fill_carts()
+        first, second, third, fourth = self.ingredients
+        row = IngredientsInRecipe.objects.get(
+            recipe=self.recipes[0], ingredient=first
+        )
+        row.amount = 10
+        row.save()
+        self.assertShoppingListsConsistent()
+        row.ingredient = fourth
+        row.save()
+        self.assertShoppingListsConsistent()
+        IngredientsInRecipe.objects.create(
+            recipe=self.recipes[1], ingredient=second, amount=3
+        )
+        self.assertShoppingListsConsistent()
+        row.delete()
+        self.assertShoppingListsConsistent()
+        self.assertEqual(self.shopping_list(self.buyers[1]), {
+            first.id: 50, second.id: 5, third.id: 7
+        })
+
+    def test_recipe_delete_cascades(self):
+        self.fill_carts()
+        self.recipes[0].delete()
+        self.assertShoppingListsConsistent()
+        first, _, third, _ = self.ingredients
+        self.assertEqual(
+            self.shopping_list(self.buyers[0]), {first.id: 50, third.id: 7}
+        )
+
+    def test_user_delete_cascades(self):
+        self.fill_carts()
+        self.buyers[0].delete()
+        self.assertShoppingListsConsistent()
+        self.author.delete()
+        self.assertShoppingListsConsistent()
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+    def test_amount_is_clamped_at_zero(self):
+        self.fill_carts()
+        buyer = self.buyers[0]
+        first, second, _, fourth = self.ingredients
+        ShoppingListItem.objects.add_amounts([buyer.id], {
+            first.id: -1000, second.id: -1, fourth.id: -5
+        })
+        self.assertEqual(self.shopping_list(buyer), {
+            second.id: 1, self.ingredients[2].id: 7
+        })
+        self.assertEqual(
+            self.shopping_list(self.buyers[1]),
+            {first.id: 150, second.id: 2, self.ingredients[2].id: 7}
+        )
+
+
+class InsertIgnoreTest(ShoppingListTestCase):
+
+    def test_only_new_rows_are_returned_and_signalled(self):
+        buyer = self.buyers[0]
+        signalled = []
+
+        def receiver(sender, instances, **kwargs):
+            signalled.extend(instances)
+
+        relations_created.connect(receiver, sender=Favorite)
+        self.addCleanup(
+            relations_created.disconnect, receiver, sender=Favorite
+        )
+        Favorite.objects.insert_ignore([
+            Favorite(user=buyer, recipe=self.recipes[0])
+        ])
+        signalled.clear()
+        with mock.patch.object(models, 'INSERT_BATCH_SIZE', 2):
+            created = Favorite.objects.insert_ignore(
+                Favorite(user=buyer, recipe=recipe)
+                for recipe in [*self.recipes, self.recipes[1]]
+            )
+        self.assertEqual(
+            [favorite.recipe_id for favorite in created],
+            [self.recipes[1].id, self.recipes[2].id]
+        )
+        self.assertEqual(signalled, created)
+        for favorite in created:
+            self.assertIsNotNone(favorite.pk)
+            self.assertFalse(favorite._state.adding)
+        self.assertEqual(Favorite.objects.filter(user=buyer).count(), 3)
+
+    def test_duplicates_violate_constraints(self):
+        buyer = self.buyers[0]
+        for model, field, value in (
+            (Favorite, 'recipe', self.recipes[0]),
+            (ShoppingCart, 'recipe', self.recipes[0]),
+            (Follow, 'following', self.author),
+        ):
+            with self.subTest(model=model.__name__):
+                model.objects.create(user=buyer, **{field: value})
+                with self.assertRaises(IntegrityError):
+                    with transaction.atomic():
+                        model.objects.create(user=buyer, **{field: value})
+
+    def test_repeated_requests_are_idempotent(self):
+        client = APIClient()
+        client.force_authenticate(self.buyers[0])
+        for url in (
+            f'/api/recipes/{self.recipes[0].id}/favorite/',
+            f'/api/recipes/{self.recipes[0].id}/shopping_cart/',
+            f'/api/users/{self.author.id}/subscribe/',
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(client.post(url).status_code, 201)
+                self.assertEqual(client.post(url).status_code, 201)
+        self.assertEqual(Favorite.objects.count(), 1)
+        self.assertEqual(ShoppingCart.objects.count(), 1)
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertShoppingListsConsistent()
+        response = client.post(f'/api/users/{self.buyers[0].id}/subscribe/')
+        self.assertEqual(response.status_code, 400)